@@ -0,0 +1,111 @@
+import asyncio
+import html
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from telegram.error import RetryAfter, NetworkError
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+
+
+class AdminNotifier:
+    """Сводные уведомления администратору о новых пожеланиях.
+
+    Пожелания копятся в течение окна window секунд и уходят одним
+    сообщением-дайджестом. Очередь ограничена max_pending записями: при
+    переполнении самые старые отбрасываются, а их количество указывается в
+    дайджесте. При ошибках отправки дайджест повторяется с учетом retry_after.
+    """
+
+    def __init__(self, chat_id: int, window: float = 60, max_pending: int = 200, max_retries: int = 5):
+        self.chat_id = chat_id
+        self.window = window
+        self.max_retries = max_retries
+        
+        self._pending = deque(maxlen=max_pending)
+        self._dropped = 0
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    def add(self, bot, user, suggestion_text: str):
+        """Добавляет пожелание в ближайший дайджест, не отправляя сообщение сразу"""
+        self._bot = bot
+        
+        if len(self._pending) == self._pending.maxlen:
+            self._dropped += 1
+        self._pending.append((datetime.now(), user.first_name, user.id, user.username, suggestion_text))
+        
+        # Первое пожелание в окне запускает отложенную отправку дайджеста
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    def _build_digest(self, entries, dropped: int) -> str:
+        header = f"🔔 <b>НОВЫЕ ПРЕДЛОЖЕНИЯ ОТ ПОЛЬЗОВАТЕЛЕЙ: {len(entries) + dropped}</b>\n\n"
+        footer = "<i>Для просмотра всех пожеланий используйте команду /viewsuggestions в боте</i>"
+        
+        text = header
+        shown = 0
+        for created_at, first_name, user_id, username, suggestion_text in entries:
+            if len(suggestion_text) > 500:
+                suggestion_text = suggestion_text[:500] + "..."
+            item = (
+                f"<b>{created_at.strftime('%H:%M:%S')} {html.escape(first_name or '')}</b> "
+                f"(ID: {user_id}, @{html.escape(username) if username else 'не указан'})\n"
+                f"{html.escape(suggestion_text)}\n\n"
+            )
+            # Оставляем место под хвост и строку "и еще N"
+            if len(text) + len(item) + len(footer) + 100 > MESSAGE_LIMIT:
+                break
+            text += item
+            shown += 1
+        
+        hidden = len(entries) - shown + dropped
+        if hidden:
+            text += f"<i>...и еще {hidden} предложений</i>\n\n"
+        return text + footer
+
+    async def flush(self):
+        """Отправляет накопленные пожелания одним сообщением"""
+        async with self._send_lock:
+            if not self._pending or self._bot is None:
+                return
+            
+            entries = list(self._pending)
+            dropped = self._dropped
+            self._pending.clear()
+            self._dropped = 0
+            
+            text = self._build_digest(entries, dropped)
+            
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    await self._bot.send_message(chat_id=self.chat_id, text=text, parse_mode='HTML')
+                    return
+                except RetryAfter as e:
+                    logger.warning(f"Дайджест администратору: лимит Telegram, повтор через {e.retry_after} с")
+                    await asyncio.sleep(e.retry_after)
+                except NetworkError as e:
+                    logger.warning(f"Дайджест администратору: ошибка сети ({e}), попытка {attempt}/{self.max_retries}")
+                    await asyncio.sleep(min(2 ** attempt, 60))
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке дайджеста администратору: {e}")
+                    break
+            
+            # Не удалось отправить: возвращаем пожелания в очередь к следующему окну
+            for entry in reversed(entries):
+                if len(self._pending) == self._pending.maxlen:
+                    self._dropped += 1
+                    continue
+                self._pending.appendleft(entry)
+            self._dropped += dropped
+            if self._task is None or self._task.done() or self._task is asyncio.current_task():
+                self._task = asyncio.get_running_loop().create_task(self._flush_after_window())
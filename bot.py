@@ -1,16 +1,40 @@
 import requests
 import logging
+import html
 import asyncio
 import json
-import sqlite3
 import os
 import threading
 import time
+import secrets
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from config import BOT_TOKEN, ADMIN_CHAT_ID
+from typing import List, Optional, Tuple
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, InvalidToken
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.request import HTTPXRequest
+from config import BOT_TOKEN, ADMIN_CHAT_ID, ADMIN_DIGEST_WINDOW, SEARCH_RATE_LIMIT, DOCUMENT_RATE_LIMIT, ADMIN_RATE_LIMIT, CLICK_BOOST_REFRESH_INTERVAL, \
+    TELEGRAM_API_URL, BOT_MODE, BOT_WORKERS, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, SHUTDOWN_TIMEOUT, \
+    RESTART_BACKOFF_BASE, RESTART_BACKOFF_MAX, CRASH_BUDGET, CRASH_BUDGET_WINDOW, UPDATE_CONCURRENCY
 from database import db
+from catalogue import render_card
+from catalogue_artifact import CATALOGUE_ARTIFACT, PROCESSES_FILE, SYNONYMS_FILE, build_artifact, read_process_rows, source_fingerprint
+from write_behind import suggestion_writer
+from search_analytics import search_analytics
+from persistence import user_state_persistence
+from click_boosts import ClickBoostRefresher
+from admin_notifications import AdminNotifier
+from rate_limit import RateLimiter
+from outbound import OutboundRateLimiter
+from update_processor import ChatOrderedUpdateProcessor
+from text_normalizer import normalize_process_id, tokenize
+from metrics import registry, timed_handler, start_metrics_server, register_endpoint, telegram_api_duration, telegram_api_errors, METRICS_PORT
+from profiler import profiler, MODES, MODE_SAMPLE, MAX_SECONDS
+from sharding import SuggestionForwarder, WebhookIngress
+from shutdown import GracefulShutdown, drain_application, terminate_process
+from supervisor import Supervisor
+from process_pages import ProcessPages, deep_link_payload, parse_deep_link_payload
+import signal
 import subprocess
 import sys
 
@@ -24,8 +48,87 @@ logger = logging.getLogger(__name__)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
 # Глобальная переменная для отслеживания состояния
-bot_restart_count = 0
-MAX_RESTARTS = 10
+# Супервизор цикла бота (создается при запуске)
+bot_supervisor: Optional[Supervisor] = None
+
+# Запрос на остановку по SIGTERM/SIGINT и срок на нее
+shutdown = GracefulShutdown(SHUTDOWN_TIMEOUT)
+
+# Процесс health server (останавливается вместе с ботом)
+health_process: Optional[subprocess.Popen] = None
+
+# Количество пожеланий на одной странице в /viewsuggestions
+SUGGESTIONS_PAGE_SIZE = 10
+
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+def fit_blocks(header: str, blocks: List[str], footer: str = '', limit: int = MESSAGE_LIMIT) -> Tuple[str, int]:
+    """Собирает сообщение из целых блоков, пока оно укладывается в limit.
+
+    Блок входит целиком или не входит совсем, поэтому HTML-теги и сущности не
+    разрываются. Возвращает текст и число вошедших блоков.
+    """
+    text = header
+    count = 0
+    for block in blocks:
+        if len(text) + len(block) + len(footer) > limit:
+            break
+        text += block
+        count += 1
+    return text + footer, count
+
+# Пожелания уходят администратору сводкой раз в окно, а не отдельным сообщением на каждое
+admin_notifier = AdminNotifier(ADMIN_CHAT_ID, ADMIN_DIGEST_WINDOW)
+
+# Периодический пересчет прибавок к поиску по журналу нажатий
+click_boost_refresher = ClickBoostRefresher(db, CLICK_BOOST_REFRESH_INTERVAL)
+
+# Схемы отдельных процессов (выдержки из общего PDF) и file_id уже отправленных выдержек
+process_pages = ProcessPages(db)
+
+# Отдельные бюджеты на поиск, отправку документов и служебные команды для каждого пользователя в чате
+rate_limiter = RateLimiter({
+    'search': SEARCH_RATE_LIMIT,
+    'document': DOCUMENT_RATE_LIMIT,
+    'admin': ADMIN_RATE_LIMIT,
+})
+
+# Готовые ответы при превышении лимита (без обращения к базе и файлам)
+THROTTLE_MESSAGES = {
+    'search': "⏳ Слишком много запросов подряд. Подождите несколько секунд и повторите поиск.",
+    'document': "⏳ Файл уже отправлялся недавно. Повторная отправка будет доступна через минуту.",
+    'admin': "⏳ Слишком много служебных команд подряд. Подождите немного.",
+}
+
+# Профилирование по команде /profile: длительность по умолчанию, группа счетчика обновлений
+# (раньше всех обработчиков) и предел для HTTP-эндпоинта, который держит запрос открытым
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_HANDLER_GROUP = -100
+PROFILE_HTTP_MAX_SECONDS = 60
+profile_timer: Optional[asyncio.Task] = None
+PROFILE_USAGE = (
+    "🔬 <b>Профилирование</b>\n\n"
+    "/profile 30 - сэмплирование на 30 секунд\n"
+    "/profile 200u - на 200 обновлений\n"
+    "/profile 30 cprofile - детерминированный cProfile (замедляет бота)\n"
+    "/profile stop - остановить досрочно"
+)
+
+# Кнопки, нажатие которых тратит бюджет соответствующей категории
+CALLBACK_RATE_CATEGORIES = {
+    'get_pdf': 'document',
+    'get_guide': 'document',
+}
+
+def _stem_cache_stats():
+    info = db.stemmer.cache_info()
+    return {('hit',): info.hits, ('miss',): info.misses}
+
+registry.gauge_callback('bot_stem_cache_requests_total', 'Обращения к кэшу стеммера', _stem_cache_stats, ['result'], kind='counter')
+registry.gauge_callback('bot_suggestion_queue_depth', 'Пожелания, ожидающие записи в базу', lambda: {(): suggestion_writer.qsize()})
+registry.gauge_callback('bot_search_events_queue_depth', 'Поисковые события, ожидающие записи в базу', lambda: {(): search_analytics.writer.qsize()})
+registry.gauge_callback('bot_user_state_queue_depth', 'Состояния пользователей, ожидающие записи в базу', lambda: {(): user_state_persistence.writer.qsize()})
 
 def get_file_path(filename):
     return os.path.join(current_dir, filename)
@@ -36,51 +139,32 @@ def init_database():
         # Создаем папку data если её нет
         os.makedirs('data', exist_ok=True)
         
-        # Всегда пересоздаем базу из JSON
+        json_path = get_file_path(PROCESSES_FILE)
+        synonyms_path = get_file_path(SYNONYMS_FILE)
+        artifact_path = get_file_path(CATALOGUE_ARTIFACT)
+        
+        # Скомпилированный артефакт загружается сразу, без разбора JSON; таблица processes
+        # перезаписывается из артефакта, только если собрана из других исходников
+        if db.load_catalogue_artifact(artifact_path, json_path):
+            print(f"✅ Каталог загружен из артефакта {artifact_path}: {len(db.get_all_processes())} процессов")
+            return
+        
+        # Иначе пересоздаем базу из JSON
         print("📂 Инициализация базы данных из JSON...")
         
-        json_path = get_file_path('data/processes.json')
         if not os.path.exists(json_path):
             print(f"❌ Файл {json_path} не найден")
             return
 
-        with open(json_path, 'r', encoding='utf-8') as f:
-            processes_data = json.load(f)
+        process_rows = read_process_rows(json_path)
+        db.replace_processes(process_rows, source_fingerprint(json_path, synonyms_path, db.stemmer.name))
         
-        conn = sqlite3.connect('data/processes.db')
-        cursor = conn.cursor()
-        
-        # Создаем таблицу если не существует
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS processes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                process_id TEXT UNIQUE NOT NULL,
-                process_name TEXT NOT NULL,
-                description TEXT,
-                keywords TEXT
-            )
-        ''')
-        
-        # Очищаем и заполняем заново
-        cursor.execute('DELETE FROM processes')
-        
-        for process in processes_data:
-            process_id = process.get('process_id', '')
-            process_name = process.get('process_name', '')
-            description = process.get('description', 'Описание отсутствует')
-            keywords = process.get('keywords', '')
-            
-            if not description:
-                description = 'Описание отсутствует'
-            
-            cursor.execute('''
-                INSERT INTO processes (process_id, process_name, description, keywords)
-                VALUES (?, ?, ?, ?)
-            ''', (process_id, process_name, description, keywords))
+        # Перестраиваем индекс процессов в памяти под новые данные
+        db.reload_index()
+        print(f"✅ База данных инициализирована. Добавлено {len(process_rows)} процессов")
         
-        conn.commit()
-        conn.close()
-        print(f"✅ База данных инициализирована. Добавлено {len(processes_data)} процессов")
+        # Собираем артефакт, чтобы следующий перезапуск не разбирал JSON заново
+        build_artifact(json_path, synonyms_path, artifact_path, db.stemmer)
         
     except Exception as e:
         print(f"❌ Ошибка при инициализации базы: {e}")
@@ -89,6 +173,9 @@ def init_database():
 
 def start_health_server():
     """Запускает health server в отдельном процессе"""
+    global health_process
+    # Предыдущий экземпляр (после перезапуска бота) занимает тот же порт
+    terminate_process(health_process)
     try:
         health_process = subprocess.Popen([
             sys.executable, 
@@ -108,29 +195,39 @@ def keep_alive_ping():
     time.sleep(10)
     
     ping_count = 0
+    attempt = 0
+    crash_loop_reported = False
     while True:
         try:
             endpoints = ['/health', '/status', '/']
-            endpoint = endpoints[ping_count % len(endpoints)]
+            # Эндпоинты чередуются при любом ответе, иначе неудачный /health пинговался бы бесконечно
+            endpoint = endpoints[attempt % len(endpoints)]
+            attempt += 1
             
             response = requests.get(f"http://localhost:{port}{endpoint}", timeout=10)
-            if response.status_code == 200:
+            if response.status_code == 200 or (endpoint == '/health' and response.status_code == 503):
+                # 503 от /health - health server жив, а цикл бота зациклен на падениях (об этом пишет супервизор)
+                if endpoint == '/health':
+                    crash_loop = response.status_code == 503
+                    if crash_loop and not crash_loop_reported:
+                        print("⚠️ Keep-alive: /health сообщает о зацикливании бота на падениях")
+                    crash_loop_reported = crash_loop
                 ping_count += 1
                 current_time = datetime.now().strftime('%H:%M:%S')
                 if ping_count % 10 == 0:  # Логируем каждые 10 пингов
                     print(f"✅ Keep-alive ping #{ping_count} to {endpoint} at {current_time}")
             else:
-                print(f"⚠️ Keep-alive ping failed: {response.status_code}")
+                print(f"⚠️ Keep-alive ping failed: {endpoint} {response.status_code}")
         except Exception as e:
             print(f"❌ Keep-alive ping error: {e}")
             
+            if shutdown.requested:
+                return
+            
             # Попытка перезапустить health server
             try:
                 print("🔄 Attempting to restart health server...")
-                subprocess.Popen([
-                    sys.executable, 
-                    os.path.join(current_dir, 'health_server.py')
-                ])
+                start_health_server()
                 time.sleep(5)
             except Exception as restart_error:
                 print(f"🚨 Failed to restart health server: {restart_error}")
@@ -144,9 +241,58 @@ def start_keep_alive():
     thread.start()
     print("🔄 Active keep-alive thread started")
 
-def create_application():
-    """Создает и настраивает приложение бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTP-клиент Bot API, который пишет длительность и ошибки каждого метода в метрики"""
+    
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            telegram_api_errors.inc(api_method)
+            raise
+        finally:
+            telegram_api_duration.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            telegram_api_errors.inc(api_method)
+        return code, payload
+
+async def is_throttled(update: Update, category: str) -> bool:
+    """Проверяет лимит пользователя; при превышении один раз за эпизод отвечает коротким сообщением"""
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return False
+    
+    allowed, notify = rate_limiter.check(category, user.id, chat.id)
+    if allowed:
+        return False
+    
+    logger.info(f"Лимит '{category}' превышен пользователем {user.id}")
+    if notify and update.message:
+        await update.message.reply_text(THROTTLE_MESSAGES[category])
+    return True
+
+def create_application(polling: bool = True, api_url: Optional[str] = TELEGRAM_API_URL):
+    """Создает и настраивает приложение бота (polling=False - без опроса, обновления подаются извне)"""
+    # Долгий опрос getUpdates идет отдельным клиентом и в метрики задержек не попадает
+    # Все исходящие запросы проходят через общий ограничитель под лимиты Telegram
+    # Состояние диалогов (context.user_data) сохраняется в SQLite и переживает перезапуск
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(InstrumentedHTTPXRequest(connection_pool_size=256))
+        .rate_limiter(OutboundRateLimiter())
+        .persistence(user_state_persistence)
+        # Чаты обрабатываются параллельно: ожидание лимита одного чата не задерживает ответы другим
+        .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+    )
+    if api_url:
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    if not polling:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Добавляем обработчики
     application.add_handler(CommandHandler("start", start))
@@ -158,6 +304,9 @@ def create_application():
     application.add_handler(CommandHandler("test", send_test))
     application.add_handler(CommandHandler("suggestion", suggestion_command))
     application.add_handler(CommandHandler("viewsuggestions", view_suggestions_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("zeroresults", zero_results_command))
+    application.add_handler(CommandHandler("profile", profile_command))
     application.add_handler(CommandHandler("debug", debug_processes))
     application.add_handler(CommandHandler("debug_search", debug_search))
     application.add_handler(CommandHandler("check", check_process))
@@ -166,96 +315,228 @@ def create_application():
     
     return application
 
+def register_application_gauges(application):
+    """Метрики очередей приложения (регистрируются заново при каждом запуске)"""
+    registry.gauge_callback('bot_update_queue_depth', 'Апдейты, ожидающие обработки', lambda: {(): application.update_queue.qsize()})
+    registry.gauge_callback(
+        'bot_outbound_waiting', 'Исходящие запросы, ожидающие лимита Telegram',
+        lambda: {(priority,): count for priority, count in application.bot.rate_limiter.waiting().items()},
+        ['priority'])
+
 async def run_bot_single():
     """Запускает бота один раз с правильной обработкой event loop"""
     try:
         print("🤖 Starting Telegram bot...")
         application = create_application()
+        register_application_gauges(application)
         
-        # Запускаем бота с правильной обработкой сигналов
+        # Фоновая запись пожеланий (заодно восстанавливает их из журнала после сбоя)
+        suggestion_writer.start()
+        search_analytics.start()
+        click_boost_refresher.start()
+        
+        # SIGTERM/SIGINT только отмечают запрос на остановку, сама остановка идет ниже по шагам
+        shutdown.install()
         await application.initialize()
         await application.start()
         await application.updater.start_polling()
         
         print("✅ Bot is running and polling...")
         
-        # Бесконечный цикл для поддержания работы
-        while True:
-            await asyncio.sleep(1)
+        await shutdown.wait()
             
     except Exception as e:
         print(f"🔴 Bot error: {e}")
         raise
     finally:
         try:
-            # Корректное завершение
+            # Корректное завершение: сначала прекращаем прием обновлений,
+            # затем дорабатываем полученные и исходящие отправки в пределах срока
             if 'application' in locals():
-                await application.updater.stop()
-                await application.stop()
-                await application.shutdown()
+                if application.updater.running:
+                    await application.updater.stop()
+                drained = not application.running or await drain_application(application, shutdown.remaining())
+                if drained:
+                    # Отправляем администратору недоотправленный дайджест пожеланий
+                    await asyncio.wait_for(admin_notifier.flush(), max(shutdown.remaining(), 1.0))
+                    await application.shutdown()
         except Exception as e:
             print(f"⚠️ Cleanup error: {e}")
+        
+        # Записываем пожелания, поисковые события и состояния пользователей, оставшиеся в очереди
+        # (stop, а не flush: не ждем окончания окна накопления пачки; при перезапуске потоки стартуют снова)
+        await asyncio.to_thread(suggestion_writer.stop)
+        await asyncio.to_thread(search_analytics.stop)
+        await asyncio.to_thread(user_state_persistence.writer.stop)
+        click_boost_refresher.stop()
+        shutdown.uninstall()
 
-def run_bot_with_restart():
-    """Запускает бота с механизмом перезапуска"""
-    global bot_restart_count
+async def run_worker_single(worker_id: int, update_queue):
+    """Рабочий процесс: обрабатывает обновления своей доли чатов, полученные от приемника вебхука"""
+    application = create_application(polling=False)
+    register_application_gauges(application)
+    search_analytics.start()
+    click_boost_refresher.start()
+    
+    await application.initialize()
+    await application.start()
+    print(f"✅ Рабочий процесс #{worker_id} готов к обработке обновлений")
     
-    while bot_restart_count < MAX_RESTARTS:
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            update_data = await loop.run_in_executor(None, update_queue.get)
+            if update_data is None:
+                break
+            await application.update_queue.put(Update.de_json(update_data, application.bot))
+    finally:
         try:
-            bot_restart_count += 1
-            print("=" * 60)
-            print(f"🤖 ЗАПУСК БОТА (Попытка #{bot_restart_count})")
-            print("=" * 60)
-            
-            # Инициализация базы данных
-            init_database()
-            
-            # Запускаем health server
-            health_process = start_health_server()
-            if not health_process:
-                print("❌ Не удалось запустить health server")
-                time.sleep(30)
-                continue
-            
-            # Запускаем keep-alive
-            start_keep_alive()
-            
-            # Даем время сервисам запуститься
-            print("⏳ Ожидание запуска сервисов (15 секунд)...")
-            time.sleep(15)
-            
-            # Проверяем health server
-            try:
-                port = int(os.getenv('PORT', 8000))
-                response = requests.get(f"http://localhost:{port}/health", timeout=10)
-                if response.status_code == 200:
-                    print("✅ Health server работает")
-                else:
-                    print(f"⚠️ Health server ответ: {response.status_code}")
-            except Exception as e:
-                print(f"❌ Health server проверка не удалась: {e}")
-            
-            # Запускаем бота с asyncio
-            print("🤖 Запуск Telegram бота...")
-            asyncio.run(run_bot_single())
-            
-        except KeyboardInterrupt:
-            print("\n🛑 Бот остановлен пользователем")
-            break
+            if await drain_application(application, SHUTDOWN_TIMEOUT):
+                await admin_notifier.flush()
+                await application.shutdown()
         except Exception as e:
-            print(f"🔴 КРИТИЧЕСКАЯ ОШИБКА: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            print(f"🔄 Перезапуск через 30 секунд... (Попытка {bot_restart_count}/{MAX_RESTARTS})")
-            time.sleep(30)
+            print(f"⚠️ Cleanup error (worker #{worker_id}): {e}")
+        
+        await asyncio.to_thread(search_analytics.stop)
+        await asyncio.to_thread(user_state_persistence.writer.stop)
+        click_boost_refresher.stop()
+
+def run_worker(worker_id: int, update_queue, suggestion_queue):
+    """Точка входа рабочего процесса в режиме webhook"""
+    global suggestion_writer
+    
+    # Пожелания пишет только приемник, рабочий процесс их пересылает
+    suggestion_writer = SuggestionForwarder(suggestion_queue)
+    
+    # Остановкой управляет приемник: он перестает принимать вебхук и присылает None
+    # после последнего обновления, поэтому сигнал группе процессов не должен обрывать очередь.
+    # Не уложившийся в срок рабочий процесс приемник завершает через SIGKILL
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    # Снимок каталога только для чтения: из артефакта или из таблицы processes, заполненной приемником
+    db.get_all_processes()
+    
+    # У каждого рабочего процесса свой порт метрик: METRICS_PORT + 1 + номер
+    start_metrics_server(METRICS_PORT + 1 + worker_id)
+    
+    try:
+        asyncio.run(run_worker_single(worker_id, update_queue))
+    except KeyboardInterrupt:
+        pass
+
+async def run_webhook_ingress():
+    """Приемник вебхука: раскладывает обновления по рабочим процессам и пишет пожелания"""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook нужен WEBHOOK_URL")
     
-    print("🚨 Достигнуто максимальное количество перезапусков. Бот остановлен.")
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    
+    # Приемник - единственный владелец записи пожеланий
+    suggestion_writer.start()
+    ingress = WebhookIngress(run_worker, BOT_WORKERS, suggestion_writer, secret_token,
+                             host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH)
+    registry.gauge_callback(
+        'bot_ingress_updates_total', 'Обновления, переданные рабочим процессам',
+        lambda: {(str(worker_id),): count for worker_id, count in enumerate(ingress.received)},
+        ['worker'], kind='counter')
+    registry.gauge_callback(
+        'bot_ingress_queue_depth', 'Обновления, ожидающие рабочего процесса',
+        lambda: {(str(worker_id),): depth for worker_id, depth in ingress.queue_depths().items()},
+        ['worker'])
+    
+    try:
+        shutdown.install()
+        await ingress.start()
+        bot_kwargs = {'base_url': f"{TELEGRAM_API_URL}/bot"} if TELEGRAM_API_URL else {}
+        async with Bot(BOT_TOKEN, **bot_kwargs) as bot:
+            await bot.set_webhook(url=WEBHOOK_URL, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+        print(f"✅ Вебхук установлен: {WEBHOOK_URL}")
+        serving = asyncio.create_task(ingress.serve_forever())
+        stopping = asyncio.create_task(shutdown.wait())
+        await asyncio.wait([serving, stopping], return_when=asyncio.FIRST_COMPLETED)
+        for task in (serving, stopping):
+            task.cancel()
+    finally:
+        # Рабочие процессы дорабатывают свои очереди; с запасом на их собственную остановку
+        await ingress.stop(timeout=shutdown.remaining())
+        await asyncio.to_thread(suggestion_writer.stop)
+        shutdown.uninstall()
+
+def run_once():
+    """Один запуск цикла бота (перезапускается супервизором после сбоя)"""
+    if BOT_MODE == 'webhook':
+        print(f"🤖 Запуск приемника вебхука и {BOT_WORKERS} рабочих процессов...")
+        asyncio.run(run_webhook_ingress())
+    else:
+        print("🤖 Запуск Telegram бота...")
+        asyncio.run(run_bot_single())
+
+def supervisor_endpoint(params):
+    """Состояние супервизора для health server: /supervisor -> JSON"""
+    status = bot_supervisor.status() if bot_supervisor else {'state': 'starting', 'healthy': True}
+    return 200, 'application/json; charset=utf-8', json.dumps(status, ensure_ascii=False).encode('utf-8')
+
+register_endpoint('/supervisor', supervisor_endpoint)
+
+def wait_for_health_server(timeout: float = 15.0):
+    """Ждет, пока health server начнет отвечать (не дольше timeout секунд)"""
+    port = int(os.getenv('PORT', 8000))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f"http://localhost:{port}/health", timeout=2)
+            print(f"✅ Health server работает (ответ {response.status_code})")
+            return True
+        except Exception:
+            time.sleep(0.5)
+    print(f"❌ Health server не ответил за {timeout:.0f} с")
+    return False
+
+def run_bot_with_restart():
+    """Запускает долгоживущие компоненты один раз, а цикл бота - под супервизором"""
+    global bot_supervisor
+    
+    print("=" * 60)
+    print("🤖 ЗАПУСК БОТА")
+    print("=" * 60)
+    
+    # База, сервер метрик, health server и keep-alive переживают перезапуски цикла бота
+    init_database()
+    
+    # Внутренний сервер метрик (health server отдает их наружу на /metrics)
+    start_metrics_server()
+    
+    # Health server не нужен боту для работы: если не поднялся, его перезапустит keep-alive
+    if not start_health_server():
+        print("❌ Не удалось запустить health server")
+    start_keep_alive()
+    wait_for_health_server()
+    
+    bot_supervisor = Supervisor(
+        'bot', run_once, lambda: shutdown.requested,
+        base_delay=RESTART_BACKOFF_BASE, max_delay=RESTART_BACKOFF_MAX,
+        max_crashes=CRASH_BUDGET, window=CRASH_BUDGET_WINDOW,
+        # Неверный токен перезапуском не лечится
+        fatal=(InvalidToken,),
+    )
+    try:
+        bot_supervisor.run()
+        print("\n🛑 Бот остановлен")
+    finally:
+        terminate_process(health_process)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /start"""
+    """Обработчик команды /start (/start p_B1_5 - ссылка сразу на карточку процесса)"""
     user = update.effective_user
     
+    process_id = parse_deep_link_payload(context.args[0]) if context.args else None
+    if process_id:
+        process_data = db.get_process_by_id(process_id)
+        if process_data:
+            await show_process_details(update, process_data)
+            return
+    
     # Создаем клавиатуру с кнопками
     keyboard = [
         [InlineKeyboardButton("🔍 Новый поиск процесса", callback_data="new_search")],
@@ -368,8 +649,9 @@ async def handle_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пожалуйста, введите текст предложения.")
             return
         
-        # Сохраняем пожелание в базу данных
-        db.save_suggestion(user.id, user.first_name, user.username, suggestion_text)
+        # Ставим пожелание в очередь отложенной записи (журнал на диске, коммит в фоне).
+        # Запись журнала с fsync идет в потоке, чтобы не останавливать цикл событий для других пользователей
+        await asyncio.to_thread(suggestion_writer.add, user.id, user.first_name, user.username, suggestion_text)
         
         # Отправляем уведомление администратору
         await notify_admin(context, user, suggestion_text)
@@ -397,29 +679,18 @@ async def handle_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Произошла ошибка при сохранении предложения.")
 
 async def notify_admin(context: ContextTypes.DEFAULT_TYPE, user, suggestion_text):
-    """Отправляет уведомление администратору о новом пожелании"""
+    """Добавляет пожелание в ближайший дайджест для администратора"""
     try:
-        admin_message = (
-            "🔔 <b>НОВОЕ ПРЕДЛОЖЕНИЕ ОТ ПОЛЬЗОВАТЕЛЯ</b>\n\n"
-            f"<b>Пользователь:</b> {user.first_name}\n"
-            f"<b>ID:</b> {user.id}\n"
-            f"<b>Username:</b> @{user.username if user.username else 'не указан'}\n"
-            f"<b>Время:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-            f"<b>Текст пожелания:</b>\n{suggestion_text}\n\n"
-            "<i>Для просмотра всех пожеланий используйте команду /viewsuggestions в боте</i>"
-        )
-        
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=admin_message,
-            parse_mode='HTML'
-        )
+        admin_notifier.add(context.bot, user, suggestion_text)
         
     except Exception as e:
         logger.error(f"Ошибка при отправке уведомления администратору: {e}")
 
 async def view_suggestions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для просмотра пожеланий (только для администратора)"""
+    if await is_throttled(update, 'admin'):
+        return
+    
     try:
         user_id = update.effective_user.id
         
@@ -428,41 +699,327 @@ async def view_suggestions_command(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("❌ У вас нет доступа к этой команде.")
             return
         
-        suggestions = db.get_all_suggestions()
+        # По умолчанию показываем кластеры похожих пожеланий, "/viewsuggestions all" - все пожелания подряд
+        if context.args and context.args[0].lower() == 'all':
+            await send_suggestions_page(update.message)
+        else:
+            await send_clusters_page(update.message)
+            
+    except Exception as e:
+        logger.error(f"Ошибка в view_suggestions_command: {e}")
+        await update.message.reply_text("❌ Ошибка при получении списка пожеланий")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сводка по поисковым запросам и нажатиям на результаты (только для администратора)"""
+    if await is_throttled(update, 'admin'):
+        return
+    
+    try:
+        if update.effective_user.id != ADMIN_CHAT_ID:
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        stats = search_analytics.stats.summary()
+        queries = stats['queries']
+        zero_share = stats['zero_results'] / queries * 100 if queries else 0
+        ctr = stats['clicked_queries'] / queries * 100 if queries else 0
+        
+        text = "📈 <b>Статистика поиска</b>\n\n"
+        text += f"🔍 Запросов: <b>{queries}</b> (уникальных: {stats['unique_queries']})\n"
+        text += f"❌ Без результатов: <b>{stats['zero_results']}</b> ({zero_share:.1f}%)\n"
+        text += f"👆 Нажатий на результаты: <b>{stats['clicks']}</b>\n"
+        text += f"🎯 Запросов с нажатием: {stats['clicked_queries']} ({ctr:.1f}%)\n"
+        text += f"⏱ Среднее время ответа: {stats['avg_latency_ms']:.1f} мс\n"
+        
+        if stats['top_queries']:
+            text += "\n<b>Частые запросы:</b>\n"
+            for tokens, count in stats['top_queries']:
+                text += f"• {html.escape(tokens) or '—'} — {count}\n"
+        
+        if stats['top_processes']:
+            text += "\n<b>Чаще всего открывают:</b>\n"
+            for process_id, count in stats['top_processes']:
+                text += f"• {html.escape(process_id)} — {count}\n"
+        
+        positions = [(position, count) for position, count in stats['click_positions'] if position is not None]
+        if positions:
+            text += "\n<b>Номер выбранного результата:</b> "
+            text += ", ".join(f"#{position}: {count}" for position, count in positions)
+            text += "\n"
         
-        if not suggestions:
-            await update.message.reply_text("📝 Пожеланий пока нет.")
+        await update.message.reply_text(text, parse_mode='HTML')
+        
+    except Exception as e:
+        logger.error(f"Ошибка в stats_command: {e}")
+        await update.message.reply_text("❌ Ошибка при получении статистики")
+
+async def zero_results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отчет о запросах без результатов с количеством и подсказкой (только для администратора)"""
+    if await is_throttled(update, 'admin'):
+        return
+    
+    try:
+        if update.effective_user.id != ADMIN_CHAT_ID:
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
             return
         
-        text = "📝 <b>Список пожеланий от пользователей:</b>\n\n"
+        stats = search_analytics.stats.summary(top=20)
+        if not stats['top_zero_result_queries']:
+            await update.message.reply_text("📭 Запросов без результатов пока нет.")
+            return
         
-        for i, suggestion in enumerate(suggestions, 1):
-            # Формат: (id, user_id, user_name, username, suggestion_text, created_at)
-            if isinstance(suggestion, (list, tuple)) and len(suggestion) >= 6:
-                user_name = suggestion[2]
-                username = f"@{suggestion[3]}" if suggestion[3] else "без username"
-                suggestion_text = suggestion[4]
-                created_at = suggestion[5]
-                
-                text += f"<b>{i}. {user_name} ({username})</b>\n"
-                text += f"<i>{created_at}</i>\n"
-                text += f"<b>Текст:</b> {suggestion_text}\n"
-                text += "─" * 30 + "\n\n"
+        header = "🕳 <b>Запросы без результатов</b>\n"
+        header += f"Всего: <b>{stats['zero_results']}</b> из {stats['queries']} запросов\n\n"
+        lines = []
+        for tokens, count in stats['top_zero_result_queries']:
+            suggestions = db.suggest_queries(tokens)
+            hint = f" → {html.escape(suggestions[0])}" if suggestions else ""
+            lines.append(f"• <code>{html.escape(tokens) or '—'}</code> — {count}{hint}\n")
+        
+        # Строки добавляются целиком, пока отчет укладывается в сообщение: обрезка готового HTML рвала бы теги
+        text, _ = fit_blocks(header, lines, "\n<i>Частые запросы без подсказки - кандидаты в синонимы и ключевые слова процессов</i>")
+        await update.message.reply_text(text, parse_mode='HTML')
         
-        # Разбиваем сообщение если оно слишком длинное
-        if len(text) > 4096:
-            parts = [text[i:i+4096] for i in range(0, len(text), 4096)]
-            for part in parts:
-                await update.message.reply_text(part, parse_mode='HTML')
-        else:
-            await update.message.reply_text(text, parse_mode='HTML')
-            
     except Exception as e:
-        logger.error(f"Ошибка в view_suggestions_command: {e}")
-        await update.message.reply_text("❌ Ошибка при получении списка пожеланий")
+        logger.error(f"Ошибка в zero_results_command: {e}")
+        await update.message.reply_text("❌ Ошибка при построении отчета")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профилирование обработки обновлений (только для администратора).
 
+    /profile [30 | 30s | 200u] [sample | cprofile] - на 30 секунд или на 200 обновлений,
+    /profile stop - остановить досрочно. Отчет приходит администратору файлом и сводкой.
+    """
+    if await is_throttled(update, 'admin'):
+        return
+    
+    try:
+        if update.effective_user.id != ADMIN_CHAT_ID:
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        args = context.args or []
+        if args == ['stop']:
+            if not profiler.active:
+                await update.message.reply_text("ℹ️ Профилирование не запущено.")
+                return
+            await finish_profile(context.application)
+            return
+        
+        seconds, updates, mode = PROFILE_DEFAULT_SECONDS, None, MODE_SAMPLE
+        for arg in args:
+            if arg in MODES:
+                mode = arg
+            elif arg.isdigit() or (arg[:-1].isdigit() and arg[-1] == 's'):
+                seconds = int(arg.rstrip('s'))
+            elif arg[:-1].isdigit() and arg[-1] == 'u':
+                updates, seconds = int(arg[:-1]), MAX_SECONDS
+            else:
+                await update.message.reply_text(PROFILE_USAGE, parse_mode='HTML')
+                return
+        if seconds <= 0 or updates == 0:
+            await update.message.reply_text(PROFILE_USAGE, parse_mode='HTML')
+            return
+        
+        try:
+            session = profiler.start(mode, seconds, updates)
+        except RuntimeError:
+            await update.message.reply_text("⏳ Профилирование уже идет. Остановить: /profile stop")
+            return
+        
+        # Счетчик обновлений добавляется только на время сеанса, поэтому без профилирования он ничего не стоит
+        application = context.application
+        if session.max_updates:
+            # Не add_handler: он добавляет группу в словарь, который сейчас обходит process_update
+            # (мы внутри обработчика), и цикл получения обновлений падает. Словарь подменяется целиком.
+            handlers = dict(application.handlers)
+            handlers[PROFILE_HANDLER_GROUP] = [TypeHandler(Update, count_profiled_update)]
+            application.handlers = dict(sorted(handlers.items()))
+        # Таймер не через application.create_task: иначе остановка приложения ждала бы его до конца
+        global profile_timer
+        profile_timer = asyncio.create_task(finish_profile_later(application, session))
+        
+        limit = f"{session.max_updates} обновлений (не дольше {session.seconds:.0f} с)" if session.max_updates else f"{session.seconds:.0f} с"
+        await update.message.reply_text(f"🔬 Профилирование ({mode}) запущено на {limit}. Остановить: /profile stop")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в profile_command: {e}")
+        await update.message.reply_text("❌ Ошибка при запуске профилирования")
+
+async def count_profiled_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Считает обновления сеанса профилирования и завершает его на нужном числе"""
+    if profiler.note_update():
+        context.application.create_task(finish_profile(context.application))
+
+async def finish_profile_later(application, session):
+    await asyncio.sleep(session.seconds)
+    if profiler.active is session:
+        await finish_profile(application)
+
+async def finish_profile(application):
+    """Останавливает профилирование и отправляет отчет администратору"""
+    report = profiler.stop()
+    if report is None:
+        return
+    
+    # Группа счетчика убирается так же подменой словаря целиком
+    application.handlers = {group: handlers for group, handlers in application.handlers.items() if group != PROFILE_HANDLER_GROUP}
+    
+    try:
+        await application.bot.send_document(
+            ADMIN_CHAT_ID,
+            document=report.data,
+            filename=report.filename,
+            caption=f"🔬 Профиль ({report.mode}): {report.duration:.1f} с, обновлений: {report.updates}",
+        )
+        await application.bot.send_message(
+            ADMIN_CHAT_ID, f"<pre>{html.escape(report.summary[:3500])}</pre>", parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при отправке отчета профилирования: {e}")
+
+def profile_endpoint(params):
+    """Сэмплирование цикла событий по HTTP: /profile?seconds=10[&format=summary] -> свернутые стеки"""
+    try:
+        seconds = min(float(params.get('seconds', ['10'])[0]), PROFILE_HTTP_MAX_SECONDS)
+    except ValueError:
+        return 400, 'text/plain; charset=utf-8', "Параметр seconds должен быть числом".encode('utf-8')
+    
+    try:
+        # asyncio.run работает в главном потоке, его и сэмплируем
+        report = profiler.sample_blocking(seconds, threading.main_thread().ident)
+    except ValueError as e:
+        # nan, inf и неположительная длительность
+        return 400, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+    except RuntimeError as e:
+        return 409, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+    
+    if params.get('format', ['collapsed'])[0] == 'summary':
+        return 200, 'text/plain; charset=utf-8', report.summary.encode('utf-8')
+    return 200, 'text/plain; charset=utf-8', report.data
+
+register_endpoint('/profile', profile_endpoint)
+
+def search_endpoint(params):
+    """Объяснение поиска для health server: /search?q=... -> JSON"""
+    query = params.get('q', [''])[0]
+    if not query:
+        return 400, 'application/json; charset=utf-8', json.dumps({'error': 'Параметр q обязателен'}, ensure_ascii=False).encode('utf-8')
+    
+    explain = {}
+    db.search_processes(query, explain=explain)
+    return 200, 'application/json; charset=utf-8', json.dumps(explain, ensure_ascii=False, default=str).encode('utf-8')
+
+register_endpoint('/search', search_endpoint)
+
+async def send_suggestions_page(message, cursor_key=None, direction='older'):
+    """Отправляет одну страницу пожеланий с кнопками перехода к соседним страницам"""
+    suggestions, has_more = db.get_suggestions_page(SUGGESTIONS_PAGE_SIZE, cursor_key, direction)
+    
+    if not suggestions:
+        await message.reply_text("📝 Пожеланий пока нет." if cursor_key is None else "📝 Больше пожеланий нет.")
+        return
+    
+    blocks = []
+    for suggestion in suggestions:
+        # Формат: (id, user_id, user_name, username, suggestion_text, created_at)
+        suggestion_id, _, user_name, username, suggestion_text, created_at = suggestion
+        username = f"@{username}" if username else "без username"
+        if len(suggestion_text) > 300:
+            suggestion_text = suggestion_text[:300] + "..."
+        
+        block = f"<b>#{suggestion_id}. {html.escape(user_name)} ({html.escape(username)})</b>\n"
+        block += f"<i>{created_at}</i>\n"
+        block += f"<b>Текст:</b> {html.escape(suggestion_text)}\n"
+        block += "─" * 30 + "\n\n"
+        blocks.append(block)
+    
+    # Есть ли страницы до и после текущей в порядке от новых к старым
+    if cursor_key is None:
+        has_newer, has_older = False, has_more
+    elif direction == 'newer':
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = True, has_more
+    
+    # Страница заканчивается на последнем пожелании, которое уместилось в сообщение;
+    # остальные открываются кнопкой "Старее" от него
+    text, shown = fit_blocks("📝 <b>Список пожеланий от пользователей:</b>\n\n", blocks)
+    if shown < len(suggestions):
+        suggestions, has_older = suggestions[:shown], True
+    
+    newest, oldest = suggestions[0], suggestions[-1]
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"sugg|newer|{newest[5]}|{newest[0]}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Старее ➡️", callback_data=f"sugg|older|{oldest[5]}|{oldest[0]}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    
+    await message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+
+async def send_clusters_page(message, cursor_key=None, direction='older'):
+    """Отправляет одну страницу кластеров похожих пожеланий с количеством в каждом"""
+    clusters, has_more = db.get_clusters_page(SUGGESTIONS_PAGE_SIZE, cursor_key, direction)
+    
+    if not clusters:
+        await message.reply_text("📝 Пожеланий пока нет." if cursor_key is None else "📝 Больше пожеланий нет.")
+        return
+    
+    blocks = []
+    for cluster in clusters:
+        # Формат: (id, representative_text, suggestion_count, first_created_at, last_created_at)
+        cluster_id, representative_text, suggestion_count, first_created_at, last_created_at = cluster
+        if len(representative_text) > 300:
+            representative_text = representative_text[:300] + "..."
+        
+        block = f"<b>Группа #{cluster_id}: {suggestion_count} шт.</b>\n"
+        block += f"<i>{first_created_at} — {last_created_at}</i>\n"
+        block += f"{html.escape(representative_text)}\n"
+        block += "─" * 30 + "\n\n"
+        blocks.append(block)
+    
+    if cursor_key is None:
+        has_newer, has_older = False, has_more
+    elif direction == 'newer':
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = True, has_more
+    
+    text, shown = fit_blocks("📝 <b>Пожелания, сгруппированные по похожести:</b>\n\n", blocks,
+                             "<i>Все пожелания подряд: /viewsuggestions all</i>")
+    if shown < len(clusters):
+        clusters, has_older = clusters[:shown], True
+    
+    newest, oldest = clusters[0], clusters[-1]
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"clus|newer|{newest[4]}|{newest[0]}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Старее ➡️", callback_data=f"clus|older|{oldest[4]}|{oldest[0]}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    
+    await message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+
+async def suggestions_page_callback(query, context):
+    """Обработчик кнопок перехода по страницам пожеланий (только для администратора)"""
+    if query.from_user.id != ADMIN_CHAT_ID:
+        await query.message.reply_text("❌ У вас нет доступа к этой команде.")
+        return
+    
+    # Формат: sugg|<direction>|<created_at>|<id> или clus|<direction>|<last_created_at>|<id>
+    kind, direction, created_at, row_id = query.data.split('|', 3)
+    if kind == 'clus':
+        await send_clusters_page(query.message, (created_at, int(row_id)), direction)
+    else:
+        await send_suggestions_page(query.message, (created_at, int(row_id)), direction)
+
+@timed_handler('send_processes_pdf')
 async def send_processes_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправка PDF-файла с бизнес-процессами"""
+    if await is_throttled(update, 'document'):
+        return
+    
     try:
         # Создаем клавиатуру с кнопками
         keyboard = [
@@ -493,8 +1050,12 @@ async def send_processes_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.error(f"Ошибка при отправке PDF: {e}")
         await update.message.reply_text("❌ Произошла ошибка при отправке файла")
 
+@timed_handler('send_guide')
 async def send_guide(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправка руководства по чтению бизнес-процессов"""
+    if await is_throttled(update, 'document'):
+        return
+    
     try:
         # Отправляем файл руководства
         with open(get_file_path("РД-1.0 Руководство по чтению БП ООО Технологии упаковки.docx"), "rb") as guide_file:
@@ -522,6 +1083,7 @@ async def send_guide(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Ошибка при отправке руководства: {e}")
         await update.message.reply_text("❌ Произошла ошибка при отправке руководства")
 
+@timed_handler('send_bpmn_video')
 async def send_bpmn_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправка ссылки на обучающий ролик по BPMN"""
     video_url = "https://youtu.be/y80ibAgdMMc"
@@ -553,6 +1115,7 @@ async def send_bpmn_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True
     )
 
+@timed_handler('send_test')
 async def send_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправка ссылки на тест по BPMN"""
     test_url = "https://onlinetestpad.com/pca3izxncofpk"
@@ -585,6 +1148,54 @@ async def send_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True
     )
 
+@timed_handler('send_process_diagram')
+async def send_process_diagram(message, process_id: str):
+    """Отправка схемы одного процесса: страницы общего PDF отдельным маленьким файлом"""
+    process_data = db.get_process_by_id(process_id)
+    extract = process_pages.get(process_id)
+    if process_data is None or extract is None:
+        await message.reply_text(
+            "❌ Схема этого процесса отдельно недоступна.\n"
+            "Скачайте PDF со всеми процессами: /pdf"
+        )
+        return
+    
+    caption = (
+        f"🗺 <b>{process_id}</b> {html.escape(process_data.process_name)}\n"
+        f"Схема из PDF со всеми процессами ({extract.pages})"
+    )
+    username = message.get_bot().username
+    if username:
+        caption += f"\n🔗 Ссылка на процесс: https://t.me/{username}?start={deep_link_payload(process_id)}"
+    
+    try:
+        file_id = process_pages.file_id(extract)
+        if file_id:
+            try:
+                await message.reply_document(document=file_id, caption=caption, parse_mode='HTML')
+                return
+            except BadRequest as e:
+                # file_id привязан к боту: после смены токена его нужно загрузить заново
+                logger.warning(f"file_id схемы {process_id} не принят ({e}), загружаем файл")
+                process_pages.forget_file_id(extract)
+        
+        with open(extract.path, "rb") as pdf_file:
+            sent = await message.reply_document(
+                document=pdf_file,
+                filename=f"{process_id} {process_data.process_name}.pdf",
+                caption=caption,
+                parse_mode='HTML'
+            )
+        if sent.document:
+            process_pages.remember_file_id(extract, sent.document.file_id)
+    
+    except FileNotFoundError:
+        await message.reply_text("❌ Схема процесса временно недоступна. Скачайте PDF со всеми процессами: /pdf")
+    except Exception as e:
+        logger.error(f"Ошибка при отправке схемы процесса {process_id}: {e}")
+        await message.reply_text("❌ Ошибка при отправке схемы процесса")
+
+@timed_handler('send_pdf_callback')
 async def send_pdf_callback(query, context):
     """Отправка PDF в callback"""
     try:
@@ -620,6 +1231,7 @@ async def send_pdf_callback(query, context):
         logger.error(f"Ошибка при отправке PDF в callback: {e}")
         await query.message.reply_text("❌ Произошла ошибка при отправке файла")
 
+@timed_handler('send_guide_callback')
 async def send_guide_callback(query, context):
     """Отправка руководства в callback"""
     try:
@@ -651,6 +1263,7 @@ async def send_guide_callback(query, context):
         logger.error(f"Ошибка при отправке руководства в callback: {e}")
         await query.message.reply_text("❌ Произошла ошибка при отправке руководства")
 
+@timed_handler('send_video_callback')
 async def send_video_callback(query, context):
     """Отправка видео в callback"""
     video_url = "https://youtu.be/y80ibAgdMMc"
@@ -682,6 +1295,7 @@ async def send_video_callback(query, context):
         disable_web_page_preview=True
     )
 
+@timed_handler('send_test_callback')
 async def send_test_callback(query, context):
     """Отправка теста в callback"""
     test_url = "https://onlinetestpad.com/pca3izxncofpk"
@@ -737,23 +1351,21 @@ async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
         
         for process in processes:
-            # Формат: ('B1.1', 'Ожидание перевозки')
-            if isinstance(process, (list, tuple)) and len(process) >= 2:
-                process_id = process[0]  # Первый элемент - process_id
-                process_name = process[1]  # Второй элемент - process_name
-                
-                if process_id.startswith('B1'):
-                    categories['🚚 ПРИЕМ И ОБРАБОТКА ПЕРЕВОЗОК (B1)'].append((process_id, process_name))
-                elif process_id.startswith('B2'):
-                    categories['📦 ХРАНЕНИЕ ТОВАРОВ (B2)'].append((process_id, process_name))
-                elif process_id.startswith('B3'):
-                    categories['👤 ВЫДАЧА ЗАКАЗОВ (B3)'].append((process_id, process_name))
-                elif process_id.startswith('B4'):
-                    categories['🔄 ВОЗВРАТЫ (B4)'].append((process_id, process_name))
-                elif process_id.startswith('B5'):
-                    categories['📤 ОТПРАВКИ НА СКЛАД (B5)'].append((process_id, process_name))
-                elif process_id.startswith('B6'):
-                    categories['🤝 РАБОТА С СЕЛЛЕРАМИ (B6)'].append((process_id, process_name))
+            process_id = process.process_id
+            process_name = process.process_name
+            
+            if process_id.startswith('B1'):
+                categories['🚚 ПРИЕМ И ОБРАБОТКА ПЕРЕВОЗОК (B1)'].append((process_id, process_name))
+            elif process_id.startswith('B2'):
+                categories['📦 ХРАНЕНИЕ ТОВАРОВ (B2)'].append((process_id, process_name))
+            elif process_id.startswith('B3'):
+                categories['👤 ВЫДАЧА ЗАКАЗОВ (B3)'].append((process_id, process_name))
+            elif process_id.startswith('B4'):
+                categories['🔄 ВОЗВРАТЫ (B4)'].append((process_id, process_name))
+            elif process_id.startswith('B5'):
+                categories['📤 ОТПРАВКИ НА СКЛАД (B5)'].append((process_id, process_name))
+            elif process_id.startswith('B6'):
+                categories['🤝 РАБОТА С СЕЛЛЕРАМИ (B6)'].append((process_id, process_name))
         
         # Формируем сообщение с категориями
         for category, items in categories.items():
@@ -781,6 +1393,9 @@ async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def debug_processes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Диагностика процессов"""
+    if await is_throttled(update, 'admin'):
+        return
+    
     try:
         processes = db.get_all_processes()
         
@@ -790,38 +1405,35 @@ async def debug_processes(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         text = f"🔍 <b>Диагностика:</b> найдено {len(processes)} процессов\n\n"
         
-        # Покажем структуру первого процесса
-        if processes:
-            first = processes[0]
-            text += f"<b>Структура первого процесса:</b>\n"
-            text += f"Тип: {type(first).__name__}\n"
-            text += f"Длина: {len(first)} элементов\n"
-            for i, item in enumerate(first):
-                text += f"{i}: {type(item).__name__} = {str(item)[:100]}\n"
-            text += "\n"
+        # Покажем поля первого процесса
+        first = processes[0]
+        text += f"<b>Поля первого процесса ({type(first).__name__}):</b>\n"
+        for field, value in first.fields():
+            text += f"{field}: {type(value).__name__} = {html.escape(str(value)[:100])}\n"
+        text += "\n"
         
         # Покажем несколько процессов для примера
         text += "<b>Первые 5 процессов:</b>\n"
         for i, process in enumerate(processes[:5], 1):
-            if isinstance(process, (list, tuple)) and len(process) >= 2:
-                process_id = process[0]
-                process_name = process[1]
-                text += f"{i}. {process_id} - {process_name}\n"
-            else:
-                text += f"{i}. Неизвестный формат: {process}\n"
+            text += f"{i}. {process.process_id} - {process.process_name}\n"
         
         await update.message.reply_text(text, parse_mode='HTML')
         
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка диагностики: {e}")
 
+@timed_handler('handle_message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений"""
     try:
         # Проверяем, не ожидается ли от пользователя пожелание
+        # (до лимита поиска: после серии поисков пожелание не должно теряться)
         if context.user_data.get('waiting_for_suggestion'):
             await handle_suggestion(update, context)
             return
+        
+        if await is_throttled(update, 'search'):
+            return
             
         query = update.message.text.strip()
         logger.info(f"Поиск: '{query}'")
@@ -830,23 +1442,49 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Запрос слишком короткий. Введите хотя бы 2 символа.")
             return
         
-        # Если запрос похож на код процесса
-        clean_query = query.upper().replace(' ', '')
-        if any(clean_query.startswith(prefix) for prefix in ['B1', 'B2', 'B3', 'B4', 'B5', 'B6']):
-            # Пробуем найти точное совпадение с кодом процесса
-            process_data = db.get_process_by_id(clean_query)
-            if process_data:
-                await show_process_details(update, process_data)
+        started = time.perf_counter()
+        user_id = update.effective_user.id
+        # Токены запроса считаются один раз: для поиска и для журнала поиска
+        query_tokens = tokenize(query)
+        
+        # Если запрос похож на код процесса (в том числе набранный кириллицей: В1.5)
+        clean_query = normalize_process_id(query)
+        if clean_query:
+            # Ищем процесс и его подпроцессы в индексе по коду
+            processes = db.get_processes_by_prefix(clean_query)
+            if processes:
+                search_analytics.record_query(user_id, query, query_tokens, [process.process_id for process in processes],
+                                              (time.perf_counter() - started) * 1000)
+            if len(processes) == 1:
+                await show_process_details(update, processes[0])
                 return
-            else:
-                # Если точного совпадения нет, делаем обычный поиск
-                pass
+            elif processes:
+                await show_process_range(update, clean_query, processes)
+                return
+            # Если совпадений по коду нет, делаем обычный поиск
         
         # Обычный поиск
-        results = db.search_processes(query)
+        results = db.search_processes(query, query_tokens=query_tokens)
         logger.info(f"Найдено результатов: {len(results)}")
+        search_analytics.record_query(user_id, query, query_tokens, [process.process_id for process in results],
+                                      (time.perf_counter() - started) * 1000)
         
         if not results:
+            # Подсказки по словарю каталога: запросы с опечатками - главная причина повторных поисков
+            suggestions = db.suggest_queries(query)
+            if suggestions:
+                context.user_data['did_you_mean'] = suggestions
+                keyboard = [[InlineKeyboardButton(f"🔍 {suggestion}", callback_data=f"dym|{i}")]
+                            for i, suggestion in enumerate(suggestions)]
+                keyboard.append([InlineKeyboardButton("📋 Открыть перечень всех процессов", callback_data="list_all")])
+                await update.message.reply_text(
+                    f"❌ По запросу '<b>{html.escape(query)}</b>' ничего не найдено.\n\n"
+                    "🤔 <b>Возможно, вы имели в виду:</b>",
+                    parse_mode='HTML',
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return
+            
             await update.message.reply_text(
                 f"❌ По запросу '<b>{query}</b>' ничего не найдено.\n\n"
                 "💡 <b>Попробуйте:</b>\n"
@@ -878,27 +1516,17 @@ async def show_simple_results(update: Update, query: str, results):
         text += f"Показано: <b>{len(limited_results)}</b> (самые релевантные)\n\n"
         
         # Простой пронумерованный список процессов (только первые 5)
-        for i, result in enumerate(limited_results, 1):
-            # Формат результата: (process_id, process_name, description, keywords)
-            if isinstance(result, (list, tuple)) and len(result) >= 2:
-                process_id = result[0]  # Первый элемент - process_id
-                process_name = result[1]  # Второй элемент - process_name
-            else:
-                process_id = "Неизвестно"
-                process_name = "Неизвестно"
-            
-            text += f"<b>{i}.</b> <code>{process_id}</code> - {process_name}\n"
+        for i, process in enumerate(limited_results, 1):
+            text += f"<b>{i}.</b> <code>{process.process_id}</code> - {process.process_name}\n"
         
         text += f"\n💡 <b>Для просмотра краткого описания подходящего процесса нажмите на кнопку ниже ↓</b>\n"
                 
         # Добавляем кнопки для быстрого доступа к первым процессам (только первые 5)
         keyboard = []
-        for i, result in enumerate(limited_results, 1):
-            if isinstance(result, (list, tuple)) and len(result) >= 1:
-                process_id = result[0]
-                # Используем только process_id для callback_data
-                button_text = f"{i}. {process_id} - {result[1] if len(result) > 1 else 'Процесс'}"
-                keyboard.append([InlineKeyboardButton(button_text, callback_data=f"show_{process_id}")])
+        for i, process in enumerate(limited_results, 1):
+            # Используем только process_id для callback_data
+            button_text = f"{i}. {process.process_id} - {process.process_name}"
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"show_{process.process_id}")])
         
         keyboard.append([InlineKeyboardButton("📄 Скачать PDF со всеми процессами", callback_data="get_pdf")])
         keyboard.append([InlineKeyboardButton("📋 Открыть перечень всех процессов", callback_data="list_all")])
@@ -913,42 +1541,52 @@ async def show_simple_results(update: Update, query: str, results):
         logger.error(f"Ошибка в show_simple_results: {e}")
         # Упрощенный fallback
         simple_text = f"🔍 Найдено процессов: {len(results)}\n\n"
-        for i, result in enumerate(results[:5], 1):  # Также ограничиваем до 5 в fallback
-            if isinstance(result, (list, tuple)) and len(result) >= 2:
-                simple_text += f"{i}. {result[0]} - {result[1]}\n"
-            else:
-                simple_text += f"{i}. {result}\n"
+        for i, process in enumerate(results[:5], 1):  # Также ограничиваем до 5 в fallback
+            simple_text += f"{i}. {process.process_id} - {process.process_name}\n"
         
         await update.message.reply_text(simple_text, parse_mode='HTML')
 
+async def show_process_range(update: Update, process_id: str, processes):
+    """Показывает процесс и все его подпроцессы по коду (например, B1.5)"""
+    try:
+        text = f"📂 <b>ПРОЦЕССЫ ПО КОДУ {process_id}</b>\n"
+        text += f"Найдено процессов: <b>{len(processes)}</b>\n\n"
+        
+        keyboard = []
+        for i, process in enumerate(processes, 1):
+            text += f"<b>{i}.</b> <code>{process.process_id}</code> - {process.process_name}\n"
+            
+            button_text = f"{process.process_id} - {process.process_name}"
+            if len(button_text) > 40:
+                button_text = button_text[:37] + "..."
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"show_{process.process_id}")])
+        
+        text += f"\n💡 <b>Для просмотра краткого описания процесса нажмите на кнопку ниже ↓</b>\n"
+        
+        keyboard.append([InlineKeyboardButton("📋 Открыть перечень всех процессов", callback_data="list_all")])
+        keyboard.append([InlineKeyboardButton("🔍 Новый поиск процесса", callback_data="new_search")])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_process_range: {e}")
+        await update.message.reply_text("❌ Ошибка при отображении процессов")
+
 async def show_process_details(update: Update, process_data):
     """Показывает детальную информацию о процессе"""
     try:
         # Добавим диагностику
         logger.info(f"Данные процесса: {process_data}")
         
-        # Формат данных из SQLite: (id, process_id, process_name, description, keywords)
-        if isinstance(process_data, (list, tuple)) and len(process_data) >= 5:
-            # Правильный формат: (id, process_id, process_name, description, keywords)
-            process_id = process_data[1]  # process_id
-            process_name = process_data[2]  # process_name
-            description = process_data[3]  # description
-            keywords = process_data[4] if len(process_data) > 4 else "Ключевые слова недоступны"
-            
-            # Проверяем описание
-            if not description:
-                description = "Описание временно недоступно. Пожалуйста, обратитесь к региональному менеджеру."
-                logger.warning(f"Пустое описание для процесса {process_id}")
-        else:
-            await update.message.reply_text("❌ Неизвестный формат данных процесса")
-            return
-            
-        # Исправленный формат вывода
-        text = f"<b>🔄 {process_id} - {process_name}</b>\n\n"
-        text += f"<b>📝 Описание:</b>\n{description}"
+        process_id = process_data.process_id
+        text = process_data.card
         
-        if keywords and keywords != "Ключевые слова недоступны":
-            text += f"\n\n<b>🔑 Ключевые слова:</b> {keywords}"
+        # Проверяем описание (без него готовой карточки нет)
+        if not text:
+            description = "Описание временно недоступно. Пожалуйста, обратитесь к региональному менеджеру."
+            logger.warning(f"Пустое описание для процесса {process_id}")
+            text = render_card(process_id, process_data.process_name, description, process_data.keywords)
         
         # Обрезаем если слишком длинное
         if len(text) > 4000:
@@ -962,6 +1600,8 @@ async def show_process_details(update: Update, process_data):
             [InlineKeyboardButton("💡 Отправить предложение", callback_data="send_suggestion")],
             [InlineKeyboardButton("❓ Помощь", callback_data="help")]
         ]
+        if process_pages.get(process_id):
+            keyboard.insert(1, [InlineKeyboardButton("🗺 Схема этого процесса (PDF)", callback_data=f"diagram_{process_id}")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
@@ -976,28 +1616,14 @@ async def show_process_callback(query, process_data):
         # Добавим диагностику
         logger.info(f"Данные процесса (callback): {process_data}")
         
-        # Формат данных из SQLite: (id, process_id, process_name, description, keywords)
-        if isinstance(process_data, (list, tuple)) and len(process_data) >= 5:
-            # Правильный формат: (id, process_id, process_name, description, keywords)
-            process_id = process_data[1]  # process_id
-            process_name = process_data[2]  # process_name
-            description = process_data[3]  # description
-            keywords = process_data[4] if len(process_data) > 4 else "Ключевые слова недоступны"
-            
-            # Проверяем описание
-            if not description:
-                description = "Описание временно недоступно. Пожалуйста, обратитесь к руководителю по качеству и операционным процессам."
-                logger.warning(f"Пустое описание для процесса {process_id} (callback)")
-        else:
-            await query.message.reply_text("❌ Неизвестный формат данных процесса")
-            return
-            
-        # Исправленный формат вывода
-        text = f"<b>🔄 {process_id} - {process_name}</b>\n\n"
-        text += f"<b>📝 Описание:</b>\n{description}"
+        process_id = process_data.process_id
+        text = process_data.card
         
-        if keywords and keywords != "Ключевые слова недоступны":
-            text += f"\n\n<b>🔑 Ключевые слова:</b> {keywords}"
+        # Проверяем описание (без него готовой карточки нет)
+        if not text:
+            description = "Описание временно недоступно. Пожалуйста, обратитесь к руководителю по качеству и операционным процессам."
+            logger.warning(f"Пустое описание для процесса {process_id} (callback)")
+            text = render_card(process_id, process_data.process_name, description, process_data.keywords)
         
         # Сокращаем для callback если слишком длинное
         if len(text) > 4000:
@@ -1009,6 +1635,8 @@ async def show_process_callback(query, process_data):
 	    [InlineKeyboardButton("📋 Открыть перечень всех процессов", callback_data="list_all")],
             [InlineKeyboardButton("💡 Отправить предложение", callback_data="send_suggestion")]
         ]
+        if process_pages.get(process_id):
+            keyboard.insert(1, [InlineKeyboardButton("🗺 Схема этого процесса (PDF)", callback_data=f"diagram_{process_id}")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         # Отправляем новое сообщение вместо редактирования
@@ -1018,14 +1646,28 @@ async def show_process_callback(query, process_data):
         logger.error(f"Ошибка в show_process_callback: {e}")
         await query.message.reply_text("❌ Ошибка при отображении процесса")
 
+@timed_handler('button_handler')
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на кнопки"""
     try:
         query = update.callback_query
-        await query.answer()
-        
         data = query.data
         
+        # Лимит проверяем до ответа на нажатие, чтобы показать причину во всплывающем уведомлении
+        category = CALLBACK_RATE_CATEGORIES.get(data)
+        if data.startswith(("show_", "dym|", "diagram_")):
+            # Выдержка весит килобайты и после первой отправки уходит по file_id, это не тяжелый документ
+            category = 'search'
+        elif data.startswith(("sugg|", "clus|")):
+            category = 'admin'
+        if category:
+            allowed, _ = rate_limiter.check(category, query.from_user.id, query.message.chat_id)
+            if not allowed:
+                await query.answer(THROTTLE_MESSAGES[category])
+                return
+        
+        await query.answer()
+        
         if data == "list_all":
             await list_command_callback(query)
         
@@ -1062,14 +1704,24 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif data == "cancel_suggestion":
             await cancel_suggestion_callback(query, context)
         
+        elif data.startswith(("sugg|", "clus|")):
+            await suggestions_page_callback(query, context)
+        
+        elif data.startswith("dym|"):
+            await did_you_mean_callback(query, context)
+        
         elif data.startswith("show_"):
             process_id = data[5:]
+            search_analytics.record_click(query.from_user.id, process_id)
             process_data = db.get_process_by_id(process_id)
             if process_data:
                 await show_process_callback(query, process_data)
             else:
                 await query.message.reply_text(f"❌ Процесс {process_id} не найден.")
         
+        elif data.startswith("diagram_"):
+            await send_process_diagram(query.message, data[len("diagram_"):])
+        
         elif data == "ignore":
             # Игнорируем нажатия на заголовки категорий
             pass
@@ -1077,6 +1729,32 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Ошибка в button_handler: {e}")
 
+async def did_you_mean_callback(query, context):
+    """Поиск по выбранному варианту исправления запроса"""
+    try:
+        suggestions = context.user_data.get('did_you_mean') or []
+        index = int(query.data.split("|", 1)[1])
+        if index >= len(suggestions):
+            await query.message.reply_text("❌ Подсказка устарела. Введите запрос еще раз.")
+            return
+        
+        text = suggestions[index]
+        started = time.perf_counter()
+        query_tokens = tokenize(text)
+        results = db.search_processes(text, query_tokens=query_tokens)
+        search_analytics.record_query(query.from_user.id, text, query_tokens, [process.process_id for process in results],
+                                      (time.perf_counter() - started) * 1000)
+        
+        if not results:
+            await query.message.reply_text(f"❌ По запросу '<b>{html.escape(text)}</b>' ничего не найдено.", parse_mode='HTML')
+            return
+        
+        await show_simple_results(query, text, results)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в did_you_mean_callback: {e}")
+        await query.message.reply_text("❌ Произошла ошибка при поиске")
+
 async def suggestion_callback(query, context):
     """Обработчик кнопки отправки пожелания"""
     context.user_data['waiting_for_suggestion'] = True
@@ -1136,22 +1814,21 @@ async def list_command_callback(query):
         }
         
         for process in processes:
-            if isinstance(process, (list, tuple)) and len(process) >= 2:
-                process_id = process[0]
-                process_name = process[1]
-                
-                if process_id.startswith('B1'):
-                    categories['🚚 ПРИЕМ И ОБРАБОТКА ПЕРЕВОЗОК (B1)'].append((process_id, process_name))
-                elif process_id.startswith('B2'):
-                    categories['📦 ХРАНЕНИЕ ТОВАРОВ (B2)'].append((process_id, process_name))
-                elif process_id.startswith('B3'):
-                    categories['👤 ВЫДАЧА ЗАКАЗОВ (B3)'].append((process_id, process_name))
-                elif process_id.startswith('B4'):
-                    categories['🔄 ВОЗВРАТЫ (B4)'].append((process_id, process_name))
-                elif process_id.startswith('B5'):
-                    categories['📤 ОТПРАВКИ НА СКЛАД (B5)'].append((process_id, process_name))
-                elif process_id.startswith('B6'):
-                    categories['🤝 РАБОТА С СЕЛЛЕРАМИ (B6)'].append((process_id, process_name))
+            process_id = process.process_id
+            process_name = process.process_name
+            
+            if process_id.startswith('B1'):
+                categories['🚚 ПРИЕМ И ОБРАБОТКА ПЕРЕВОЗОК (B1)'].append((process_id, process_name))
+            elif process_id.startswith('B2'):
+                categories['📦 ХРАНЕНИЕ ТОВАРОВ (B2)'].append((process_id, process_name))
+            elif process_id.startswith('B3'):
+                categories['👤 ВЫДАЧА ЗАКАЗОВ (B3)'].append((process_id, process_name))
+            elif process_id.startswith('B4'):
+                categories['🔄 ВОЗВРАТЫ (B4)'].append((process_id, process_name))
+            elif process_id.startswith('B5'):
+                categories['📤 ОТПРАВКИ НА СКЛАД (B5)'].append((process_id, process_name))
+            elif process_id.startswith('B6'):
+                categories['🤝 РАБОТА С СЕЛЛЕРАМИ (B6)'].append((process_id, process_name))
         
         # Создаем клавиатуру с кнопками процессов
         keyboard = []
@@ -1205,41 +1882,62 @@ async def list_command_callback(query):
         await query.message.reply_text("❌ Ошибка при получении списка процессов")
 
 async def debug_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Диагностика поиска"""
+    """Диагностика поиска: токены, стеммы, кандидаты по этапам, вклад полей и время этапов"""
+    if await is_throttled(update, 'admin'):
+        return
+    
     try:
         query = " ".join(context.args) if context.args else "постоплата"
-        results = db.search_processes(query)
+        explain = {}
+        db.search_processes(query, explain=explain)
+        
+        header = f"🔍 <b>Диагностика поиска:</b> '{html.escape(query)}'\n\n"
+        lines = [
+            f"<b>Токены:</b> {html.escape(', '.join(explain['tokens']))}\n",
+            f"<b>Слова после синонимов:</b> {html.escape(', '.join(explain['words']))}\n",
+            f"<b>Стеммер:</b> {explain['stemmer']} | <b>движок:</b> {explain['engine']}\n",
+        ]
+        if explain.get('fts_query'):
+            lines.append(f"<b>FTS-запрос:</b> <code>{html.escape(explain['fts_query'])}</code>\n")
+        for word, stems in explain['stems'].items():
+            lines.append(f"• {html.escape(word)} → {html.escape(', '.join(stems))}\n")
+        
+        candidates = explain['candidates']
+        lines.append(
+            "\n<b>Кандидаты по этапам:</b>\n"
+            f"Всего процессов: {candidates['total']}\n"
+            f"Найдено хотя бы одно слово: {candidates['matched']}\n"
+            f"С максимумом слов ({candidates['max_found_words']}/{len(explain['words'])}): {candidates['filtered']}\n"
+            f"Показано: {candidates['returned']}\n"
+        )
         
-        text = f"🔍 <b>Диагностика поиска:</b> '{query}'\n\n"
-        text += f"Найдено результатов: {len(results)}\n\n"
+        timings = explain['timings_ms']
+        lines.append(
+            "\n<b>Время этапов, мс:</b>\n"
+            f"tokenize {timings['tokenize']} | stem {timings['stem']} | candidates {timings['candidates']} | "
+            f"score {timings['score']} | sort {timings['sort']} | всего {timings['total']}\n"
+        )
         
-        if results:
-            text += "<b>Структура первого результата:</b>\n"
-            first = results[0]
-            text += f"Тип: {type(first).__name__}\n"
-            text += f"Длина: {len(first) if isinstance(first, (list, tuple)) else 'N/A'}\n"
-            
-            if isinstance(first, (list, tuple)):
-                for i, item in enumerate(first):
-                    text += f"[{i}]: {type(item).__name__} = {str(item)[:50]}\n"
-            else:
-                text += f"Значение: {first}\n"
-            
-            text += f"\n<b>Все результаты:</b>\n"
-            for i, result in enumerate(results[:5], 1):
-                if isinstance(result, (list, tuple)):
-                    if len(result) >= 3:
-                        text += f"{i}. ID:{result[1]}, Name:{result[2]}\n"
-                    elif len(result) >= 2:
-                        text += f"{i}. ID:{result[0]}, Name:{result[1]}\n"
-                    else:
-                        text += f"{i}. {result}\n"
-                else:
-                    text += f"{i}. {result}\n"
+        if explain['results']:
+            lines.append("\n<b>Результаты и вклад полей:</b>\n")
+            for i, result in enumerate(explain['results'], 1):
+                breakdown = ", ".join(f"{field} {score}" for field, score in result['breakdown'].items() if score)
+                lines.append(f"{i}. <code>{result['process_id']}</code> {html.escape(result['process_name'])} — "
+                             f"<b>{result['relevance']}</b> ({breakdown})\n")
         else:
-            text += "Результатов нет"
+            lines.append("\nРезультатов нет")
         
+        # Строки добавляются целиком, пока текст укладывается в сообщение; полный разбор уходит файлом
+        footer = "\n<i>Разбор не поместился в сообщение, полностью - во вложении</i>"
+        text, shown = fit_blocks(header, lines)
+        if shown < len(lines):
+            text, _ = fit_blocks(header, lines, footer)
         await update.message.reply_text(text, parse_mode='HTML')
+        if shown < len(lines):
+            await update.message.reply_document(
+                document=json.dumps(explain, ensure_ascii=False, indent=1, default=str).encode('utf-8'),
+                filename='search_explain.json',
+            )
         
     except Exception as e:
         await update.message.reply_text(f"❌ Ошибка диагностики поиска: {e}")
@@ -1281,6 +1979,7 @@ async def check_process(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Проверяет конкретный процесс"""
     try:
         process_id = context.args[0] if context.args else "B1.3"
+        process_id = normalize_process_id(process_id) or process_id
         
         process_data = db.get_process_by_id(process_id)
         
@@ -1289,12 +1988,14 @@ async def check_process(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         text = f"🔍 <b>Диагностика процесса {process_id}:</b>\n\n"
-        text += f"Тип данных: {type(process_data)}\n"
-        text += f"Длина: {len(process_data) if isinstance(process_data, (list, tuple)) else 'N/A'}\n\n"
+        text += f"Тип данных: {type(process_data).__name__}\n\n"
         
-        if isinstance(process_data, (list, tuple)):
-            for i, item in enumerate(process_data):
-                text += f"[{i}]: {type(item).__name__} = {str(item)[:100]}\n"
+        for field, value in process_data.fields():
+            text += f"{field}: {type(value).__name__} = {html.escape(str(value)[:100])}\n"
+        
+        # Подпроцессы из индекса по коду
+        children = [child.process_id for child in db.get_processes_by_prefix(process_id) if child.process_id != process_id]
+        text += f"\nПодпроцессы: {', '.join(children) if children else 'нет'}\n"
         
         await update.message.reply_text(text, parse_mode='HTML')
         
@@ -1302,13 +2003,17 @@ async def check_process(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Ошибка проверки: {e}")
 
 def handle_shutdown(signum, frame):
-    """Обработчик сигналов завершения работы"""
-    print(f"🛑 Получен сигнал {signum}. Завершаем работу...")
-    # Даем время на завершение операций
-    asyncio.get_event_loop().stop()
+    """Обработчик сигналов завершения вне цикла событий (запуск, пауза перед перезапуском).
+    
+    Пока работает бот, сигналы перехватывает shutdown.install() в цикле событий.
+    """
+    shutdown.request(signum)
+    raise KeyboardInterrupt
 
 def main():
     """Основная функция запуска"""
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    signal.signal(signal.SIGINT, handle_shutdown)
     try:
         run_bot_with_restart()
     except KeyboardInterrupt:
@@ -0,0 +1,117 @@
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+from text_normalizer import normalize_text
+from synonyms import SynonymDictionary
+from spelling import SpellingIndex
+
+# Поля строки каталога в порядке колонок таблицы processes
+RawProcessRow = Tuple[int, str, str, Optional[str], Optional[str]]
+
+
+def _intern(text: Optional[str]) -> str:
+    """Интернирует строку, чтобы одинаковые тексты в снимке хранились в одном экземпляре"""
+    return sys.intern(text or '')
+
+
+def render_card(process_id: str, process_name: str, description: str, keywords: Optional[str]) -> str:
+    """Текст карточки процесса (HTML) в том виде, в котором его показывает бот"""
+    text = f"<b>🔄 {process_id} - {process_name}</b>\n\n"
+    text += f"<b>📝 Описание:</b>\n{description}"
+    if keywords:
+        text += f"\n\n<b>🔑 Ключевые слова:</b> {keywords}"
+    return text
+
+
+class ProcessRecord:
+    """Неизменяемая запись процесса каталога: исходные поля и нормализованные тексты для поиска"""
+
+    __slots__ = ('row_id', 'process_id', 'process_name', 'description', 'keywords',
+                 'norm_name', 'norm_description', 'norm_keywords', 'all_text', 'words', 'card')
+
+    def __init__(self, row_id: int, process_id: str, process_name: str, description: Optional[str], keywords: Optional[str],
+                 norm_name: str, norm_description: str, norm_keywords: str, card: Optional[str] = None):
+        init = object.__setattr__
+        init(self, 'row_id', row_id)
+        init(self, 'process_id', _intern(process_id))
+        init(self, 'process_name', process_name)
+        init(self, 'description', description)
+        init(self, 'keywords', keywords)
+        init(self, 'norm_name', _intern(norm_name))
+        init(self, 'norm_description', _intern(norm_description))
+        init(self, 'norm_keywords', _intern(norm_keywords))
+        init(self, 'all_text', f"{norm_name} {norm_description} {norm_keywords}")
+        # Слова текста интернированы: одинаковые слова всех записей, словаря подсказок
+        # и таблицы основ - один и тот же объект строки
+        init(self, 'words', tuple(sys.intern(word) for word in self.all_text.split()))
+        # Готовая карточка; без описания пустая, и бот подставляет свой текст-заглушку
+        if card is None:
+            card = render_card(process_id, process_name, description, keywords) if description else ''
+        init(self, 'card', card)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ProcessRecord неизменяем: нельзя изменить {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ProcessRecord неизменяем: нельзя удалить {name}")
+
+    def fields(self) -> Iterator[Tuple[str, object]]:
+        """Пары (поле, значение) для диагностических команд"""
+        for name in self.__slots__:
+            yield name, getattr(self, name)
+
+    def __repr__(self) -> str:
+        return f"ProcessRecord({self.process_id!r}, {self.process_name!r})"
+
+
+class CatalogueSnapshot:
+    """Неизменяемый снимок каталога процессов.
+
+    Снимок публикуется одной ссылкой: читатели берут ссылку без блокировок,
+    а перезагрузка собирает новый снимок и подменяет ссылку целиком.
+    Изменяется только кэш подсказок, который живет вместе со снимком.
+    """
+
+    __slots__ = ('records', 'by_id', 'sorted_ids', 'synonyms', 'spelling', 'suggestion_cache')
+
+    def __init__(self, records: List[ProcessRecord], synonyms: SynonymDictionary, spelling: SpellingIndex):
+        records = tuple(sorted(records, key=lambda record: record.row_id))
+        by_id = {record.process_id: record for record in records}
+        init = object.__setattr__
+        init(self, 'records', records)
+        init(self, 'by_id', by_id)
+        init(self, 'sorted_ids', tuple(sorted(by_id)))
+        init(self, 'synonyms', synonyms)
+        init(self, 'spelling', spelling)
+        init(self, 'suggestion_cache', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CatalogueSnapshot неизменяем: нельзя изменить {name}")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+def build_records(rows: List[RawProcessRow], synonyms: SynonymDictionary) -> List[ProcessRecord]:
+    """Собирает записи каталога из строк таблицы processes.
+
+    Тексты процессов нормализуются тем же токенизатором, что и запросы, один раз при загрузке,
+    а синонимы и сокращения раскрываются здесь же, чтобы не размножать стеммы запроса.
+    """
+    records = []
+    for row_id, process_id, process_name, description, keywords in rows:
+        records.append(ProcessRecord(
+            row_id, process_id, process_name, description, keywords,
+            synonyms.expand_document(normalize_text(process_name)),
+            synonyms.expand_document(normalize_text(description or '')),
+            synonyms.expand_document(normalize_text(keywords or '')),
+        ))
+    return records
+
+
+def build_vocabulary(records: List[ProcessRecord]) -> Dict[str, int]:
+    """Частоты слов каталога (для словаря подсказок); ключи - те же объекты, что в record.words"""
+    frequencies: Dict[str, int] = {}
+    for record in records:
+        for word in record.words:
+            frequencies[word] = frequencies.get(word, 0) + 1
+    return frequencies
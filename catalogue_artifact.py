@@ -0,0 +1,190 @@
+"""Скомпилированный артефакт каталога процессов.
+
+Сборка (python catalogue_artifact.py) один раз разбирает processes.json и
+synonyms.json, нормализует тексты, считает основы слов каталога и готовит
+карточки процессов, а результат записывает в один двоичный файл. Бот при
+старте отображает файл в память (mmap) и разворачивает его через marshal,
+без pickle, разбора JSON и записи в SQLite.
+
+Формат файла: заголовок (сигнатура, версия формата, версия marshal, длина
+и SHA-256 полезной нагрузки), затем сама нагрузка в формате marshal. В
+нагрузке хранится отпечаток исходных файлов, кода нормализации и стеммера:
+если JSON или этот код поменяли, а артефакт не пересобрали, бот загрузит
+каталог из JSON как раньше.
+"""
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from catalogue import RawProcessRow, build_records, build_vocabulary
+from stemmer import Stemmer, create_stemmer
+from synonyms import SynonymDictionary
+
+PROCESSES_FILE = 'data/processes.json'
+SYNONYMS_FILE = 'data/synonyms.json'
+CATALOGUE_ARTIFACT = os.getenv('CATALOGUE_ARTIFACT', 'data/catalogue.bin')
+
+ARTIFACT_MAGIC = b'OZCATLG\x00'
+
+# Увеличивается при любом изменении состава нагрузки: старый артефакт просто не загрузится
+FORMAT_VERSION = 2
+
+# Сигнатура, версия формата, версия marshal, длина нагрузки, SHA-256 нагрузки
+HEADER = struct.Struct('<8sHHQ32s')
+
+# Код, от которого зависит содержимое артефакта (нормализация, синонимы, основы слов, карточки):
+# его изменение делает артефакт устаревшим так же, как изменение JSON
+CODE_MODULES = ('text_normalizer.py', 'synonyms.py', 'stemmer.py', 'catalogue.py', 'catalogue_artifact.py')
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_fingerprint(processes_file: str = PROCESSES_FILE, synonyms_file: str = SYNONYMS_FILE,
+                       stemmer_name: str = '') -> Optional[str]:
+    """Отпечаток исходных файлов каталога, кода их обработки и стеммера; None, если processes.json нет (проверять не с чем)"""
+    if not os.path.exists(processes_file):
+        return None
+
+    digest = hashlib.sha256()
+    with open(processes_file, 'rb') as f:
+        digest.update(f.read())
+    digest.update(b'\x00')
+    if os.path.exists(synonyms_file):
+        with open(synonyms_file, 'rb') as f:
+            digest.update(f.read())
+    for module in CODE_MODULES:
+        digest.update(b'\x00' + module.encode('utf-8') + b'\x00')
+        with open(os.path.join(CODE_DIR, module), 'rb') as f:
+            digest.update(f.read())
+    digest.update(b'\x00' + stemmer_name.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def source_stat(processes_file: str = PROCESSES_FILE, synonyms_file: str = SYNONYMS_FILE) -> Tuple[Tuple[int, int], ...]:
+    """Размеры и время изменения исходных файлов и кода: быстрая проверка артефакта без чтения файлов"""
+    paths = [processes_file, synonyms_file] + [os.path.join(CODE_DIR, module) for module in CODE_MODULES]
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stats.append((-1, -1))
+    return tuple(stats)
+
+
+def read_process_rows(processes_file: str = PROCESSES_FILE) -> List[RawProcessRow]:
+    """Читает процессы из JSON в виде строк таблицы processes (пустое описание заменяется заглушкой)"""
+    with open(processes_file, 'r', encoding='utf-8') as f:
+        processes_data = json.load(f)
+
+    rows = []
+    for row_id, process in enumerate(processes_data, start=1):
+        description = process.get('description', 'Описание отсутствует')
+        if not description:
+            description = 'Описание отсутствует'
+        rows.append((
+            row_id,
+            process.get('process_id', ''),
+            process.get('process_name', ''),
+            description,
+            process.get('keywords', ''),
+        ))
+    return rows
+
+
+def _read_synonym_groups(synonyms_file: str) -> List[Dict]:
+    if not os.path.exists(synonyms_file):
+        return []
+    with open(synonyms_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_artifact(processes_file: str = PROCESSES_FILE, synonyms_file: str = SYNONYMS_FILE,
+                   artifact_file: str = CATALOGUE_ARTIFACT, stemmer: Optional[Stemmer] = None) -> bool:
+    """Компилирует каталог в артефакт; файл подменяется атомарно"""
+    try:
+        stemmer = stemmer or create_stemmer()
+        synonym_groups = _read_synonym_groups(synonyms_file)
+        records = build_records(read_process_rows(processes_file), SynonymDictionary(synonym_groups))
+        vocabulary = build_vocabulary(records)
+
+        payload = marshal.dumps({
+            'source': source_fingerprint(processes_file, synonyms_file, stemmer.name),
+            'source_stat': source_stat(processes_file, synonyms_file),
+            'built_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'stemmer': stemmer.name,
+            'records': tuple(
+                (record.row_id, record.process_id, record.process_name, record.description, record.keywords,
+                 record.norm_name, record.norm_description, record.norm_keywords, record.card)
+                for record in records
+            ),
+            'synonyms': synonym_groups,
+            'vocabulary': vocabulary,
+            'stems': {word: stemmer.stems(word) for word in vocabulary},
+        })
+        header = HEADER.pack(ARTIFACT_MAGIC, FORMAT_VERSION, marshal.version, len(payload), hashlib.sha256(payload).digest())
+
+        directory = os.path.dirname(artifact_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = f"{artifact_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(temp_file, artifact_file)
+
+        print(f"✅ Артефакт каталога {artifact_file}: {len(records)} процессов, {len(header) + len(payload)} байт")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при сборке артефакта каталога: {e}")
+        return False
+
+
+def load_artifact(artifact_file: str = CATALOGUE_ARTIFACT, processes_file: Optional[str] = None,
+                  synonyms_file: str = SYNONYMS_FILE, stemmer_name: str = '') -> Optional[Dict[str, Any]]:
+    """Загружает нагрузку артефакта; None, если файла нет, он поврежден или устарел.
+
+    С processes_file артефакт сверяется с исходниками: если размеры и время
+    изменения файлов те же, что при сборке, файлы не читаются; иначе
+    сравнивается отпечаток их содержимого.
+    """
+    if not os.path.exists(artifact_file):
+        return None
+
+    try:
+        with open(artifact_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, format_version, marshal_version, size, checksum = HEADER.unpack_from(mapped, 0)
+            if magic != ARTIFACT_MAGIC or format_version != FORMAT_VERSION or marshal_version != marshal.version:
+                print(f"⚠️ Артефакт каталога {artifact_file} другой версии, каталог загружается из JSON")
+                return None
+
+            payload = memoryview(mapped)[HEADER.size:HEADER.size + size]
+            try:
+                if len(payload) != size or hashlib.sha256(payload).digest() != checksum:
+                    print(f"⚠️ Артефакт каталога {artifact_file} поврежден, каталог загружается из JSON")
+                    return None
+                artifact = marshal.loads(payload)
+            finally:
+                payload.release()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении артефакта каталога: {e}")
+        return None
+
+    # Без processes.json сверять не с чем; тот же стеммер и неизменные по stat файлы - артефакт свежий
+    if processes_file is None or not os.path.exists(processes_file):
+        return artifact
+    if artifact['stemmer'] == stemmer_name and artifact['source_stat'] == source_stat(processes_file, synonyms_file):
+        return artifact
+    if artifact['source'] != source_fingerprint(processes_file, synonyms_file, stemmer_name):
+        print(f"⚠️ Артефакт каталога {artifact_file} собран из других данных, каталог загружается из JSON")
+        return None
+    return artifact
+
+
+if __name__ == '__main__':
+    sys.exit(0 if build_artifact() else 1)
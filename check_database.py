@@ -46,8 +46,7 @@ def check_database():
                 print(f"   Поиск '{search_term}': найдено {len(results)} процессов")
                 if results:
                     for result in results[:2]:  # Покажем первые 2 результата
-                        process_id, process_name, level, responsible, description, keywords, bpmn_link = result
-                        print(f"     - {process_name} ({process_id})")
+                        print(f"     - {result.process_name} ({result.process_id})")
         
         conn.close()
         print(f"\n✅ База данных работает корректно!")
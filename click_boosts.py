@@ -0,0 +1,67 @@
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Максимальная прибавка к релевантности от одного слова запроса (как у особых бонусов)
+BOOST_MAX = 30
+
+# Сглаживание: пока нажатий по слову мало, прибавка остается небольшой
+BOOST_PRIOR = 5
+
+# Процессы, которые выбирали реже, не получают прибавку
+MIN_CLICKS = 2
+
+
+def build_click_boosts(rows: Iterable[Tuple[str, str, int]], query_keys: Callable[[str], List[str]]) -> Dict[str, Dict[str, int]]:
+    """Строит таблицу прибавок: основа слова запроса -> код процесса -> вес.
+
+    rows - тройки (нормализованный запрос, выбранный процесс, число запросов с таким
+    выбором), query_keys - ключи основ слов запроса в том же виде, что и при поиске.
+    Вес - доля нажатий на процесс среди всех нажатий по этой основе со сглаживанием.
+    """
+    clicks: Dict[str, Counter] = {}
+    for tokens, process_id, count in rows:
+        for key in set(query_keys(tokens or '')):
+            clicks.setdefault(key, Counter())[process_id] += count
+
+    boosts = {}
+    for key, process_clicks in clicks.items():
+        total = sum(process_clicks.values())
+        weights = {}
+        for process_id, count in process_clicks.items():
+            if count < MIN_CLICKS:
+                continue
+            weight = round(BOOST_MAX * count / (total + BOOST_PRIOR))
+            if weight:
+                weights[process_id] = weight
+        if weights:
+            boosts[key] = weights
+    return boosts
+
+
+class ClickBoostRefresher:
+    """Фоновый поток, который периодически пересчитывает прибавки по журналу нажатий"""
+
+    def __init__(self, database, interval: float = 3600):
+        self.database = database
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Запускает пересчет (повторный вызов ничего не делает)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='click-boosts', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.database.refresh_click_boosts()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
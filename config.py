@@ -11,6 +11,51 @@ print(f"👤 ADMIN_CHAT_ID установлен: {ADMIN_CHAT_ID}")
 
 DATABASE_NAME = 'data/processes.db'
 
+# Окно (в секундах), за которое пожелания собираются в один дайджест администратору
+ADMIN_DIGEST_WINDOW = int(os.getenv('ADMIN_DIGEST_WINDOW', 60))
+
+# Лимиты запросов одного пользователя: (допустимый всплеск, запросов в минуту)
+SEARCH_RATE_LIMIT = (int(os.getenv('SEARCH_RATE_BURST', 10)), int(os.getenv('SEARCH_RATE_PER_MINUTE', 30)))
+DOCUMENT_RATE_LIMIT = (int(os.getenv('DOCUMENT_RATE_BURST', 2)), int(os.getenv('DOCUMENT_RATE_PER_MINUTE', 2)))
+ADMIN_RATE_LIMIT = (int(os.getenv('ADMIN_RATE_BURST', 5)), int(os.getenv('ADMIN_RATE_PER_MINUTE', 20)))
+
+# Как часто (в секундах) пересчитывать прибавки к поиску по нажатиям на результаты
+CLICK_BOOST_REFRESH_INTERVAL = int(os.getenv('CLICK_BOOST_REFRESH_INTERVAL', 3600))
+
+# Состояние диалога пользователя (например, ожидание пожелания) сбрасывается, если не менялось дольше USER_STATE_TTL секунд
+USER_STATE_TTL = int(os.getenv('USER_STATE_TTL', 86400))
+
+# Как часто (в секундах) приложение передает измененные состояния пользователей на запись
+USER_STATE_UPDATE_INTERVAL = int(os.getenv('USER_STATE_UPDATE_INTERVAL', 10))
+
+# Сколько обновлений разных чатов обрабатывается одновременно (обновления одного чата - по очереди)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 64))
+
+# Адрес Bot API (например, локальный fake_bot_api.py для нагрузочного теста); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Режим работы: polling (один процесс) или webhook (приемник вебхука и BOT_WORKERS рабочих процессов)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', os.cpu_count() or 1))
+
+# Публичный адрес вебхука (например, https://example.com/telegram) и порт, на котором его слушает приемник
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Сколько секунд после SIGTERM дается на то, чтобы доработать очередь обновлений и исходящие отправки
+# (должно быть меньше срока, после которого платформа убивает процесс)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 20))
+
+# Перезапуск цикла бота после сбоя: пауза растет от RESTART_BACKOFF_BASE до RESTART_BACKOFF_MAX секунд;
+# больше CRASH_BUDGET сбоев за CRASH_BUDGET_WINDOW секунд - зацикливание на падениях (/health отвечает 503)
+RESTART_BACKOFF_BASE = float(os.getenv('RESTART_BACKOFF_BASE', 1))
+RESTART_BACKOFF_MAX = float(os.getenv('RESTART_BACKOFF_MAX', 60))
+CRASH_BUDGET = int(os.getenv('CRASH_BUDGET', 5))
+CRASH_BUDGET_WINDOW = float(os.getenv('CRASH_BUDGET_WINDOW', 600))
+
 # Создаем папку data если ее нет
 if not os.path.exists('data'):
     os.makedirs('data')
@@ -1,20 +1,81 @@
 import sqlite3
 import os
+import sys
 import re
-from typing import List, Tuple, Any, Optional
-from datetime import datetime
+import bisect
+import threading
+import time
+import uuid
+from typing import List, Tuple, Any, Optional, Dict
+from datetime import datetime, timezone
+from text_normalizer import normalize_text, tokenize
+from synonyms import SynonymDictionary
+from stemmer import Stemmer, create_stemmer
+from suggestion_clusters import SuggestionClusterIndex
+from click_boosts import build_click_boosts
+from spelling import SpellingIndex
+from catalogue import ProcessRecord, CatalogueSnapshot, build_records, build_vocabulary
+from catalogue_artifact import CATALOGUE_ARTIFACT, PROCESSES_FILE, load_artifact, read_process_rows
+from metrics import timed_db, search_stage_duration, cache_requests
+
+# Движок поиска: python (оценка релевантности в Python) или fts5 (полнотекстовый индекс SQLite)
+SEARCH_ENGINE = os.getenv('SEARCH_ENGINE', 'python')
+
+# Веса колонок для bm25() в порядке колонок processes_fts (process_id не индексируется)
+FTS_COLUMN_WEIGHTS = (0.0, 10.0, 5.0, 2.0)
+
+# Сколько секунд ждать, пока другой процесс (приемник или рабочий) освободит базу для записи
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))
+
+# Исходные файлы каталога лежат рядом с кодом, а рабочий каталог процесса может быть любым
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_path(path: str) -> str:
+    """Относительный путь к файлу каталога -> абсолютный путь от каталога проекта"""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def process_id_sort_key(process_id: str) -> Tuple:
+    """Ключ естественной сортировки кодов процессов: B1.10 идет после B1.9"""
+    return tuple(int(part) if part.isdigit() else part for part in process_id.lstrip('B').split('.'))
+
 
 class Database:
-    def __init__(self, db_file: str = 'data/processes.db'):
+    def __init__(self, db_file: str = 'data/processes.db', synonyms_file: str = 'data/synonyms.json', stemmer: Optional[Stemmer] = None, search_engine: str = SEARCH_ENGINE):
         self.db_file = db_file
+        self.synonyms_file = synonyms_file
+        self.stemmer = stemmer or create_stemmer()
+        self.search_engine = search_engine
+        self.fts_available = False
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
         self.create_tables()
+        
+        # Индекс процессов хранится в памяти и строится при первом обращении
+        self._index_lock = threading.Lock()
+        self._index: Optional[CatalogueSnapshot] = None
+        
+        # Прибавки по нажатиям: основа слова запроса -> код процесса -> вес (таблица подменяется целиком)
+        self._click_boosts: Dict[str, Dict[str, int]] = {}
+        
+        # Индекс похожих пожеланий загружается при первой записи пожеланий
+        self._cluster_lock = threading.Lock()
+        self._cluster_index: Optional[SuggestionClusterIndex] = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой: в режиме webhook в нее пишут несколько процессов,
+        поэтому занятая база ожидается до SQLITE_BUSY_TIMEOUT секунд, а не дает ошибку сразу"""
+        return sqlite3.connect(self.db_file, timeout=SQLITE_BUSY_TIMEOUT)
     
+    @timed_db('create_tables')
     def create_tables(self):
         """Создает необходимые таблицы в базе данных"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         
+        # WAL: чтение (поиск, пересчет прибавок в рабочих процессах) не блокирует запись пачек и наоборот
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS processes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,395 +97,767 @@ class Database:
             )
         ''')
         
+        # Кластеры похожих пожеланий: представитель, количество и время последнего пожелания
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS suggestion_clusters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                representative_text TEXT NOT NULL,
+                suggestion_count INTEGER NOT NULL DEFAULT 0,
+                first_created_at TIMESTAMP,
+                last_created_at TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_suggestion_clusters_last_id
+            ON suggestion_clusters (last_created_at, id)
+        ''')
+        
+        # Идентификатор записи из журнала отложенной записи: повторная вставка после сбоя игнорируется
+        cursor.execute('PRAGMA table_info(suggestions)')
+        suggestion_columns = {row[1] for row in cursor.fetchall()}
+        if 'entry_id' not in suggestion_columns:
+            cursor.execute('ALTER TABLE suggestions ADD COLUMN entry_id TEXT')
+        if 'cluster_id' not in suggestion_columns:
+            cursor.execute('ALTER TABLE suggestions ADD COLUMN cluster_id INTEGER')
+        
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_suggestions_entry_id
+            ON suggestions (entry_id)
+        ''')
+        
+        # Индекс для постраничного просмотра пожеланий по ключу (created_at, id)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_suggestions_created_id
+            ON suggestions (created_at, id)
+        ''')
+        
+        # Журнал поисковых событий: запросы (event_type='query') и нажатия на результаты ('click')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS search_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT UNIQUE NOT NULL,
+                event_type TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                user_id INTEGER,
+                query_text TEXT,
+                tokens TEXT,
+                result_ids TEXT,
+                result_count INTEGER,
+                latency_ms REAL,
+                process_id TEXT,
+                query_event_id TEXT,
+                position INTEGER
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_search_events_type_created
+            ON search_events (event_type, created_at)
+        ''')
+        
+        # Состояние диалога пользователя (context.user_data) в JSON; updated_at - время UNIX последнего изменения
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_state (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        
+        # file_id файлов, уже загруженных в Telegram (повторная отправка идет без загрузки)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                file_key TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Отпечаток исходников, из которых заполнены таблицы каталога (processes, processes_fts)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalogue_meta (
+                table_name TEXT PRIMARY KEY,
+                source TEXT
+            )
+        ''')
+        
+        # Полнотекстовый индекс нужен только движку fts5. В нем хранятся уже нормализованные
+        # тексты с раскрытыми синонимами, поэтому он заполняется при перестройке индекса в памяти
+        if self.search_engine == 'fts5':
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS processes_fts USING fts5(
+                        process_id UNINDEXED,
+                        process_name,
+                        keywords,
+                        description,
+                        tokenize = "unicode61 tokenchars '.'"
+                    )
+                ''')
+                self.fts_available = True
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ FTS5 недоступен ({e}), поиск работает на Python")
+        
         conn.commit()
         conn.close()
     
     def _normalize_text(self, text: str) -> str:
-        """Нормализует текст: заменяет ё на е и приводит к нижнему регистру"""
-        if not text:
-            return ""
-        return text.lower().replace('ё', 'е')
+        """Нормализует текст тем же токенизатором, что используется для поиска"""
+        return normalize_text(text)
     
     def _get_word_stems(self, word: str) -> List[str]:
-        """Возвращает возможные основы слова для поиска с учетом различных окончаний"""
-        word = self._normalize_text(word.strip())
-        
-        if len(word) < 2:
-            return [word]
-        
-        stems = [word]
-        
-        # Базовые формы слова (убираем распространенные окончания)
-        base_forms = []
-        
-        # Улучшенная обработка множественного числа
-        plural_endings = [
-            # Множественное число существительных
-            ('ов', ''), ('ев', ''), ('ей', ''), ('ий', 'ий'), ('ые', 'ый'), ('ие', 'ий'),
-            ('ам', ''), ('ям', ''), ('ами', ''), ('ями', ''), ('ах', ''), ('ях', ''),
-            # Родительный падеж и другие окончания
-            ('ом', ''), ('ем', ''), ('ой', ''), ('ей', ''), ('у', ''), ('ю', ''),
-            ('а', ''), ('я', ''), ('о', ''), ('е', ''), ('ь', ''), ('ы', ''), ('и', '')
-        ]
-        
-        # Специальные преобразования множественного числа
-        plural_transforms = {
-            'засылы': 'засыл',
-            'засылов': 'засыл',
-            'излишки': 'излиш',
-            'излишков': 'излиш',
-            'дубли': 'дубл',
-            'дублей': 'дубл',
-            'повреждения': 'поврежд',
-            'расхождения': 'расхожд',
-            'недовозы': 'недовоз',
-            'отправки': 'отправк',
-            'перевозки': 'перевоз',
-            'товары': 'товар',
-            'товаров': 'товар',
-            'упаковки': 'упаковк',
-            'наклейки': 'наклейк',
-            'накладные': 'накладн',
-            'возвраты': 'возврат',
-            'селлера': 'селлер',
-            'селлеры': 'селлер',
-            'коробки': 'коробк',
-            'ящики': 'ящик',
-            'ячейки': 'ячейк',
-            'процессы': 'процесс',
-            'процессов': 'процесс',
-            'заказы': 'заказ',
-            'заказов': 'заказ',
-            'клиенты': 'клиент',
-            'клиентов': 'клиент',
-            'водители': 'водитель',
-            'водителей': 'водитель',
-            'перевозки': 'перевозк',
-            'перевозок': 'перевозк',
-            'отправления': 'отправлен',
-            'отправлений': 'отправлен'
-        }
-        
-        # Проверяем специальные преобразования
-        if word in plural_transforms:
-            stems.append(plural_transforms[word])
-        
-        # Применяем правила окончаний
-        for ending, replacement in plural_endings:
-            if word.endswith(ending) and len(word) > len(ending) + 1:
-                base = word[:-len(ending)] + replacement
-                if len(base) >= 2:  # Проверяем, что основа не слишком короткая
-                    base_forms.append(base)
-        
-        # Для существительных мужского рода с окончанием на согласную
-        if len(word) > 2 and word[-1] not in 'аеёиоуыэюя':
-            # Добавляем возможные формы с разными окончаниями
-            possible_endings = ['а', 'у', 'ом', 'е', 'ы', 'ов', 'ам', 'ами', 'ах']
-            for ending in possible_endings:
-                if word + ending in plural_transforms.values():
-                    stems.append(word + ending)
-        
-        # Для существительных женского рода с окончанием на а/я
-        if word.endswith(('а', 'я')) and len(word) > 2:
-            base = word[:-1]
-            stems.extend([base + 'а', base + 'у', base + 'ой', base + 'е', base + 'ы', base + '', base + 'ам', base + 'ами', base + 'ах'])
-        
-        # Добавляем специальные случаи
-        special_cases = {
-            'излишки': ['излиш', 'излишек', 'излишк'],
-            'излишек': ['излиш', 'излишек', 'излишк'],
-            'расхождение': ['расхожд', 'расхожден'],
-            'расхождения': ['расхожд', 'расхожден'],
-            'повреждение': ['поврежден', 'поврежд'],
-            'повреждения': ['поврежден', 'поврежд'],
-            'зафиксировать': ['зафиксир', 'фиксир'],
-            'значительный': ['значительн', 'значим'],
-            'значительные': ['значительн', 'значим'],
-            'недовоз': ['недовоз', 'недов'],
-            'недовоза': ['недовоз', 'недов'],
-            'недовозы': ['недовоз', 'недов'],
-            'прием': ['прием', 'приём', 'принима'],
-            'приём': ['прием', 'приём', 'принима'],
-            'пустой': ['пуст', 'пусто'],
-            'пустая': ['пуст', 'пусто'],
-            'пустые': ['пуст', 'пусто'],
-            'упаковка': ['упаковк', 'упаков'],
-            'упаковки': ['упаковк', 'упаков'],
-            'упаковку': ['упаковк', 'упаков'],
-            'селлер': ['селлер', 'селер'],
-            'селлера': ['селлер', 'селер'],
-            'селлеры': ['селлер', 'селер'],
-            'перевозка': ['перевоз', 'перевозк'],
-            'перевозки': ['перевоз', 'перевозк'],
-            'размещение': ['размещен', 'размещ'],
-            'проверка': ['провер', 'проверк'],
-            'целостности': ['целост', 'целостн'],
-            'товара': ['товар'],
-            'товары': ['товар'],
-            'товаров': ['товар'],
-            'засыл': ['засыл'],
-            'засыла': ['засыл'],
-            'засылы': ['засыл'],
-            'дубль': ['дубл'],
-            'дубли': ['дубл'],
-            'оформление': ['оформлен', 'оформ'],
-            'оформить': ['оформ', 'оформлен'],
-            'приёмка': ['приемк', 'приёмк'],
-            'выдача': ['выдач', 'выда'],
-            'выдать': ['выдач', 'выда'],
-            'выдают': ['выдач', 'выда'],
-            'выдаче': ['выдач', 'выда'],
-            'выдач': ['выдач', 'выда'],
-            'экземпляр': ['экземпляр'],
-            'экземпляров': ['экземпляр'],
-            'экземпляры': ['экземпляр'],
-            'экземпляра': ['экземпляр'],
-            'возврат': ['возврат'],
-            'возвраты': ['возврат'],
-            'отправка': ['отправк'],
-            'отправки': ['отправк'],
-            'транспорт': ['транспорт'],
-            'накладная': ['накладн'],
-            'накладные': ['накладн'],
-            'ттн': ['ттн', 'транспортн'],
-            'штрихкод': ['штрихкод', 'шк'],
-            'штрихкода': ['штрихкод', 'шк'],
-            'штрихкоды': ['штрихкод', 'шк'],
-        }
-        
-        # Добавляем специальные случаи
-        if word in special_cases:
-            stems.extend(special_cases[word])
-        
-        # Добавляем базовые формы
-        stems.extend(base_forms)
-        
-        # Добавляем варианты с ё/е
-        if 'е' in word:
-            stems.append(word.replace('е', 'ё'))
-        if 'ё' in word:
-            stems.append(word.replace('ё', 'е'))
-        
-        # Убираем дубликаты и слишком короткие стеммы
-        stems = list(set([stem for stem in stems if len(stem) >= 2]))
-        
-        return stems
+        """Возвращает возможные основы слова для поиска (результат кэшируется стеммером)"""
+        return list(self.stemmer.stems(self._normalize_text(word.strip())))
+    
+    def _boost_key(self, stems: List[str]) -> Optional[str]:
+        """Ключ слова в таблице прибавок по нажатиям - его самая короткая основа"""
+        return min(stems, key=len) if stems else None
 
-    def _calculate_relevance(self, process_data: Tuple, query_stems: List[str], original_query: str, found_words_count: int, total_words: int) -> int:
-        """Вычисляет релевантность процесса для запроса с улучшенной логикой"""
-        process_id, process_name, description, keywords = process_data
-        
-        # Нормализуем все текстовые поля процесса
-        norm_process_name = self._normalize_text(process_name)
-        norm_description = self._normalize_text(description or '')
-        norm_keywords = self._normalize_text(keywords or '')
+    def _calculate_relevance(self, record: ProcessRecord, query_stems: List[str], norm_query: str, found_words_count: int, total_words: int, breakdown: Optional[Dict] = None, click_boosts: Optional[List[Dict[str, int]]] = None) -> int:
+        """Вычисляет релевантность процесса для запроса с улучшенной логикой.
         
-        # Объединяем все поля для поиска
-        all_text = f"{norm_process_name} {norm_description} {norm_keywords}"
-        
-        relevance = 0
+        Если передан словарь breakdown, в него записывается вклад каждого критерия.
+        """
+        process_id = record.process_id
+        all_text = record.all_text
+        norm_process_name = record.norm_name
+        norm_description = record.norm_description
+        norm_keywords = record.norm_keywords
         
         # 1. Самый важный критерий - количество найденных слов (максимальный бонус)
         if found_words_count == total_words:
             # Все слова найдены - максимальный бонус
-            relevance += 100
+            words_score = 100
         elif found_words_count == total_words - 1:
             # Найдены все слова кроме одного - высокий бонус
-            relevance += 70
+            words_score = 70
         elif found_words_count >= total_words - 2:
             # Найдено большинство слов - средний бонус
-            relevance += 40
+            words_score = 40
         else:
             # Найдено мало слов - минимальный бонус
-            relevance += found_words_count * 10
+            words_score = found_words_count * 10
         
         # 2. Проверяем наличие всех стемм запроса
-        found_stems = 0
+        stems_score = 0
         for stem in query_stems:
             if stem in all_text:
-                found_stems += 1
-                relevance += 3  # Небольшой бонус за каждое найденное слово
+                stems_score += 3  # Небольшой бонус за каждое найденное слово
         
         # 3. Бонус за точное совпадение фразы
-        norm_query = self._normalize_text(original_query)
-        if norm_query in all_text:
-            relevance += 50
+        phrase_score = 50 if norm_query in all_text else 0
         
         # 4. Бонус за совпадение в названии процесса
+        name_score = 0
         for stem in query_stems:
             if stem in norm_process_name:
-                relevance += 15
+                name_score += 15
         
         # 5. Бонус за совпадение в ключевых словах
+        keywords_score = 0
         for stem in query_stems:
             if stem in norm_keywords:
-                relevance += 10
+                keywords_score += 10
         
         # 6. Бонус за совпадение в описании
+        description_score = 0
         for stem in query_stems:
             if stem in norm_description:
-                relevance += 8
+                description_score += 8
         
         # 7. Особые бонусы для конкретных запросов (только те, где действительно есть слова запроса)
+        special_score = 0
         if "излиш" in norm_query and "излиш" in all_text:
             if process_id in ["B1.5.2"]:
-                relevance += 30
+                special_score += 30
         
         if "пуст" in norm_query and "упаков" in norm_query and "пуст" in all_text and "упаков" in all_text:
             if process_id in ["B1.6", "B1.6.2"]:
-                relevance += 30
+                special_score += 30
         
         if "недовоз" in norm_query and "недовоз" in all_text:
             if process_id in ["B1.5.1"]:
-                relevance += 30
+                special_score += 30
         
         if "дубл" in norm_query and "дубл" in all_text:
             if process_id in ["B1.5.2"]:
-                relevance += 30
+                special_score += 30
         
         if "засыл" in norm_query and "засыл" in all_text:
             if process_id in ["B1.5.2"]:
-                relevance += 30
+                special_score += 30
+        
+        # 8. Прибавка за то, что по этим словам пользователи чаще выбирали этот процесс
+        clicks_score = 0
+        if click_boosts:
+            for weights in click_boosts:
+                clicks_score += weights.get(process_id, 0)
         
-        return relevance
+        if breakdown is not None:
+            breakdown.update({
+                'words': words_score,
+                'stems': stems_score,
+                'phrase': phrase_score,
+                'process_name': name_score,
+                'keywords': keywords_score,
+                'description': description_score,
+                'special': special_score,
+                'clicks': clicks_score,
+            })
+        
+        return words_score + stems_score + phrase_score + name_score + keywords_score + description_score + special_score + clicks_score
 
-    def search_processes(self, query: str) -> List[Tuple]:
-        """Улучшенный поиск процессов с расширенной морфологией"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    def search_processes(self, query: str, explain: Optional[Dict] = None, query_tokens: Optional[List[str]] = None) -> List[ProcessRecord]:
+        """Улучшенный поиск процессов с расширенной морфологией.
         
-        # Разбиваем запрос на слова
-        words = [word.strip() for word in query.split() if word.strip()]
+        Если передан словарь explain, в него записываются токены, стеммы, число
+        кандидатов после каждого этапа, вклад полей в релевантность результатов
+        и время каждого этапа в миллисекундах. query_tokens - уже посчитанный
+        tokenize(query), чтобы вызывающий код не разбирал запрос второй раз.
+        """
+        if self.search_engine == 'fts5' and self.fts_available:
+            return self._search_fts(query, explain, query_tokens)
         
-        if not words:
-            return []
+        started = time.perf_counter()
+        
+        # Нормализуем и разбиваем запрос на токены один раз
+        if query_tokens is None:
+            query_tokens = tokenize(query)
         
-        # Получаем все процессы для поиска
-        cursor.execute('SELECT process_id, process_name, description, keywords FROM processes')
-        all_processes = cursor.fetchall()
+        index = self._get_index()
+        records = index.records
+        norm_query = ' '.join(query_tokens)
         
-        # Создаем стеммы для всех слов запроса
-        all_stems = []
-        for word in words:
-            stems = self._get_word_stems(word)
-            all_stems.extend(stems)
+        # Синонимы и сокращения заменяются каноническим термином, уже раскрытым в индексе
+        words = index.synonyms.rewrite_query(query_tokens)
+        tokenized = time.perf_counter()
+        
+        # Создаем стеммы для каждого слова запроса один раз, а не для каждого процесса
+        word_stems = [self._get_word_stems(word) for word in words]
         
         # Убираем дубликаты стемм
-        all_stems = list(set(all_stems))
+        all_stems = list(set(stem for stems in word_stems for stem in stems))
+        
+        # Прибавки по нажатиям ищутся один раз на слово запроса, а не на каждый процесс
+        boosts = self._click_boosts
+        click_boosts = [boosts[key] for key in (self._boost_key(stems) for stems in word_stems) if key in boosts]
+        stemmed = time.perf_counter()
         
         # Отладочная информация
         print(f"🔍 Поиск: '{query}' -> слова: {words}, стеммы: {all_stems}")
         
-        # Ищем процессы и вычисляем релевантность
-        results_with_relevance = []
-        for process_data in all_processes:
-            process_id, process_name, description, keywords = process_data
-            
-            # Нормализуем все текстовые поля процесса
-            norm_process_name = self._normalize_text(process_name)
-            norm_description = self._normalize_text(description or '')
-            norm_keywords = self._normalize_text(keywords or '')
-            
-            # Объединяем все поля для поиска
-            all_text = f"{norm_process_name} {norm_description} {norm_keywords}"
+        # Отбираем кандидатов: процессы, в которых найдено хотя бы одно слово запроса
+        candidates = []
+        for record in records:
+            all_text = record.all_text
             
-            # Считаем количество найденных слов (улучшенная логика)
+            # Считаем количество найденных слов (стеммы включают и само слово)
             found_words_count = 0
-            for word in words:
-                word_stems = self._get_word_stems(word)
-                word_found = False
-                
-                # Проверяем все стеммы слова
-                for stem in word_stems:
+            for stems in word_stems:
+                for stem in stems:
                     if stem in all_text:
-                        word_found = True
+                        found_words_count += 1
                         break
-                
-                # Также проверяем оригинальное слово
-                if not word_found and self._normalize_text(word) in all_text:
-                    word_found = True
-                    
-                if word_found:
-                    found_words_count += 1
             
-            # Если не найдено ни одного слова, пропускаем процесс
-            if found_words_count == 0:
-                continue
-            
-            # Вычисляем релевантность с учетом количества найденных слов
-            relevance = self._calculate_relevance(process_data, all_stems, query, found_words_count, len(words))
+            if found_words_count:
+                candidates.append((record, found_words_count))
+        
+        # Оставляем только процессы с максимальным количеством найденных слов
+        max_found_words = max((found_words for _, found_words in candidates), default=0)
+        candidates_filtered = [(record, found_words) for record, found_words in candidates
+                               if found_words == max_found_words]
+        generated = time.perf_counter()
+        
+        # Вычисляем релевантность с учетом количества найденных слов
+        scored = []
+        for record, found_words_count in candidates_filtered:
+            breakdown = {} if explain is not None else None
+            relevance = self._calculate_relevance(record, all_stems, norm_query, found_words_count, len(words), breakdown, click_boosts)
+            scored.append((record, relevance, found_words_count, breakdown))
+        scored_at = time.perf_counter()
+        
+        # Сортируем по релевантности (по убыванию) и берем топ-5 результатов
+        scored.sort(key=lambda x: x[1], reverse=True)
+        top_results = scored[:5]
+        final_results = [process for process, _, _, _ in top_results]
+        finished = time.perf_counter()
+        
+        print(f"📊 Итоговые результаты: {len(final_results)} процессов (с {max_found_words}/{len(words)} словами)")
+        
+        for stage, stage_started, stage_finished in (('tokenize', started, tokenized), ('stem', tokenized, stemmed),
+                                                     ('candidates', stemmed, generated), ('score', generated, scored_at),
+                                                     ('sort', scored_at, finished), ('total', started, finished)):
+            search_stage_duration.observe(stage_finished - stage_started, stage)
+        
+        if explain is not None:
+            explain.update({
+                'query': query,
+                'tokens': query_tokens,
+                'words': words,
+                'stems': {word: stems for word, stems in zip(words, word_stems)},
+                'candidates': {
+                    'total': len(records),
+                    'matched': len(candidates),
+                    'max_found_words': max_found_words,
+                    'filtered': len(candidates_filtered),
+                    'returned': len(final_results),
+                },
+                'results': [
+                    {
+                        'process_id': process.process_id,
+                        'process_name': process.process_name,
+                        'found_words': found_words,
+                        'relevance': relevance,
+                        'breakdown': breakdown,
+                    }
+                    for process, relevance, found_words, breakdown in top_results
+                ],
+                'timings_ms': {
+                    'tokenize': round((tokenized - started) * 1000, 3),
+                    'stem': round((stemmed - tokenized) * 1000, 3),
+                    'candidates': round((generated - stemmed) * 1000, 3),
+                    'score': round((scored_at - generated) * 1000, 3),
+                    'sort': round((finished - scored_at) * 1000, 3),
+                    'total': round((finished - started) * 1000, 3),
+                },
+                'stemmer': self.stemmer.name,
+                'engine': 'python',
+            })
+        
+        return final_results
+    
+    def _search_fts(self, query: str, explain: Optional[Dict] = None, query_tokens: Optional[List[str]] = None) -> List[ProcessRecord]:
+        """Поиск через FTS5: префиксные запросы по основам слов и ранжирование bm25() с весами колонок.
+        
+        Сначала ищутся процессы, где есть все слова запроса, а если таких нет -
+        хотя бы одно. Возвращает топ-5 в том же формате, что и search_processes.
+        """
+        started = time.perf_counter()
+        
+        index = self._get_index()
+        if query_tokens is None:
+            query_tokens = tokenize(query)
+        words = index.synonyms.rewrite_query(query_tokens)
+        tokenized = time.perf_counter()
+        
+        word_stems = [self._get_word_stems(word) for word in words]
+        groups = []
+        for stems in word_stems:
+            terms = sorted(set(stem for stem in stems if stem))
+            if terms:
+                groups.append('(' + ' OR '.join(f'"{term}"*' for term in terms) + ')')
+        stemmed = time.perf_counter()
+        
+        rows = []
+        match_query = ''
+        match_mode = 'all'
+        if groups:
+            conn = self._connect()
+            cursor = conn.cursor()
+            for match_mode, joiner in (('all', ' AND '), ('any', ' OR ')):
+                match_query = joiner.join(groups)
+                cursor.execute(f'''
+                    SELECT process_id, bm25(processes_fts, {', '.join(str(w) for w in FTS_COLUMN_WEIGHTS)}) AS score
+                    FROM processes_fts
+                    WHERE processes_fts MATCH ?
+                    ORDER BY score
+                    LIMIT 5
+                ''', (match_query,))
+                rows = cursor.fetchall()
+                if rows or len(groups) == 1:
+                    break
+            conn.close()
+        matched = time.perf_counter()
+        
+        top_results = [(index.by_id[process_id], score) for process_id, score in rows if process_id in index.by_id]
+        final_results = [process for process, _ in top_results]
+        finished = time.perf_counter()
+        
+        for stage, stage_started, stage_finished in (('tokenize', started, tokenized), ('stem', tokenized, stemmed),
+                                                     ('candidates', stemmed, matched), ('sort', matched, finished),
+                                                     ('total', started, finished)):
+            search_stage_duration.observe(stage_finished - stage_started, stage)
+        
+        print(f"📊 FTS5: '{match_query}' -> {len(final_results)} процессов")
+        
+        if explain is not None:
+            explain.update({
+                'query': query,
+                'tokens': query_tokens,
+                'words': words,
+                'stems': {word: stems for word, stems in zip(words, word_stems)},
+                'fts_query': match_query,
+                'candidates': {
+                    'total': len(index.records),
+                    'matched': len(rows),
+                    'max_found_words': len(words) if match_mode == 'all' else 1,
+                    'filtered': len(rows),
+                    'returned': len(final_results),
+                },
+                'results': [
+                    {
+                        'process_id': process.process_id,
+                        'process_name': process.process_name,
+                        'found_words': None,
+                        'relevance': round(-score, 3),
+                        'breakdown': {'bm25': round(-score, 3)},
+                    }
+                    for process, score in top_results
+                ],
+                'timings_ms': {
+                    'tokenize': round((tokenized - started) * 1000, 3),
+                    'stem': round((stemmed - tokenized) * 1000, 3),
+                    'candidates': round((matched - stemmed) * 1000, 3),
+                    'score': 0.0,
+                    'sort': round((finished - matched) * 1000, 3),
+                    'total': round((finished - started) * 1000, 3),
+                },
+                'stemmer': self.stemmer.name,
+                'engine': 'fts5',
+            })
+        
+        return final_results
+    
+    def suggest_queries(self, query: str, limit: int = 3) -> List[str]:
+        """Варианты исправления запроса ("возможно, вы имели в виду") по словарю каталога.
+        
+        Слова, которых нет в каталоге, заменяются ближайшими по расстоянию
+        редактирования. Каждое исправленное слово встречается в текстах процессов,
+        поэтому поиск по варианту всегда что-то находит. Результат кэшируется до
+        перестройки индекса: запросы без результатов часто повторяются.
+        """
+        index = self._get_index()
+        tokens = tokenize(query)
+        key = ' '.join(tokens)
+        
+        cached = index.suggestion_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        options = []
+        for token in tokens:
+            alternatives = [] if token in index.spelling else index.spelling.candidates(token, limit)
+            options.append(alternatives or [token])
+        
+        suggestions = []
+        if any(option[0] != token for option, token in zip(options, tokens)):
+            # Лучший вариант - ближайшее слово на каждой позиции, остальные меняют по одному слову
+            best = [option[0] for option in options]
+            variants = [best]
+            for position, option in enumerate(options):
+                for alternative in option[1:]:
+                    variants.append(best[:position] + [alternative] + best[position + 1:])
             
-            results_with_relevance.append((process_data, relevance, found_words_count))
-            print(f"   ✅ {process_data[1]} (ID: {process_data[0]}) - найдено слов: {found_words_count}/{len(words)}, релевантность: {relevance}")
+            for variant in variants:
+                text = ' '.join(variant)
+                if text not in suggestions:
+                    suggestions.append(text)
+                if len(suggestions) >= limit:
+                    break
         
-        # Если есть результаты, находим максимальное количество найденных слов
-        if results_with_relevance:
-            max_found_words = max(found_words for _, _, found_words in results_with_relevance)
-            print(f"📊 Максимальное количество найденных слов: {max_found_words}/{len(words)}")
+        # Кэш ограничен: при переполнении начинаем заново
+        if len(index.suggestion_cache) >= 1000:
+            index.suggestion_cache.clear()
+        index.suggestion_cache[key] = suggestions
+        return suggestions
+    
+    @timed_db('refresh_click_boosts')
+    def refresh_click_boosts(self) -> bool:
+        """Пересчитывает прибавки по журналу нажатий и подменяет таблицу в поиске"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
             
-            # Оставляем только процессы с максимальным количество найденных слов
-            filtered_results = [(process, relevance) for process, relevance, found_words in results_with_relevance 
-                              if found_words == max_found_words]
+            # Повторные нажатия на тот же результат одного запроса считаются один раз
+            cursor.execute('''
+                SELECT q.tokens, c.process_id, COUNT(DISTINCT c.query_event_id)
+                FROM search_events c
+                JOIN search_events q ON q.event_id = c.query_event_id
+                WHERE c.event_type = 'click'
+                GROUP BY q.tokens, c.process_id
+            ''')
+            rows = cursor.fetchall()
+            conn.close()
             
-            # Сортируем по релевантности (по убыванию)
-            filtered_results.sort(key=lambda x: x[1], reverse=True)
+            synonyms = self._get_index().synonyms
             
-            # Берем топ-5 результатов
-            final_results = [process for process, relevance in filtered_results[:5]]
+            def query_keys(tokens: str) -> List[str]:
+                words = synonyms.rewrite_query(tokens.split())
+                keys = (self._boost_key(self._get_word_stems(word)) for word in words)
+                return [key for key in keys if key]
             
-            print(f"📊 Итоговые результаты: {len(final_results)} процессов (с {max_found_words}/{len(words)} словами)")
-        else:
-            final_results = []
-            print(f"📊 Итоговые результаты: 0 процессов")
-        
-        conn.close()
-        return final_results
+            self._click_boosts = build_click_boosts(rows, query_keys)
+            print(f"✅ Прибавки по нажатиям обновлены: {len(self._click_boosts)} основ")
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при пересчете прибавок по нажатиям: {e}")
+            return False
     
-    def get_all_processes(self) -> List[Tuple]:
-        """Возвращает все процессы в формате (process_id, process_name)"""
-        conn = sqlite3.connect(self.db_file)
+    def get_all_processes(self) -> List[ProcessRecord]:
+        """Возвращает все процессы каталога, отсортированные по коду"""
+        index = self._get_index()
+        return [index.by_id[process_id] for process_id in index.sorted_ids]
+    
+    @timed_db('reload_index')
+    def reload_index(self):
+        """Перестраивает индекс процессов в памяти (по коду и для поиска) из базы данных"""
+        conn = self._connect()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT process_id, process_name FROM processes ORDER BY process_id')
-        processes = cursor.fetchall()
+        cursor.execute('SELECT id, process_id, process_name, description, keywords FROM processes')
+        rows = cursor.fetchall()
         
         conn.close()
-        return processes
+        
+        # Таблицу еще никто не заполнил (например, база пересоздана) - читаем JSON напрямую
+        if not rows and os.path.exists(source_path(PROCESSES_FILE)):
+            rows = read_process_rows(source_path(PROCESSES_FILE))
+        
+        synonyms = SynonymDictionary.load(self.synonyms_file)
+        records = build_records(rows, synonyms)
+        self._install_snapshot(records, synonyms, build_vocabulary(records))
     
-    def get_process_by_id(self, process_id: str) -> Optional[Tuple]:
-        """Находит процесс по ID"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    @timed_db('load_catalogue_artifact')
+    def load_catalogue_artifact(self, artifact_file: str = CATALOGUE_ARTIFACT, processes_file: str = PROCESSES_FILE) -> bool:
+        """Загружает каталог из скомпилированного артефакта, не читая JSON.
+
+        Таблица processes заполняется строками артефакта, только если она собрана
+        из других исходников (или еще пуста).
+
+        Возвращает False, если артефакта нет, он поврежден или собран из других исходных файлов.
+        """
+        artifact = load_artifact(source_path(artifact_file), source_path(processes_file),
+                                 source_path(self.synonyms_file), self.stemmer.name)
+        if artifact is None:
+            return False
         
-        cursor.execute('SELECT * FROM processes WHERE process_id = ?', (process_id,))
-        process = cursor.fetchone()
+        records = [ProcessRecord(*row) for row in artifact['records']]
+        vocabulary = {sys.intern(word): count for word, count in artifact['vocabulary'].items()}
         
-        conn.close()
-        return process
+        # Основы слов каталога годятся, только если артефакт собран тем же стеммером
+        if artifact['stemmer'] == self.stemmer.name:
+            self.stemmer.preload(artifact['stems'])
+        
+        if self.catalogue_source('processes') != artifact['source']:
+            self.replace_processes([row[:5] for row in artifact['records']], artifact['source'])
+        
+        self._install_snapshot(records, SynonymDictionary(artifact['synonyms']), vocabulary, artifact['source'])
+        return True
     
-    def save_suggestion(self, user_id: int, user_name: str, username: str, suggestion_text: str) -> bool:
-        """Сохраняет пожелание пользователя в базу данных"""
+    def catalogue_source(self, table_name: str) -> Optional[str]:
+        """Отпечаток исходников, из которых заполнена таблица каталога (None - неизвестно)"""
+        conn = None
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT source FROM catalogue_meta WHERE table_name = ?', (table_name,)).fetchone()
+            conn.close()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"❌ Ошибка при чтении отпечатка таблицы {table_name}: {e}")
+            if conn is not None:
+                conn.close()
+            return None
+    
+    @timed_db('replace_processes')
+    def replace_processes(self, rows: List[Tuple], source: Optional[str]) -> bool:
+        """Заменяет содержимое таблицы processes одной транзакцией и запоминает отпечаток исходников.
+        
+        Формат строки: (id, process_id, process_name, description, keywords).
+        """
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self._connect()
             cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO suggestions (user_id, user_name, username, suggestion_text)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, user_name, username, suggestion_text))
-            
+            cursor.execute('DELETE FROM processes')
+            cursor.executemany('''
+                INSERT INTO processes (id, process_id, process_name, description, keywords)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute('INSERT OR REPLACE INTO catalogue_meta (table_name, source) VALUES (?, ?)', ('processes', source))
             conn.commit()
             conn.close()
             return True
-            
         except Exception as e:
-            print(f"Ошибка при сохранении пожелания: {e}")
+            print(f"❌ Ошибка при заполнении таблицы processes: {e}")
+            if conn is not None:
+                conn.close()
             return False
     
+    def _install_snapshot(self, records: List[ProcessRecord], synonyms: SynonymDictionary, vocabulary: Dict[str, int],
+                          source: Optional[str] = None):
+        """Собирает снимок каталога и публикует его.
+        
+        С отпечатком source полнотекстовый индекс перестраивается, только если собран из других исходников.
+        """
+        if self.fts_available and (source is None or self.catalogue_source('fts') != source):
+            self._rebuild_fts(records, source)
+        
+        snapshot = CatalogueSnapshot(records, synonyms, SpellingIndex(vocabulary))
+        
+        # Подменяем ссылку целиком, чтобы читатели не видели частично собранный снимок
+        with self._index_lock:
+            self._index = snapshot
+    
+    def _rebuild_fts(self, records: List[ProcessRecord], source: Optional[str] = None):
+        """Синхронизирует полнотекстовый индекс с таблицей processes одной транзакцией"""
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM processes_fts')
+            cursor.executemany(
+                'INSERT INTO processes_fts (process_id, process_name, keywords, description) VALUES (?, ?, ?, ?)',
+                [(record.process_id, record.norm_name, record.norm_keywords, record.norm_description) for record in records]
+            )
+            cursor.execute('INSERT OR REPLACE INTO catalogue_meta (table_name, source) VALUES (?, ?)', ('fts', source))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"❌ Ошибка при обновлении FTS-индекса: {e}")
+            if conn is not None:
+                conn.close()
+            self.fts_available = False
+    
+    def _get_index(self) -> CatalogueSnapshot:
+        """Возвращает текущий снимок каталога, загружая его при необходимости"""
+        if self._index is None and not self.load_catalogue_artifact():
+            self.reload_index()
+        return self._index
+    
+    def get_process_by_id(self, process_id: str) -> Optional[ProcessRecord]:
+        """Находит процесс по ID (из индекса в памяти, без обращения к диску)"""
+        process = self._get_index().by_id.get(process_id)
+        cache_requests.inc('process_id', 'hit' if process else 'miss')
+        return process
+    
+    def get_processes_by_prefix(self, process_id: str) -> List[ProcessRecord]:
+        """Возвращает процесс и все его подпроцессы: B1.5 -> B1.5, B1.5.1, B1.5.2"""
+        index = self._get_index()
+        id_index = index.by_id
+        sorted_ids = index.sorted_ids
+        
+        results = []
+        if process_id in id_index:
+            results.append(process_id)
+        
+        # Дочерние коды идут в лексикографическом порядке сразу за префиксом "B1.5."
+        child_prefix = process_id + '.'
+        start = bisect.bisect_left(sorted_ids, child_prefix)
+        for candidate in sorted_ids[start:]:
+            if not candidate.startswith(child_prefix):
+                break
+            results.append(candidate)
+        
+        results.sort(key=process_id_sort_key)
+        cache_requests.inc('process_prefix', 'hit' if results else 'miss')
+        return [id_index[pid] for pid in results]
+    
+    def save_suggestion(self, user_id: int, user_name: str, username: str, suggestion_text: str) -> bool:
+        """Сохраняет пожелание пользователя в базу данных"""
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        return self.save_suggestions_batch([(uuid.uuid4().hex, user_id, user_name, username, suggestion_text, created_at)])
+    
+    @timed_db('save_suggestions_batch')
+    def save_suggestions_batch(self, entries: List[Tuple]) -> bool:
+        """Сохраняет пачку пожеланий одной транзакцией и относит каждое к кластеру похожих.
+        
+        Формат записи: (entry_id, user_id, user_name, username, suggestion_text, created_at).
+        Записи с уже сохраненным entry_id пропускаются, поэтому пачку можно безопасно повторить.
+        """
+        with self._cluster_lock:
+            conn = None
+            try:
+                conn = self._connect()
+                cursor = conn.cursor()
+                
+                self._ensure_cluster_index(cursor)
+                
+                for entry in entries:
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO suggestions (entry_id, user_id, user_name, username, suggestion_text, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', entry)
+                    if cursor.rowcount == 1:
+                        self._assign_cluster(cursor, cursor.lastrowid, entry[4], entry[5])
+                
+                conn.commit()
+                conn.close()
+                return True
+                
+            except Exception as e:
+                print(f"Ошибка при сохранении пачки пожеланий: {e}")
+                if conn is not None:
+                    conn.close()
+                # Индекс мог получить кластеры из откаченной транзакции - перечитаем его из базы
+                self._cluster_index = None
+                return False
+    
+    def _ensure_cluster_index(self, cursor=None):
+        """Загружает индекс кластеров, если он еще не загружен (вызывается под _cluster_lock).
+        
+        Без cursor открывает свое соединение и сразу сохраняет распределение старых пожеланий.
+        """
+        if self._cluster_index is not None:
+            return
+        if cursor is not None:
+            self._load_cluster_index(cursor)
+            return
+        
+        conn = self._connect()
+        try:
+            self._load_cluster_index(conn.cursor())
+            conn.commit()
+        except Exception:
+            # Индекс мог получить кластеры из откаченной транзакции
+            self._cluster_index = None
+            raise
+        finally:
+            conn.close()
+    
+    def _load_cluster_index(self, cursor):
+        """Строит индекс кластеров из базы и распределяет по кластерам старые пожелания без кластера"""
+        self._cluster_index = SuggestionClusterIndex(self.stemmer)
+        
+        cursor.execute('SELECT id, representative_text FROM suggestion_clusters')
+        for cluster_id, representative_text in cursor.fetchall():
+            self._cluster_index.add(cluster_id, self._cluster_index.features(representative_text))
+        
+        cursor.execute('''
+            SELECT id, suggestion_text, created_at FROM suggestions
+            WHERE cluster_id IS NULL
+            ORDER BY created_at, id
+        ''')
+        for suggestion_id, suggestion_text, created_at in cursor.fetchall():
+            self._assign_cluster(cursor, suggestion_id, suggestion_text, created_at)
+    
+    def _assign_cluster(self, cursor, suggestion_id: int, suggestion_text: str, created_at: str):
+        """Относит пожелание к самому похожему кластеру или создает новый"""
+        features = self._cluster_index.features(suggestion_text)
+        cluster_id = self._cluster_index.find(features)
+        
+        if cluster_id is None:
+            cursor.execute('''
+                INSERT INTO suggestion_clusters (representative_text, suggestion_count, first_created_at, last_created_at)
+                VALUES (?, 0, ?, ?)
+            ''', (suggestion_text, created_at, created_at))
+            cluster_id = cursor.lastrowid
+            self._cluster_index.add(cluster_id, features)
+        
+        cursor.execute('UPDATE suggestions SET cluster_id = ? WHERE id = ?', (cluster_id, suggestion_id))
+        cursor.execute('''
+            UPDATE suggestion_clusters
+            SET suggestion_count = suggestion_count + 1,
+                last_created_at = MAX(COALESCE(last_created_at, ?), ?)
+            WHERE id = ?
+        ''', (created_at, created_at, cluster_id))
+    
+    @timed_db('get_all_suggestions')
     def get_all_suggestions(self) -> List[Tuple]:
         """Возвращает все пожелания из базы данных"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -441,10 +874,11 @@ class Database:
             print(f"Ошибка при получении пожеланий: {e}")
             return []
     
+    @timed_db('get_suggestions_count')
     def get_suggestions_count(self) -> int:
         """Возвращает количество пожеланий в базе"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('SELECT COUNT(*) FROM suggestions')
@@ -457,10 +891,11 @@ class Database:
             print(f"Ошибка при подсчете пожеланий: {e}")
             return 0
     
+    @timed_db('get_recent_suggestions')
     def get_recent_suggestions(self, limit: int = 10) -> List[Tuple]:
         """Возвращает последние пожелания"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -478,5 +913,262 @@ class Database:
             print(f"Ошибка при получении последних пожеланий: {e}")
             return []
 
+    def _fetch_keyset_page(self, select_sql: str, key_columns: Tuple[str, str], limit: int, cursor_key: Optional[Tuple[str, int]], direction: str) -> Tuple[List[Tuple], bool]:
+        """Читает одну страницу по ключу (время, id) в порядке от новых к старым.
+        
+        select_sql - запрос без ORDER BY/LIMIT; условие по ключу добавляется через WHERE или AND.
+        """
+        time_column, id_column = key_columns
+        joiner = ' AND ' if ' WHERE ' in select_sql else ' WHERE '
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+        if cursor_key is None:
+            cursor.execute(f'''{select_sql}
+                ORDER BY {time_column} DESC, {id_column} DESC
+                LIMIT ?
+            ''', (limit + 1,))
+        elif direction == 'newer':
+            cursor.execute(f'''{select_sql}{joiner}({time_column}, {id_column}) > (?, ?)
+                ORDER BY {time_column} ASC, {id_column} ASC
+                LIMIT ?
+            ''', (cursor_key[0], cursor_key[1], limit + 1))
+        else:
+            cursor.execute(f'''{select_sql}{joiner}({time_column}, {id_column}) < (?, ?)
+                ORDER BY {time_column} DESC, {id_column} DESC
+                LIMIT ?
+            ''', (cursor_key[0], cursor_key[1], limit + 1))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if cursor_key is not None and direction == 'newer':
+            rows.reverse()
+        return rows, has_more
+    
+    @timed_db('get_suggestions_page')
+    def get_suggestions_page(self, limit: int = 10, cursor_key: Optional[Tuple[str, int]] = None, direction: str = 'older') -> Tuple[List[Tuple], bool]:
+        """Возвращает страницу пожеланий (от новых к старым) по ключу (created_at, id).
+        
+        cursor_key - ключ (created_at, id) крайнего пожелания текущей страницы,
+        direction - 'older' для следующей страницы или 'newer' для предыдущей.
+        Возвращает строки страницы и признак того, что в этом направлении есть еще пожелания.
+        """
+        try:
+            return self._fetch_keyset_page(
+                '''
+                SELECT id, user_id, user_name, username, suggestion_text, created_at
+                FROM suggestions
+                ''',
+                ('created_at', 'id'), limit, cursor_key, direction
+            )
+            
+        except Exception as e:
+            print(f"Ошибка при получении страницы пожеланий: {e}")
+            return [], False
+    
+    @timed_db('get_clusters_page')
+    def get_clusters_page(self, limit: int = 10, cursor_key: Optional[Tuple[str, int]] = None, direction: str = 'older') -> Tuple[List[Tuple], bool]:
+        """Возвращает страницу кластеров похожих пожеланий по ключу (last_created_at, id).
+        
+        Формат строки: (id, representative_text, suggestion_count, first_created_at, last_created_at).
+        """
+        try:
+            # Старые пожелания без кластера распределяются при первой загрузке индекса
+            with self._cluster_lock:
+                self._ensure_cluster_index()
+            
+            return self._fetch_keyset_page(
+                '''
+                SELECT id, representative_text, suggestion_count, first_created_at, last_created_at
+                FROM suggestion_clusters
+                WHERE suggestion_count > 0
+                ''',
+                ('last_created_at', 'id'), limit, cursor_key, direction
+            )
+            
+        except Exception as e:
+            print(f"Ошибка при получении страницы кластеров пожеланий: {e}")
+            return [], False
+    
+    @timed_db('save_search_events_batch')
+    def save_search_events_batch(self, events: List[Tuple]) -> bool:
+        """Сохраняет пачку поисковых событий одной транзакцией.
+        
+        Формат записи: (event_id, event_type, created_at, user_id, query_text, tokens,
+        result_ids, result_count, latency_ms, process_id, query_event_id, position).
+        """
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR IGNORE INTO search_events (event_id, event_type, created_at, user_id, query_text, tokens,
+                                                     result_ids, result_count, latency_ms, process_id, query_event_id, position)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', events)
+            conn.commit()
+            conn.close()
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при сохранении поисковых событий: {e}")
+            if conn is not None:
+                conn.close()
+            return False
+    
+    @timed_db('get_search_event_aggregates')
+    def get_search_event_aggregates(self) -> Dict[str, Any]:
+        """Агрегаты журнала поиска для начального состояния статистики.
+        
+        Возвращает словарь: queries - строки (tokens, количество, без результатов, сумма задержек),
+        clicks - строки (process_id, position, количество), clicked_queries - число
+        запросов, после которых был клик.
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT tokens, COUNT(*), SUM(result_count = 0), SUM(latency_ms)
+                FROM search_events
+                WHERE event_type = 'query'
+                GROUP BY tokens
+            ''')
+            queries = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT process_id, position, COUNT(*)
+                FROM search_events
+                WHERE event_type = 'click'
+                GROUP BY process_id, position
+            ''')
+            clicks = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT COUNT(DISTINCT query_event_id)
+                FROM search_events
+                WHERE event_type = 'click' AND query_event_id IS NOT NULL
+            ''')
+            clicked_queries = cursor.fetchone()[0]
+            
+            conn.close()
+            return {'queries': queries, 'clicks': clicks, 'clicked_queries': clicked_queries}
+            
+        except Exception as e:
+            print(f"Ошибка при чтении агрегатов поиска: {e}")
+            return {'queries': [], 'clicks': [], 'clicked_queries': 0}
+
+    @timed_db('load_user_states')
+    def load_user_states(self, max_age: float) -> Dict[int, Tuple[str, float]]:
+        """Загружает сохраненные состояния пользователей: user_id -> (JSON, updated_at).
+        
+        Состояния старше max_age секунд удаляются и не возвращаются.
+        """
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM user_state WHERE updated_at < ?', (time.time() - max_age,))
+            cursor.execute('SELECT user_id, data, updated_at FROM user_state')
+            states = {user_id: (data, updated_at) for user_id, data, updated_at in cursor.fetchall()}
+            conn.commit()
+            conn.close()
+            return states
+            
+        except Exception as e:
+            print(f"Ошибка при загрузке состояний пользователей: {e}")
+            if conn is not None:
+                conn.close()
+            return {}
+    
+    @timed_db('save_user_states_batch')
+    def save_user_states_batch(self, entries: List[Tuple[int, Optional[str], float]]) -> bool:
+        """Сохраняет пачку состояний пользователей одной транзакцией.
+        
+        Формат записи: (user_id, JSON или None для удаления, updated_at). Из нескольких
+        записей одного пользователя в пачке сохраняется только последняя.
+        """
+        latest = {}
+        for user_id, data, updated_at in entries:
+            latest[user_id] = (data, updated_at)
+        
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.executemany(
+                'INSERT OR REPLACE INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?)',
+                [(user_id, data, updated_at) for user_id, (data, updated_at) in latest.items() if data is not None]
+            )
+            cursor.executemany(
+                'DELETE FROM user_state WHERE user_id = ?',
+                [(user_id,) for user_id, (data, _) in latest.items() if data is None]
+            )
+            conn.commit()
+            conn.close()
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при сохранении состояний пользователей: {e}")
+            if conn is not None:
+                conn.close()
+            return False
+    
+    def get_telegram_file_id(self, file_key: str) -> Optional[str]:
+        """file_id загруженного ранее файла по ключу (None, если файл еще не отправлялся)"""
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT file_id FROM telegram_files WHERE file_key = ?', (file_key,))
+            row = cursor.fetchone()
+            conn.close()
+            return row[0] if row else None
+            
+        except Exception as e:
+            print(f"Ошибка при чтении file_id {file_key}: {e}")
+            if conn is not None:
+                conn.close()
+            return None
+    
+    def save_telegram_file_id(self, file_key: str, file_id: str) -> bool:
+        """Запоминает file_id, который Telegram вернул после загрузки файла"""
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('INSERT OR REPLACE INTO telegram_files (file_key, file_id) VALUES (?, ?)', (file_key, file_id))
+            conn.commit()
+            conn.close()
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при сохранении file_id {file_key}: {e}")
+            if conn is not None:
+                conn.close()
+            return False
+    
+    def delete_telegram_file_id(self, file_key: str) -> bool:
+        """Забывает file_id, который Telegram больше не принимает"""
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM telegram_files WHERE file_key = ?', (file_key,))
+            conn.commit()
+            conn.close()
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при удалении file_id {file_key}: {e}")
+            if conn is not None:
+                conn.close()
+            return False
+
 # Создаем глобальный экземпляр базы данных
 db = Database()
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+Сервер отвечает на вызовы бота так же, как api.telegram.org, но ничего не
+отправляет наружу: обновления выдаются через getUpdates или доставляются
+на вебхук (после setWebhook), а исходящие вызовы (sendMessage,
+sendDocument и т.д.) записываются. Для каждого чата запоминается время
+отправки обновления, а первый ответ бота в этот чат дает сквозную задержку.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+
+# Вызовы, на которые Bot API отвечает отправленным сообщением; они же считаются ответом бота пользователю
+# (answerCallbackQuery - только подтверждение нажатия)
+MESSAGE_METHOD_PREFIXES = ('send', 'edit')
+
+
+class FakeBotAPI:
+    """HTTP-сервер в формате Bot API: /bot<token>/<method>"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081):
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self.latencies: List[Tuple[str, float]] = []
+        # События создаются в start(), внутри цикла событий
+        self.ready: Optional[asyncio.Event] = None
+
+        self._updates: List[Dict[str, Any]] = []
+        self._update_event: Optional[asyncio.Event] = None
+        self._pending: Dict[int, Tuple[float, str]] = {}
+        self._message_id = 0
+        self._webhook_url: Optional[str] = None
+        self._webhook_secret: Optional[str] = None
+        self._webhook_slots: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.ready = asyncio.Event()
+        self._update_event = asyncio.Event()
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        app.router.add_get('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = aiohttp.ClientSession()
+        print(f"🧪 Fake Bot API слушает {self.url}")
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push_update(self, update: Dict[str, Any], chat_id: int, kind: str):
+        """Отправляет обновление боту и начинает отсчет задержки ответа в chat_id"""
+        self._pending[chat_id] = (time.perf_counter(), kind)
+        if self._webhook_url:
+            asyncio.get_running_loop().create_task(self._deliver(update))
+        else:
+            self._updates.append(update)
+            self._update_event.set()
+
+    def pending_chats(self):
+        """Чаты, в которых бот еще не ответил на последнее обновление"""
+        return self._pending.keys()
+
+    def unanswered(self) -> Counter:
+        """Обновления без ответа бота по видам трафика"""
+        return Counter(kind for _, kind in self._pending.values())
+
+    async def _deliver(self, update: Dict[str, Any]):
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self._webhook_secret} if self._webhook_secret else {}
+        async with self._webhook_slots:
+            try:
+                async with self._session.post(self._webhook_url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        self.calls['webhook_error'] += 1
+            except aiohttp.ClientError:
+                self.calls['webhook_error'] += 1
+
+    async def _get_updates(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._update_event.clear()
+            try:
+                await asyncio.wait_for(self._update_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, method: str, params: Dict[str, str]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'from': BOT_USER,
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if method == 'sendDocument':
+            message['document'] = {'file_id': f"doc{self._message_id}", 'file_unique_id': f"doc{self._message_id}"}
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        self.calls[method] += 1
+
+        if method.startswith(MESSAGE_METHOD_PREFIXES) and params.get('chat_id'):
+            pending = self._pending.pop(int(params['chat_id']), None)
+            if pending is not None:
+                started, kind = pending
+                self.latencies.append((kind, time.perf_counter() - started))
+
+        if method == 'getMe':
+            result: Any = BOT_USER
+        elif method == 'getUpdates':
+            self.ready.set()
+            result = await self._get_updates(params)
+        elif method == 'setWebhook':
+            self._webhook_url = params.get('url') or None
+            self._webhook_secret = params.get('secret_token')
+            self._webhook_slots = asyncio.Semaphore(int(params.get('max_connections') or 40))
+            self.ready.set()
+            result = True
+        elif method == 'deleteWebhook':
+            self._webhook_url = None
+            result = True
+        elif method == 'getWebhookInfo':
+            result = {'url': self._webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': len(self._updates)}
+        elif method.startswith(MESSAGE_METHOD_PREFIXES):
+            result = self._message(method, params)
+        else:
+            result = True
+
+        return web.Response(text=json.dumps({'ok': True, 'result': result}), content_type='application/json')
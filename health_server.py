@@ -1,6 +1,6 @@
 import os
 import time
-from flask import Flask
+from flask import Flask, request
 import threading
 import requests
 from datetime import datetime
@@ -34,6 +34,14 @@ class HealthMonitor:
 
 monitor = HealthMonitor()
 
+def bot_supervisor_status():
+    """Состояние супервизора цикла бота (процесс бота отдает его на внутреннем порту метрик)"""
+    metrics_port = int(os.getenv('METRICS_PORT', 9464))
+    try:
+        return requests.get(f'http://127.0.0.1:{metrics_port}/supervisor', timeout=1).json()
+    except Exception:
+        return None
+
 @app.route('/')
 def home():
     return {
@@ -46,13 +54,17 @@ def home():
 @app.route('/health')
 def health():
     monitor.record_ping()
+    bot = bot_supervisor_status()
+    # Бот, зацикленный на падениях, - повод для платформы перезапустить сервис или поднять тревогу
+    healthy = bot is None or bot.get('healthy', True)
     return {
-        'status': 'OK',
+        'status': 'OK' if healthy else 'CRASH_LOOP',
         'ping_count': monitor.ping_count,
         'timestamp': time.time(),
         'uptime': round(time.time() - start_time, 2),
-        'health': monitor.health_status
-    }
+        'health': monitor.health_status,
+        'bot': bot
+    }, 200 if healthy else 503
 
 @app.route('/ping')
 def simple_ping():
@@ -109,6 +121,7 @@ def status():
         'last_ping': monitor.last_ping,
         'last_uptimerobot_ping': monitor.last_uptimerobot_ping,
         'health_status': monitor.health_status,
+        'bot': bot_supervisor_status(),
         'monitoring_recommendation': 'Use /ping for uptime monitoring'
     }
 
@@ -139,6 +152,89 @@ def monitoring_info():
         }
     }
 
+@app.route('/debug/search')
+def debug_search():
+    """Объяснение поиска в JSON: токены, стеммы, кандидаты по этапам, вклад полей и время этапов.
+
+    Доступно только с токеном DEBUG_TOKEN (по умолчанию PROFILE_TOKEN). Поиск выполняет
+    процесс бота на внутреннем порту метрик: health server не загружает каталог.
+    """
+    token = os.getenv('DEBUG_TOKEN') or os.getenv('PROFILE_TOKEN')
+    if not token or request.args.get('token') != token:
+        return {'error': 'Отладка поиска недоступна'}, 403
+    
+    query = request.args.get('q', '')
+    if not query:
+        return {'error': 'Параметр q обязателен'}, 400
+    
+    metrics_port = int(os.getenv('METRICS_PORT', 9464))
+    try:
+        response = requests.get(f'http://127.0.0.1:{metrics_port}/search', params={'q': query}, timeout=10)
+    except Exception as e:
+        return {'error': f'Процесс бота недоступен: {e}'}, 502
+    return response.content, response.status_code, {'Content-Type': 'application/json; charset=utf-8'}
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Сэмплирующий профиль процесса бота за seconds секунд (свернутые стеки или format=summary).
+
+    Доступен только с токеном PROFILE_TOKEN: запрос держит соединение открытым на время профилирования.
+    """
+    token = os.getenv('PROFILE_TOKEN')
+    if not token or request.args.get('token') != token:
+        return {'error': 'Профилирование недоступно'}, 403
+    
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return {'error': 'Параметр seconds должен быть числом'}, 400
+    
+    metrics_port = int(os.getenv('METRICS_PORT', 9464))
+    try:
+        response = requests.get(
+            f'http://127.0.0.1:{metrics_port}/profile',
+            params={'seconds': seconds, 'format': request.args.get('format', 'collapsed')},
+            timeout=seconds + 10,
+        )
+    except Exception as e:
+        return {'error': f'Процесс бота недоступен: {e}'}, 502
+    return response.content, response.status_code, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/metrics')
+def metrics():
+    """Метрики в формате Prometheus: собственные метрики health server и метрики процесса бота"""
+    lines = [
+        '# HELP health_uptime_seconds Время работы health server',
+        '# TYPE health_uptime_seconds gauge',
+        f'health_uptime_seconds {round(time.time() - start_time, 2)}',
+        '# HELP health_pings_total Полные health check пинги',
+        '# TYPE health_pings_total counter',
+        f'health_pings_total {monitor.ping_count}',
+        '# HELP health_last_uptimerobot_ping_timestamp_seconds Время последнего пинга UptimeRobot',
+        '# TYPE health_last_uptimerobot_ping_timestamp_seconds gauge',
+        f'health_last_uptimerobot_ping_timestamp_seconds {monitor.last_uptimerobot_ping}',
+    ]
+    
+    # Бот работает в другом процессе и отдает свои метрики на внутреннем порту
+    metrics_port = int(os.getenv('METRICS_PORT', 9464))
+    bot_up = 0
+    bot_metrics = ''
+    try:
+        response = requests.get(f'http://127.0.0.1:{metrics_port}/metrics', timeout=2)
+        if response.status_code == 200:
+            bot_up = 1
+            bot_metrics = response.text
+    except Exception as e:
+        print(f"⚠️ Bot metrics unavailable: {e}")
+    
+    lines.extend([
+        '# HELP bot_metrics_up Доступны ли метрики процесса бота',
+        '# TYPE bot_metrics_up gauge',
+        f'bot_metrics_up {bot_up}',
+    ])
+    body = '\n'.join(lines) + '\n' + bot_metrics
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 def background_activities():
     """Фоновые активности для поддержания работы"""
     while True:
@@ -171,6 +267,8 @@ def run_health_server():
     print(f"   • http://0.0.0.0:{port}/health         📊 Полный health check")
     print(f"   • http://0.0.0.0:{port}/status         ℹ️  Расширенный статус")
     print(f"   • http://0.0.0.0:{port}/monitoring     🔧 Инфо для мониторинга")
+    print(f"   • http://0.0.0.0:{port}/debug/search?q=...&token=... 🔍 Объяснение поиска")
+    print(f"   • http://0.0.0.0:{port}/metrics        📈 Метрики Prometheus")
     
     # Запускаем фоновые активности
     bg_thread = threading.Thread(target=background_activities, daemon=True)
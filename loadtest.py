@@ -0,0 +1,285 @@
+"""Нагрузочный тест бота без обращения к Telegram.
+
+Поднимает локальный Fake Bot API (fake_bot_api.py) и подает боту поток
+обновлений с заданной частотой: поисковые запросы, нажатия show_<код>,
+/list и /pdf в заданной пропорции. Для каждого обновления измеряется время
+до первого ответа бота в чат, в конце печатается пропускная способность и
+перцентили задержки.
+
+Режимы:
+    python loadtest.py --rate 20 --duration 30
+        бот из create_application() запускается в этом же процессе
+        (во временном рабочем каталоге, чтобы не трогать боевую базу);
+    python loadtest.py --external --port 8081
+        только Fake Bot API и генератор нагрузки; бот запускается отдельно
+        с TELEGRAM_API_URL=http://127.0.0.1:8081 (в том числе BOT_MODE=webhook).
+
+Код возврата 1, если часть обновлений осталась без ответа или p95 выше --max-p95-ms.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from fake_bot_api import FakeBotAPI
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TRAFFIC_KINDS = ('search', 'show', 'list', 'pdf')
+DEFAULT_MIX = 'search=60,show=25,list=10,pdf=5'
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """'search=60,show=25' -> [('search', 60.0), ('show', 25.0)]"""
+    weights = []
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in TRAFFIC_KINDS:
+            raise ValueError(f"Неизвестный вид трафика '{kind}', доступны: {', '.join(TRAFFIC_KINDS)}")
+        weights.append((kind, float(weight or 1)))
+    return weights
+
+
+def load_queries(rng: random.Random) -> Tuple[List[str], List[str]]:
+    """Поисковые запросы по каталогу (названия, фрагменты ключевых слов, опечатки) и коды процессов"""
+    with open(os.path.join(REPO_DIR, 'data', 'processes.json'), 'r', encoding='utf-8') as f:
+        processes = json.load(f)
+
+    queries = []
+    for process in processes:
+        queries.append(process['process_name'])
+        words = (process.get('keywords') or '').split()
+        if len(words) >= 2:
+            start = rng.randrange(len(words) - 1)
+            queries.append(' '.join(words[start:start + rng.choice((1, 2, 3))]))
+
+    # Часть запросов с опечаткой: переставленные соседние буквы
+    for query in rng.sample(queries, len(queries) // 10):
+        word = max(query.split(), key=len)
+        if len(word) > 3:
+            i = rng.randrange(len(word) - 1)
+            queries.append(query.replace(word, word[:i] + word[i + 1] + word[i] + word[i + 2:]))
+
+    return queries, [process['process_id'] for process in processes]
+
+
+class TrafficGenerator:
+    """Собирает сырые обновления Telegram для заданной смеси трафика"""
+
+    def __init__(self, mix: List[Tuple[str, float]], users: int, seed: int):
+        self.rng = random.Random(seed)
+        self.kinds = [kind for kind, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.users = [100000 + i for i in range(users)]
+        self.queries, self.process_ids = load_queries(self.rng)
+        self._update_id = 0
+        self._message_id = 0
+
+    def _user(self, chat_id: int) -> Dict[str, Any]:
+        return {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}"}
+
+    def _message(self, chat_id: int, text: str, from_bot: bool = False) -> Dict[str, Any]:
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'LoadTest'} if from_bot else self._user(chat_id),
+            'text': text,
+        }
+        if text.startswith('/') and not from_bot:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    def next_update(self, busy_chats) -> Tuple[Dict[str, Any], int, str]:
+        """Следующее обновление: (update, chat_id, вид трафика); занятые чаты пропускаются"""
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        chat_id = self.rng.choice(self.users)
+        if chat_id in busy_chats:
+            # Один ответ на чат за раз, иначе задержки разных обновлений не различить
+            chat_id = next((user for user in self.users if user not in busy_chats), None)
+            if chat_id is None:
+                chat_id = self.users[-1] + 1
+                self.users.append(chat_id)
+
+        self._update_id += 1
+        update: Dict[str, Any] = {'update_id': self._update_id}
+        if kind == 'search':
+            update['message'] = self._message(chat_id, self.rng.choice(self.queries))
+        elif kind == 'show':
+            update['callback_query'] = {
+                'id': str(self._update_id),
+                'from': self._user(chat_id),
+                'chat_instance': str(chat_id),
+                'data': f"show_{self.rng.choice(self.process_ids)}",
+                'message': self._message(chat_id, 'Результаты поиска', from_bot=True),
+            }
+        else:
+            update['message'] = self._message(chat_id, f"/{kind}")
+        return update, chat_id, kind
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+async def run_traffic(api: FakeBotAPI, generator: TrafficGenerator, rate: float, duration: float, drain_timeout: float) -> Dict[str, Any]:
+    """Подает обновления с частотой rate в течение duration секунд и ждет ответов"""
+    loop = asyncio.get_running_loop()
+    total = int(rate * duration)
+    sent: Counter = Counter()
+
+    started = loop.time()
+    for n in range(total):
+        delay = started + n / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update, chat_id, kind = generator.next_update(api.pending_chats())
+        api.push_update(update, chat_id, kind)
+        sent[kind] += 1
+    sending_time = loop.time() - started
+
+    drain_started = loop.time()
+    while api.pending_chats() and loop.time() - drain_started < drain_timeout:
+        await asyncio.sleep(0.05)
+    elapsed = loop.time() - started
+
+    by_kind: Dict[str, List[float]] = {}
+    for kind, latency in api.latencies:
+        by_kind.setdefault(kind, []).append(latency * 1000)
+    all_latencies = [latency for values in by_kind.values() for latency in values]
+
+    def stats(values: List[float]) -> Dict[str, float]:
+        return {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 0.50), 1),
+            'p95_ms': round(percentile(values, 0.95), 1),
+            'p99_ms': round(percentile(values, 0.99), 1),
+            'max_ms': round(max(values), 1) if values else 0.0,
+        }
+
+    return {
+        'sent': sum(sent.values()),
+        'sent_by_kind': dict(sent),
+        'answered': len(all_latencies),
+        'unanswered': dict(api.unanswered()),
+        'offered_rate': round(total / sending_time, 2) if sending_time else 0.0,
+        'throughput': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'elapsed_s': round(elapsed, 2),
+        'latency': stats(all_latencies),
+        'latency_by_kind': {kind: stats(values) for kind, values in sorted(by_kind.items())},
+        'api_calls': dict(api.calls.most_common()),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print("=" * 60)
+    print(f"📊 Отправлено {report['sent']} обновлений ({report['offered_rate']}/с), "
+          f"ответов {report['answered']} за {report['elapsed_s']} с")
+    print(f"🚀 Пропускная способность: {report['throughput']} ответов/с")
+    if report['unanswered']:
+        print(f"⚠️ Без ответа: {report['unanswered']}")
+    print(f"{'вид':<8}{'кол-во':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (мс)")
+    rows = list(report['latency_by_kind'].items()) + [('всего', report['latency'])]
+    for kind, stats in rows:
+        print(f"{kind:<8}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"📨 Вызовы Bot API: {report['api_calls']}")
+    print("=" * 60)
+
+
+def prepare_workdir() -> str:
+    """Временный рабочий каталог: база, журналы и состояния бота не смешиваются с боевыми"""
+    workdir = tempfile.mkdtemp(prefix='bot-loadtest-')
+    os.makedirs(os.path.join(workdir, 'data'))
+    for name in ('processes.json', 'synonyms.json'):
+        source = os.path.join(REPO_DIR, 'data', name)
+        if os.path.exists(source):
+            shutil.copy(source, os.path.join(workdir, 'data', name))
+    os.chdir(workdir)
+    return workdir
+
+
+async def run_in_process(api: FakeBotAPI, run_load):
+    """Запускает бота в этом процессе с опросом Fake Bot API"""
+    os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+    import bot
+
+    bot.init_database()
+    application = bot.create_application(api_url=api.url)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10)
+    try:
+        return await run_load()
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+
+async def main_async(args) -> Dict[str, Any]:
+    generator = TrafficGenerator(parse_mix(args.mix), args.users, args.seed)
+    api = FakeBotAPI(args.host, args.port)
+    await api.start()
+
+    async def run_load():
+        print("⏳ Ожидание подключения бота к Fake Bot API...")
+        await asyncio.wait_for(api.ready.wait(), args.connect_timeout)
+        print(f"🚦 Нагрузка: {args.rate}/с в течение {args.duration} с, смесь {args.mix}")
+        return await run_traffic(api, generator, args.rate, args.duration, args.drain_timeout)
+
+    try:
+        if args.external:
+            return await run_load()
+        return await run_in_process(api, run_load)
+    finally:
+        await api.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на локальном Fake Bot API')
+    parser.add_argument('--rate', type=float, default=10, help='обновлений в секунду')
+    parser.add_argument('--duration', type=float, default=30, help='длительность подачи нагрузки, с')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"смесь трафика (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument('--users', type=int, default=500, help='число пользователей')
+    parser.add_argument('--seed', type=int, default=1, help='зерно генератора запросов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--external', action='store_true', help='бот запущен отдельно с TELEGRAM_API_URL')
+    parser.add_argument('--connect-timeout', type=float, default=60, help='сколько ждать подключения бота, с')
+    parser.add_argument('--drain-timeout', type=float, default=30, help='сколько ждать ответов после подачи нагрузки, с')
+    parser.add_argument('--max-p95-ms', type=float, help='порог p95 задержки для CI')
+    parser.add_argument('--json', help='куда сохранить отчет в JSON')
+    args = parser.parse_args(argv)
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    if not args.external:
+        print(f"📂 Рабочий каталог теста: {prepare_workdir()}")
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = bool(report['unanswered'])
+    if args.max_p95_ms is not None and report['latency']['p95_ms'] > args.max_p95_ms:
+        print(f"❌ p95 {report['latency']['p95_ms']} мс выше порога {args.max_p95_ms} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
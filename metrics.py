@@ -0,0 +1,252 @@
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+# Внутренний порт метрик бота; наружу метрики отдает health server на /metrics
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9464))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Счетчик, который только растет (например, число запросов к базе)"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, label_values)} {value}"
+
+
+class Histogram:
+    """Гистограмма длительностей в формате Prometheus (накопительные корзины, sum и count)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # [счетчики по корзинам..., сумма, количество]
+                state = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, *label_values):
+        """Контекстный менеджер для замера длительности блока кода"""
+        return _Timer(self, label_values)
+
+    def render(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for label_values, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state):
+                labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, label_values)} {state[-2]}"
+            yield f"{self.name}_count{_format_labels(self.label_names, label_values)} {state[-1]}"
+
+
+class CallbackMetric:
+    """Метрика, значение которой считывается в момент запроса (глубина очереди, статистика кэша)"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Sequence[str], callback: Callable[[], Dict[Tuple, float]]):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.callback = callback
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception:
+            return
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, label_values)} {value}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: Tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, callback: Callable[[], Dict[Tuple, float]], label_names: Sequence[str] = (), kind: str = 'gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, kind, label_names, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Глобальный реестр и метрики горячих путей бота
+registry = MetricsRegistry()
+
+handler_duration = registry.histogram(
+    'bot_handler_duration_seconds', 'Время обработки апдейта обработчиком', ['handler'])
+handler_errors = registry.counter(
+    'bot_handler_errors_total', 'Необработанные исключения в обработчиках', ['handler'])
+search_stage_duration = registry.histogram(
+    'bot_search_stage_seconds', 'Время этапов поиска процессов', ['stage'], FAST_BUCKETS)
+cache_requests = registry.counter(
+    'bot_cache_requests_total', 'Обращения к кэшам в памяти', ['cache', 'result'])
+db_queries = registry.counter(
+    'bot_db_queries_total', 'Операции с SQLite', ['operation'])
+db_query_duration = registry.histogram(
+    'bot_db_query_duration_seconds', 'Длительность операций с SQLite', ['operation'], FAST_BUCKETS)
+telegram_api_duration = registry.histogram(
+    'bot_telegram_api_duration_seconds', 'Длительность вызовов Telegram Bot API', ['method'])
+telegram_api_errors = registry.counter(
+    'bot_telegram_api_errors_total', 'Ошибки вызовов Telegram Bot API', ['method'])
+
+
+def timed_handler(name: str):
+    """Декоратор асинхронного обработчика: пишет его длительность и ошибки в метрики"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                handler_duration.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+
+def timed_db(operation: str):
+    """Декоратор метода базы данных: считает операции и их длительность"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                db_queries.inc(operation)
+                db_query_duration.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+
+# Дополнительные служебные эндпоинты внутреннего сервера: путь -> функция(параметры запроса) -> (код, тип, тело)
+_endpoints: Dict[str, Callable[[Dict[str, List[str]]], Tuple[int, str, bytes]]] = {}
+
+
+def register_endpoint(path: str, handler: Callable[[Dict[str, List[str]]], Tuple[int, str, bytes]]):
+    """Добавляет эндпоинт во внутренний сервер метрик (доступен только с localhost)"""
+    _endpoints[path] = handler
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/metrics':
+            status, content_type, body = 200, 'text/plain; version=0.0.4; charset=utf-8', registry.render().encode('utf-8')
+        elif path in _endpoints:
+            status, content_type, body = _endpoints[path](parse_qs(query))
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засоряем логи запросами скрейпера
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Запускает внутренний HTTP-сервер метрик на localhost (повторный вызов ничего не делает)"""
+    global _server
+    if _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer(('127.0.0.1', port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"❌ Не удалось запустить сервер метрик на порту {port}: {e}")
+        return None
+    thread = threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    print(f"📈 Metrics server started on 127.0.0.1:{port}/metrics")
+    return _server
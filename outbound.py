@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Тяжелые загрузки файлов пропускают вперед короткие ответы на поиск
+DOCUMENT_ENDPOINTS = frozenset([
+    'sendDocument', 'sendPhoto', 'sendVideo', 'sendAudio', 'sendVoice', 'sendAnimation', 'sendMediaGroup',
+])
+
+PRIORITY_HIGH = 'high'
+PRIORITY_LOW = 'low'
+
+
+class _Bucket:
+    """Корзина токенов, которая умеет сказать, сколько ждать до нужного числа токенов"""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def delay(self, now: float, need: float = 1) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """Единая точка исходящих запросов к Bot API.
+
+    Все вызовы бота (reply_text, send_document и т.д.) проходят через
+    process_request. Запросы с chat_id выравниваются под общий лимит Telegram
+    и лимит на чат (личные чаты и группы отдельно), а отправка файлов не может
+    занять резерв общего лимита, оставленный для текстовых ответов. При 429
+    все исходящие запросы ставятся на паузу retry_after, а запрос повторяется.
+    rate_limit_args (int) переопределяет число повторов для отдельного вызова.
+    """
+
+    def __init__(
+        self,
+        overall_per_second: float = 30,
+        private_per_second: float = 1,
+        private_burst: float = 3,
+        group_per_minute: float = 20,
+        group_burst: float = 3,
+        document_reserve: float = 5,
+        max_retries: int = 3,
+        idle_ttl: float = 3600,
+    ):
+        self.overall_per_second = overall_per_second
+        self.private_per_second = private_per_second
+        self.private_burst = private_burst
+        self.group_per_minute = group_per_minute
+        self.group_burst = group_burst
+        self.document_reserve = document_reserve
+        self.max_retries = max_retries
+        self.idle_ttl = idle_ttl
+        self._overall: Optional[_Bucket] = None
+        self._chats: Dict[Union[int, str], _Bucket] = {}
+        self._waiting = {PRIORITY_HIGH: 0, PRIORITY_LOW: 0}
+        self._paused_until = 0.0
+        self._last_cleanup = 0.0
+
+    async def initialize(self) -> None:
+        now = asyncio.get_running_loop().time()
+        self._overall = _Bucket(self.overall_per_second, self.overall_per_second, now)
+        self._last_cleanup = now
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def waiting(self) -> Dict[str, int]:
+        """Количество запросов, ожидающих отправки, по приоритетам"""
+        return dict(self._waiting)
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Строковый chat_id (@username) бывает только у каналов и супергрупп
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = _Bucket(self.group_burst, self.group_per_minute / 60.0, now)
+            else:
+                bucket = _Bucket(self.private_burst, self.private_per_second, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _cleanup(self, now: float):
+        """Удаляет корзины чатов, в которые давно ничего не отправлялось"""
+        stale = [chat_id for chat_id, bucket in self._chats.items() if now - bucket.updated > self.idle_ttl]
+        for chat_id in stale:
+            del self._chats[chat_id]
+        self._last_cleanup = now
+
+    def _try_acquire(self, chat_id: Optional[Union[int, str]], priority: str, now: float) -> float:
+        """Занимает слот отправки; возвращает 0 при успехе или сколько подождать"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if chat_id is None:
+            return 0.0
+
+        # Файлы не трогают резерв общего лимита, поэтому текстовые ответы не встают за ними в очередь
+        need = 1 + (self.document_reserve if priority == PRIORITY_LOW else 0)
+        chat_bucket = self._chat_bucket(chat_id, now)
+        delay = max(self._overall.delay(now, need), chat_bucket.delay(now))
+        if delay:
+            return delay
+
+        self._overall.tokens -= 1
+        chat_bucket.tokens -= 1
+        return 0.0
+
+    async def _acquire(self, chat_id: Optional[Union[int, str]], priority: str):
+        loop = asyncio.get_running_loop()
+        self._waiting[priority] += 1
+        try:
+            while True:
+                now = loop.time()
+                if now - self._last_cleanup > self.idle_ttl:
+                    self._cleanup(now)
+                delay = self._try_acquire(chat_id, priority, now)
+                if not delay:
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting[priority] -= 1
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get('chat_id')
+        if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+            chat_id = int(chat_id)
+        priority = PRIORITY_LOW if endpoint in DOCUMENT_ENDPOINTS else PRIORITY_HIGH
+        max_retries = rate_limit_args if rate_limit_args is not None else self.max_retries
+
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                pause = e.retry_after + 0.1
+                loop = asyncio.get_running_loop()
+                self._paused_until = max(self._paused_until, loop.time() + pause)
+                logger.warning(f"Telegram flood control на {endpoint}: пауза {pause:.1f} с, повтор {attempt}/{max_retries}")
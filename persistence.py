@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+from telegram.ext import BasePersistence, PersistenceInput
+from config import USER_STATE_TTL, USER_STATE_UPDATE_INTERVAL
+from database import db, Database
+from write_behind import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence[Dict[str, Any], Dict[str, Any], Dict[str, Any]]):
+    """Хранение context.user_data в SQLite, чтобы состояние диалога переживало перезапуск.
+
+    Приложение раз в update_interval секунд передает сюда данные пользователей,
+    от которых приходили обновления. Данные сериализуются в JSON и ставятся в
+    очередь фоновой записи только если изменились с прошлого раза, поэтому
+    обычный поиск не пишет в базу ничего. Состояние, которое не менялось
+    дольше ttl секунд (например, забытое ожидание пожелания), сбрасывается.
+    chat_data, bot_data и данные кнопок не сохраняются.
+    """
+
+    def __init__(self, database: Database, ttl: float = USER_STATE_TTL,
+                 update_interval: float = USER_STATE_UPDATE_INTERVAL, flush_interval: float = 2.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.database = database
+        self.ttl = ttl
+        self.writer = BatchWriter('user_state', database.save_user_states_batch, flush_interval)
+        # Последнее записанное состояние (JSON) и время его изменения по пользователям
+        self._saved: Dict[int, str] = {}
+        self._updated_at: Dict[int, float] = {}
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # Данные предыдущего запуска могли еще стоять в очереди записи
+        await asyncio.to_thread(self.writer.flush)
+        states = await asyncio.to_thread(self.database.load_user_states, self.ttl)
+
+        user_data = {}
+        self._saved = {}
+        self._updated_at = {}
+        for user_id, (data, updated_at) in states.items():
+            try:
+                user_data[user_id] = json.loads(data)
+            except ValueError:
+                logger.error(f"Поврежденное состояние пользователя {user_id}, пропускаем")
+                continue
+            self._saved[user_id] = data
+            self._updated_at[user_id] = updated_at
+
+        print(f"✅ Восстановлено состояний пользователей: {len(user_data)}")
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        try:
+            serialized = json.dumps(data, ensure_ascii=False, sort_keys=True) if data else None
+        except (TypeError, ValueError) as e:
+            logger.error(f"Состояние пользователя {user_id} не сериализуется в JSON: {e}")
+            return
+
+        # Обновления без изменений состояния в базу не попадают
+        if self._saved.get(user_id) == serialized:
+            return
+
+        now = time.time()
+        if serialized is None:
+            self._saved.pop(user_id, None)
+            self._updated_at.pop(user_id, None)
+        else:
+            self._saved[user_id] = serialized
+            self._updated_at[user_id] = now
+        self.writer.enqueue((user_id, serialized, now))
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        # Устаревшее состояние очищается перед обработкой обновления, удаление запишется при следующей передаче
+        updated_at = self._updated_at.get(user_id)
+        if user_data and updated_at is not None and time.time() - updated_at > self.ttl:
+            user_data.clear()
+            self._updated_at.pop(user_id, None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._saved.pop(user_id, None)
+        self._updated_at.pop(user_id, None)
+        self.writer.enqueue((user_id, None, time.time()))
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self.writer.flush)
+
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state: Optional[object]) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+
+
+# Глобальное хранилище состояний (одно на все перезапуски приложения)
+user_state_persistence = SQLitePersistence(db)
@@ -0,0 +1,264 @@
+"""Схемы отдельных процессов: страницы общего PDF маленькими файлами.
+
+Сборка (python process_pages.py) один раз проходит по PDF со всеми
+процессами, находит страницы каждого процесса по закладкам (оглавлению) PDF,
+а если закладок нет - по коду процесса в начале текста страницы, и
+сохраняет для каждого процесса отдельный PDF с его страницами и индекс
+process_id -> диапазон страниц. Для сборки нужен pypdf, боту он не нужен:
+бот только читает индекс и готовые файлы.
+
+Telegram хранит отправленные файлы сам: file_id, полученный при первой
+отправке выдержки, сохраняется в базе, и дальше файл отправляется по
+file_id без загрузки. Ключ включает хэш выдержки, поэтому после пересборки
+измененная выдержка загрузится заново.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from text_normalizer import normalize_process_id
+
+PROCESSES_PDF = 'Бизнес-процессы Ozon ООО Технологии упаковки.pdf'
+PROCESSES_FILE = 'data/processes.json'
+PAGE_INDEX_FILE = os.getenv('PROCESS_PAGE_INDEX', 'data/process_pages.json')
+EXTRACTS_DIR = os.getenv('PROCESS_EXTRACTS_DIR', 'data/process_pdf')
+
+# Код процесса в начале заголовка или страницы; "В" бывает кириллической
+_CODE_RE = re.compile(r'^\W*([BbВв]\s?\d+(?:\.\d+)+)')
+
+# Сколько символов с начала страницы просматривать в поисках кода процесса
+PAGE_HEAD_CHARS = 200
+
+# Префикс параметра /start для ссылки на процесс: t.me/<бот>?start=p_B1_5_1
+DEEP_LINK_PREFIX = 'p_'
+
+
+def deep_link_payload(process_id: str) -> str:
+    """Параметр /start для процесса (в нем допустимы только буквы, цифры, _ и -)"""
+    return DEEP_LINK_PREFIX + process_id.replace('.', '_')
+
+
+def parse_deep_link_payload(payload: str) -> Optional[str]:
+    """p_B1_5_1 -> B1.5.1 (None, если это не ссылка на процесс)"""
+    if not payload or not payload.startswith(DEEP_LINK_PREFIX):
+        return None
+    return normalize_process_id(payload[len(DEEP_LINK_PREFIX):].replace('_', '.'))
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _match_code(text: str, known_ids) -> Optional[str]:
+    match = _CODE_RE.match(text or '')
+    if not match:
+        return None
+    process_id = normalize_process_id(match.group(1))
+    return process_id if process_id in known_ids else None
+
+
+def _outline_starts(reader, known_ids) -> List[Tuple[int, Optional[str]]]:
+    """Закладки PDF: (страница, код процесса или None для прочих разделов)"""
+    starts = []
+
+    def walk(items):
+        for item in items:
+            if isinstance(item, list):
+                walk(item)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            if page is not None and page >= 0:
+                starts.append((page, _match_code(item.title, known_ids)))
+
+    walk(reader.outline)
+    return starts
+
+
+def _text_starts(reader, known_ids) -> List[Tuple[int, Optional[str]]]:
+    """Без закладок: процесс начинается на странице, где его код стоит в начале текста"""
+    starts = []
+    for page_number, page in enumerate(reader.pages):
+        try:
+            head = (page.extract_text() or '').strip()[:PAGE_HEAD_CHARS]
+        except Exception:
+            continue
+        process_id = _match_code(head, known_ids)
+        if process_id:
+            starts.append((page_number, process_id))
+    return starts
+
+
+def find_page_ranges(reader, known_ids) -> Dict[str, Tuple[int, int]]:
+    """process_id -> (первая, последняя страница), страницы с нуля.
+
+    Процесс длится до начала следующего раздела (закладки любого раздела или
+    следующего процесса): у подпроцесса свои страницы, у родителя - только
+    страницы до первого подпроцесса.
+    """
+    starts = _outline_starts(reader, known_ids)
+    if not any(process_id for _, process_id in starts):
+        starts = _text_starts(reader, known_ids)
+
+    starts.sort(key=lambda start: start[0])
+    page_count = len(reader.pages)
+    ranges = {}
+    for i, (first_page, process_id) in enumerate(starts):
+        if process_id is None or process_id in ranges:
+            continue
+        # Процесс заканчивается перед следующим разделом; подпроцесс на той же странице делит ее с родителем
+        next_page = starts[i + 1][0] if i + 1 < len(starts) else page_count
+        ranges[process_id] = (first_page, max(first_page, next_page - 1))
+    return ranges
+
+
+def build_extracts(pdf_path: str = PROCESSES_PDF, processes_file: str = PROCESSES_FILE,
+                   index_path: str = PAGE_INDEX_FILE, extracts_dir: str = EXTRACTS_DIR) -> bool:
+    """Собирает выдержки по процессам и индекс страниц"""
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        print("❌ Для сборки выдержек нужен pypdf: pip install pypdf")
+        return False
+
+    if not os.path.exists(pdf_path):
+        # Без общего PDF бот просто не показывает кнопку схемы
+        print(f"⚠️ {pdf_path} не найден, выдержки по процессам не собраны")
+        return True
+
+    try:
+        with open(processes_file, 'r', encoding='utf-8') as f:
+            names = {process['process_id']: process['process_name'] for process in json.load(f)}
+
+        reader = PdfReader(pdf_path)
+        ranges = find_page_ranges(reader, set(names))
+        os.makedirs(extracts_dir, exist_ok=True)
+
+        processes = {}
+        for process_id, (first_page, last_page) in sorted(ranges.items()):
+            writer = PdfWriter()
+            for page_number in range(first_page, last_page + 1):
+                writer.add_page(reader.pages[page_number])
+            writer.add_metadata({'/Title': f"{process_id} {names[process_id]}"})
+            filename = f"{process_id}.pdf"
+            path = os.path.join(extracts_dir, filename)
+            with open(path, 'wb') as f:
+                writer.write(f)
+            processes[process_id] = {
+                'first_page': first_page + 1,
+                'last_page': last_page + 1,
+                'file': filename,
+                'size': os.path.getsize(path),
+                'sha256': _file_sha256(path),
+            }
+
+        index = {
+            'source_sha256': _file_sha256(pdf_path),
+            'built_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'processes': processes,
+        }
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, index_path)
+
+        missing = sorted(set(names) - set(processes))
+        total_size = sum(process['size'] for process in processes.values())
+        print(f"✅ Выдержки собраны: {len(processes)} процессов, {total_size // 1024} КБ "
+              f"(общий PDF {os.path.getsize(pdf_path) // 1024} КБ)")
+        if missing:
+            print(f"⚠️ Не найдены страницы процессов: {', '.join(missing)}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка при сборке выдержек: {e}")
+        return False
+
+
+class ProcessExtract:
+    """Готовая выдержка одного процесса"""
+
+    __slots__ = ('process_id', 'first_page', 'last_page', 'path', 'sha256')
+
+    def __init__(self, process_id: str, first_page: int, last_page: int, path: str, sha256: str):
+        self.process_id = process_id
+        self.first_page = first_page
+        self.last_page = last_page
+        self.path = path
+        self.sha256 = sha256
+
+    @property
+    def file_key(self) -> str:
+        """Ключ file_id в базе: процесс и содержимое файла"""
+        return f"process_pdf:{self.process_id}:{self.sha256[:16]}"
+
+    @property
+    def pages(self) -> str:
+        if self.first_page == self.last_page:
+            return f"стр. {self.first_page}"
+        return f"стр. {self.first_page}-{self.last_page}"
+
+
+class ProcessPages:
+    """Индекс выдержек и кэш file_id отправленных файлов"""
+
+    def __init__(self, database, index_path: str = PAGE_INDEX_FILE, extracts_dir: str = EXTRACTS_DIR):
+        self.database = database
+        self.index_path = index_path
+        self.extracts_dir = extracts_dir
+        self._extracts: Optional[Dict[str, ProcessExtract]] = None
+        self._file_ids: Dict[str, str] = {}
+
+    def _load(self) -> Dict[str, ProcessExtract]:
+        extracts = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            for process_id, entry in index['processes'].items():
+                path = os.path.join(self.extracts_dir, entry['file'])
+                if os.path.exists(path):
+                    extracts[process_id] = ProcessExtract(process_id, entry['first_page'], entry['last_page'], path, entry['sha256'])
+            print(f"✅ Выдержки по процессам: {len(extracts)}")
+        except FileNotFoundError:
+            print(f"⚠️ Индекс выдержек {self.index_path} не найден, схемы процессов недоступны")
+        except Exception as e:
+            print(f"❌ Ошибка при загрузке индекса выдержек: {e}")
+        return extracts
+
+    def get(self, process_id: str) -> Optional[ProcessExtract]:
+        if self._extracts is None:
+            self._extracts = self._load()
+        return self._extracts.get(process_id)
+
+    def file_id(self, extract: ProcessExtract) -> Optional[str]:
+        """file_id ранее отправленной выдержки (None - файл нужно загрузить)"""
+        file_id = self._file_ids.get(extract.file_key)
+        if file_id is None:
+            file_id = self.database.get_telegram_file_id(extract.file_key)
+            if file_id:
+                self._file_ids[extract.file_key] = file_id
+        return file_id
+
+    def remember_file_id(self, extract: ProcessExtract, file_id: str):
+        if self._file_ids.get(extract.file_key) == file_id:
+            return
+        self._file_ids[extract.file_key] = file_id
+        self.database.save_telegram_file_id(extract.file_key, file_id)
+
+    def forget_file_id(self, extract: ProcessExtract):
+        """file_id больше не принимается Telegram (например, сменился токен бота)"""
+        self._file_ids.pop(extract.file_key, None)
+        self.database.delete_telegram_file_id(extract.file_key)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if build_extracts(*sys.argv[1:2]) else 1)
@@ -0,0 +1,208 @@
+"""Профилирование бота по команде администратора.
+
+Пока сеанс не запущен, профилировщик ничего не делает: нет ни потоков, ни
+хуков трассировки. Поддерживаются два режима:
+
+- sample - отдельный поток раз в несколько миллисекунд снимает стек
+  целевого потока (цикла событий бота) через sys._current_frames().
+  Накладные расходы не зависят от числа вызовов функций, результат -
+  свернутые стеки (collapsed stacks) для flamegraph.pl или speedscope;
+- cprofile - детерминированный cProfile в потоке цикла событий: точные
+  количества вызовов, но заметно замедляет обработку. Результат - файл
+  pstats.
+"""
+import cProfile
+import io
+import marshal
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+SAMPLE_INTERVAL = 0.005
+
+# Ограничения сеанса, чтобы забытый профилировщик не работал бесконечно
+MAX_SECONDS = 300
+MAX_UPDATES = 10000
+
+MODE_SAMPLE = 'sample'
+MODE_CPROFILE = 'cprofile'
+MODES = (MODE_SAMPLE, MODE_CPROFILE)
+
+# Верхушка стека, означающая, что цикл событий ждет ввода-вывода
+IDLE_FUNCTIONS = frozenset(['select', 'poll', 'epoll', 'kqueue', 'wait'])
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileReport:
+    """Результат сеанса: краткая сводка и файл для подробного разбора"""
+
+    def __init__(self, mode: str, duration: float, updates: int, summary: str, filename: str, data: bytes):
+        self.mode = mode
+        self.duration = duration
+        self.updates = updates
+        self.summary = summary
+        self.filename = filename
+        self.data = data
+
+
+class StackSampler:
+    """Сэмплирующий профилировщик одного потока"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            if frame.f_code.co_name in IDLE_FUNCTIONS:
+                self.idle += 1
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Свернутые стеки: "корень;...;лист количество" в строке"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 15) -> List[Tuple[str, int, int]]:
+        """Функции по собственному времени: (функция, в вершине стека, в стеке вообще)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [(label, count, total[label]) for label, count in own.most_common(limit)]
+
+    def summary(self, limit: int = 15) -> str:
+        busy = self.samples - self.idle
+        lines = [f"Сэмплов: {self.samples}, из них в ожидании ввода-вывода: {self.idle}, в работе: {busy}"]
+        for label, own, total in self.top_functions(limit):
+            share = own / busy * 100 if busy else 0
+            lines.append(f"{share:5.1f}% {own:6d} {total:6d}  {label}")
+        return '\n'.join(lines)
+
+
+class ProfileSession:
+    """Один сеанс профилирования с ограничением по времени или по числу обновлений"""
+
+    def __init__(self, mode: str, seconds: float, updates: Optional[int], thread_id: int):
+        self.mode = mode
+        self.seconds = seconds
+        self.max_updates = updates
+        self.updates = 0
+        self.started = time.monotonic()
+        self._sampler: Optional[StackSampler] = None
+        self._profile: Optional[cProfile.Profile] = None
+        if mode == MODE_SAMPLE:
+            self._sampler = StackSampler(thread_id)
+            self._sampler.start()
+        else:
+            # cProfile следит только за потоком, в котором включен, - это должен быть поток цикла событий
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def finish(self) -> ProfileReport:
+        duration = time.monotonic() - self.started
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        if self._sampler is not None:
+            self._sampler.stop()
+            return ProfileReport(self.mode, duration, self.updates, self._sampler.summary(),
+                                 f"profile-{stamp}.collapsed.txt", self._sampler.collapsed().encode('utf-8'))
+
+        self._profile.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=output)
+        stats.sort_stats('cumulative').print_stats(15)
+        # Файл .prof в том же формате, что пишет pstats.Stats.dump_stats
+        return ProfileReport(self.mode, duration, self.updates, output.getvalue(),
+                             f"profile-{stamp}.prof", marshal.dumps(stats.stats))
+
+
+class Profiler:
+    """Управляет единственным сеансом профилирования процесса"""
+
+    def __init__(self):
+        self._session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> Optional[ProfileSession]:
+        return self._session
+
+    def start(self, mode: str, seconds: float, updates: Optional[int] = None, thread_id: Optional[int] = None) -> ProfileSession:
+        """Запускает сеанс; RuntimeError, если сеанс уже идет"""
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования '{mode}', доступны: {', '.join(MODES)}")
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise ValueError("Длительность профилирования должна быть положительным числом секунд")
+        if updates is not None and updates <= 0:
+            raise ValueError("Число обновлений должно быть положительным")
+        with self._lock:
+            if self._session is not None:
+                raise RuntimeError("Профилирование уже запущено")
+            self._session = ProfileSession(
+                mode, min(seconds, MAX_SECONDS),
+                min(updates, MAX_UPDATES) if updates is not None else None,
+                thread_id or threading.get_ident(),
+            )
+            return self._session
+
+    def note_update(self) -> bool:
+        """Учитывает обновление; True, если набрано нужное число обновлений"""
+        session = self._session
+        if session is None:
+            return False
+        session.updates += 1
+        return session.max_updates is not None and session.updates >= session.max_updates
+
+    def stop(self) -> Optional[ProfileReport]:
+        """Останавливает сеанс и возвращает отчет (None, если сеанса не было)"""
+        with self._lock:
+            session, self._session = self._session, None
+        return session.finish() if session is not None else None
+
+    def sample_blocking(self, seconds: float, thread_id: int) -> ProfileReport:
+        """Сэмплирует поток seconds секунд и возвращает отчет (для HTTP-эндпоинта)"""
+        session = self.start(MODE_SAMPLE, seconds, thread_id=thread_id)
+        try:
+            time.sleep(session.seconds)
+        finally:
+            report = self.stop()
+        return report
+
+
+# Глобальный профилировщик процесса
+profiler = Profiler()
@@ -0,0 +1,75 @@
+import time
+from typing import Dict, Tuple
+
+
+class TokenBucket:
+    """Корзина токенов: capacity - допустимый всплеск, rate - токенов в секунду"""
+
+    __slots__ = ('tokens', 'updated', 'notified')
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+        # Сообщали ли пользователю о превышении лимита в текущем эпизоде
+        self.notified = False
+
+    def take(self, capacity: float, rate: float, now: float) -> bool:
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """Лимиты запросов по пользователю и чату с отдельным бюджетом на каждую категорию.
+
+    budgets: категория -> (размер всплеска, токенов в минуту). Вызывается из
+    event loop бота, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]], idle_ttl: float = 3600, cleanup_every: int = 1000):
+        self.budgets = {category: (capacity, per_minute / 60.0) for category, (capacity, per_minute) in budgets.items()}
+        self.idle_ttl = idle_ttl
+        self.cleanup_every = cleanup_every
+        self._buckets: Dict[Tuple[str, int, int], TokenBucket] = {}
+        self._calls = 0
+
+    def check(self, category: str, user_id: int, chat_id: int) -> Tuple[bool, bool]:
+        """Списывает токен и возвращает (разрешено, нужно ли сообщить о превышении).
+
+        О превышении сообщаем один раз за эпизод, чтобы ответы на спам сами не
+        превращались в поток исходящих сообщений.
+        """
+        budget = self.budgets.get(category)
+        if budget is None:
+            return True, False
+        capacity, rate = budget
+
+        now = time.monotonic()
+        self._calls += 1
+        if self._calls % self.cleanup_every == 0:
+            self._cleanup(now)
+
+        key = (category, user_id, chat_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, now)
+
+        if bucket.take(capacity, rate, now):
+            bucket.notified = False
+            return True, False
+
+        notify = not bucket.notified
+        bucket.notified = True
+        return False, notify
+
+    def _cleanup(self, now: float):
+        """Удаляет корзины давно неактивных пользователей"""
+        stale = [key for key, bucket in self._buckets.items() if now - bucket.updated > self.idle_ttl]
+        for key in stale:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
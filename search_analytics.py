@@ -0,0 +1,161 @@
+import atexit
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from database import db, Database
+from write_behind import BatchWriter
+
+
+class SearchStats:
+    """Сводная статистика поиска, которая обновляется на каждое событие без обращения к базе"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.zero_result_count = 0
+        self.latency_total_ms = 0.0
+        self.click_count = 0
+        self.clicked_queries = 0
+        self.query_counts: Counter = Counter()
+        self.zero_result_queries: Counter = Counter()
+        self.process_clicks: Counter = Counter()
+        self.click_positions: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def load(self, aggregates: Dict[str, Any]):
+        """Добавляет к статистике агрегаты, уже сохраненные в базе"""
+        with self._lock:
+            for tokens, count, zero_count, latency_total in aggregates['queries']:
+                key = tokens or ''
+                self.query_count += count
+                self.zero_result_count += zero_count or 0
+                self.latency_total_ms += latency_total or 0.0
+                self.query_counts[key] += count
+                if zero_count:
+                    self.zero_result_queries[key] += zero_count
+            for process_id, position, count in aggregates['clicks']:
+                self.click_count += count
+                self.process_clicks[process_id] += count
+                self.click_positions[position] += count
+            self.clicked_queries += aggregates['clicked_queries']
+
+    def add_query(self, key: str, result_count: int, latency_ms: float):
+        with self._lock:
+            self.query_count += 1
+            self.latency_total_ms += latency_ms
+            self.query_counts[key] += 1
+            if result_count == 0:
+                self.zero_result_count += 1
+                self.zero_result_queries[key] += 1
+
+    def add_click(self, process_id: str, position: Optional[int], first_for_query: bool):
+        with self._lock:
+            self.click_count += 1
+            self.process_clicks[process_id] += 1
+            self.click_positions[position] += 1
+            if first_for_query:
+                self.clicked_queries += 1
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """Снимок статистики для команды /stats"""
+        with self._lock:
+            return {
+                'queries': self.query_count,
+                'unique_queries': len(self.query_counts),
+                'zero_results': self.zero_result_count,
+                'avg_latency_ms': self.latency_total_ms / self.query_count if self.query_count else 0.0,
+                'clicks': self.click_count,
+                'clicked_queries': self.clicked_queries,
+                'top_queries': self.query_counts.most_common(top),
+                'top_zero_result_queries': self.zero_result_queries.most_common(top),
+                'top_processes': self.process_clicks.most_common(top),
+                'click_positions': sorted(
+                    self.click_positions.items(),
+                    key=lambda item: (item[0] is None, item[0] or 0)
+                ),
+            }
+
+
+class SearchAnalytics:
+    """Журнал поисковых запросов и нажатий на результаты.
+
+    Обработчики только обновляют статистику в памяти и кладут событие в
+    очередь, а в SQLite события пишет фоновый поток пачками. Нажатие на
+    результат связывается с последним запросом того же пользователя, чтобы
+    знать, какой по счету результат выбрали.
+    """
+
+    def __init__(self, database: Database, flush_interval: float = 5.0, max_tracked_users: int = 10000):
+        self.database = database
+        self.writer = BatchWriter('search_events', database.save_search_events_batch, flush_interval, max_batch=500)
+        self.stats = SearchStats()
+        self.max_tracked_users = max_tracked_users
+        self._last_query: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def start(self):
+        """Загружает сохраненную статистику (один раз) и запускает фоновую запись"""
+        with self._lock:
+            if not self._loaded:
+                self.stats.load(self.database.get_search_event_aggregates())
+                self._loaded = True
+        self.writer.start()
+
+    def record_query(self, user_id: int, query_text: str, query_tokens: List[str], result_ids: List[str], latency_ms: float) -> str:
+        """Регистрирует поисковый запрос и возвращает id события.
+
+        query_tokens - tokenize(query_text), уже посчитанный для поиска.
+        """
+        event_id = uuid.uuid4().hex
+        tokens = ' '.join(query_tokens)
+        self.stats.add_query(tokens, len(result_ids), latency_ms)
+
+        with self._lock:
+            self._last_query[user_id] = (event_id, tokens, result_ids, set())
+            self._last_query.move_to_end(user_id)
+            while len(self._last_query) > self.max_tracked_users:
+                self._last_query.popitem(last=False)
+
+        self.writer.enqueue((
+            event_id, 'query', self._now(), user_id, query_text, tokens,
+            ','.join(result_ids), len(result_ids), round(latency_ms, 3), None, None, None,
+        ))
+        return event_id
+
+    def record_click(self, user_id: int, process_id: str):
+        """Регистрирует нажатие на результат поиска (кнопку show_<id>)"""
+        query_event_id, position, first_for_query = None, None, False
+        with self._lock:
+            last = self._last_query.get(user_id)
+            if last is not None:
+                event_id, _, result_ids, clicked = last
+                if process_id in result_ids:
+                    query_event_id = event_id
+                    position = result_ids.index(process_id) + 1
+                    first_for_query = not clicked
+                    clicked.add(process_id)
+
+        self.stats.add_click(process_id, position, first_for_query)
+        self.writer.enqueue((
+            uuid.uuid4().hex, 'click', self._now(), user_id, None, None,
+            None, None, None, process_id, query_event_id, position,
+        ))
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    def flush(self) -> bool:
+        return self.writer.flush()
+
+    def stop(self) -> bool:
+        return self.writer.stop()
+
+
+# Глобальный журнал поиска
+search_analytics = SearchAnalytics(db)
+
+# Записываем хвост очереди и при обычном завершении интерпретатора
+atexit.register(search_analytics.stop)
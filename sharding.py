@@ -0,0 +1,187 @@
+"""Режим нескольких процессов бота за одним входящим вебхуком.
+
+Процесс-приемник слушает вебхук Telegram и раскладывает обновления по
+рабочим процессам по chat_id, поэтому обновления одного чата всегда
+обрабатывает один и тот же процесс и в том же порядке. Каждый рабочий
+процесс держит свой снимок каталога только для чтения, а пожелания
+пересылает приемнику, который единственный пишет их в базу.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def extract_chat_id(update_data: Dict[str, Any]) -> int:
+    """Находит chat_id в сыром обновлении Telegram (или id пользователя, если чата нет)"""
+    for key, value in update_data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        if 'chat' in value:
+            return value['chat']['id']
+        # callback_query: чат лежит в сообщении с кнопкой
+        message = value.get('message')
+        if isinstance(message, dict) and 'chat' in message:
+            return message['chat']['id']
+        if 'from' in value:
+            return value['from']['id']
+    return 0
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Номер рабочего процесса для чата"""
+    return chat_id % workers
+
+
+class SuggestionForwarder:
+    """Замена очереди записи пожеланий в рабочем процессе: пересылает пожелания приемнику"""
+
+    def __init__(self, suggestion_queue):
+        self.suggestion_queue = suggestion_queue
+
+    def start(self):
+        pass
+
+    def add(self, user_id: int, user_name: str, username: Optional[str], suggestion_text: str):
+        self.suggestion_queue.put((user_id, user_name, username, suggestion_text))
+
+    def qsize(self) -> int:
+        return 0
+
+    def flush(self) -> bool:
+        return True
+
+
+class WebhookIngress:
+    """Приемник вебхука и набор рабочих процессов.
+
+    worker_target(worker_id, update_queue, suggestion_queue) - точка входа
+    рабочего процесса. Процессы создаются через spawn, чтобы не наследовать
+    потоки и соединения приемника. Упавший рабочий процесс перезапускается,
+    а его очередь обновлений сохраняется.
+    """
+
+    def __init__(self, worker_target: Callable, workers: int, suggestion_writer,
+                 secret_token: str, host: str = '0.0.0.0', port: int = 8443, path: str = '/telegram'):
+        self.worker_target = worker_target
+        self.workers = max(1, workers)
+        self.suggestion_writer = suggestion_writer
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+
+        self._context = multiprocessing.get_context('spawn')
+        self._update_queues = [self._context.Queue() for _ in range(self.workers)]
+        self._suggestion_queue = self._context.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._runner: Optional[web.AppRunner] = None
+        self._stopping = threading.Event()
+        self._forward_thread: Optional[threading.Thread] = None
+        self.received = [0] * self.workers
+
+    def _start_worker(self, worker_id: int):
+        process = self._context.Process(
+            target=self.worker_target,
+            args=(worker_id, self._update_queues[worker_id], self._suggestion_queue),
+            name=f"bot-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[worker_id] = process
+        print(f"✅ Рабочий процесс #{worker_id} запущен (pid {process.pid})")
+
+    def _forward_suggestions(self):
+        """Пишет пожелания всех рабочих процессов через единственного владельца записи"""
+        while not self._stopping.is_set():
+            try:
+                entry = self._suggestion_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.suggestion_writer.add(*entry)
+            except Exception as e:
+                logger.error(f"Ошибка при записи пожелания от рабочего процесса: {e}")
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret_token:
+            return web.Response(status=403)
+        try:
+            update_data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        worker_id = shard_for(extract_chat_id(update_data), self.workers)
+        self._update_queues[worker_id].put(update_data)
+        self.received[worker_id] += 1
+        return web.Response()
+
+    def queue_depths(self) -> Dict[int, int]:
+        """Обновления, ожидающие рабочих процессов (qsize недоступен на части платформ)"""
+        depths = {}
+        for worker_id, update_queue in enumerate(self._update_queues):
+            try:
+                depths[worker_id] = update_queue.qsize()
+            except NotImplementedError:
+                depths[worker_id] = -1
+        return depths
+
+    async def start(self):
+        """Запускает рабочие процессы, пересылку пожеланий и HTTP-сервер вебхука"""
+        self._stopping.clear()
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+
+        self._forward_thread = threading.Thread(target=self._forward_suggestions, name='suggestion-forwarder', daemon=True)
+        self._forward_thread.start()
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"🌐 Webhook ingress слушает {self.host}:{self.port}{self.path}, рабочих процессов: {self.workers}")
+
+    async def serve_forever(self, check_interval: float = 5.0):
+        """Следит за рабочими процессами и перезапускает упавшие"""
+        while not self._stopping.is_set():
+            await asyncio.sleep(check_interval)
+            for worker_id, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping.is_set():
+                    print(f"⚠️ Рабочий процесс #{worker_id} завершился с кодом {process.exitcode}, перезапускаем")
+                    self._start_worker(worker_id)
+
+    async def stop(self, timeout: float = 10.0):
+        """Останавливает прием обновлений, дает рабочим процессам доработать очередь и завершает их"""
+        self._stopping.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+        # Один срок на все процессы, а не timeout на каждый
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for update_queue in self._update_queues:
+            update_queue.put(None)
+        for process in self._processes:
+            if process is not None:
+                await asyncio.to_thread(process.join, max(0.0, deadline - loop.time()))
+                if process.is_alive():
+                    # Рабочие игнорируют SIGTERM (остановкой управляет приемник), поэтому только SIGKILL
+                    print(f"⚠️ Рабочий процесс {process.pid} не завершился в срок, принудительная остановка")
+                    process.kill()
+                    await asyncio.to_thread(process.join, 1.0)
+
+        if self._forward_thread is not None:
+            self._forward_thread.join(max(0.0, deadline - loop.time()))
+        # Пожелания, которые рабочие процессы успели переслать перед остановкой
+        while True:
+            try:
+                self.suggestion_writer.add(*self._suggestion_queue.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,127 @@
+"""Корректная остановка процесса бота по SIGTERM/SIGINT.
+
+При деплое платформа присылает SIGTERM и ждет завершения несколько десятков
+секунд, после чего убивает процесс. Сигнал только отмечает запрос на
+остановку, а сама остановка идет по шагам в цикле событий: прекратить прием
+обновлений, доработать очередь обновлений и исходящие отправки в пределах
+срока, записать очереди в базу и завершить дочерние процессы.
+"""
+import asyncio
+import signal
+import subprocess
+from typing import Optional
+from telegram import Update
+
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class GracefulShutdown:
+    """Запрос на остановку и общий срок на все ее шаги"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.signum: Optional[int] = None
+        self._event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._deadline: Optional[float] = None
+        self._previous = {}
+
+    @property
+    def requested(self) -> bool:
+        return self.signum is not None
+
+    def install(self):
+        """Перехватывает сигналы остановки в текущем цикле событий"""
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._deadline = None
+        for sig in SHUTDOWN_SIGNALS:
+            self._previous[sig] = signal.getsignal(sig)
+            try:
+                self._loop.add_signal_handler(sig, self.request, sig)
+            except (NotImplementedError, RuntimeError):
+                # Windows или цикл не в главном потоке
+                signal.signal(sig, lambda signum, frame: self._loop.call_soon_threadsafe(self.request, signum))
+
+    def uninstall(self):
+        """Возвращает обработчики сигналов, которые были до install()"""
+        if self._loop is None:
+            return
+        for sig in SHUTDOWN_SIGNALS:
+            try:
+                self._loop.remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError):
+                pass
+            signal.signal(sig, self._previous.get(sig) or signal.SIG_DFL)
+        self._loop = None
+        self._event = None
+
+    def request(self, signum: int = signal.SIGTERM):
+        """Отмечает запрос на остановку; срок отсчитывается от первого сигнала"""
+        if self.requested:
+            print(f"⏳ Повторный сигнал {signum}: остановка уже идет")
+            return
+        self.signum = signum
+        print(f"🛑 Получен сигнал {signum}. Завершаем работу (не дольше {self.timeout:.0f} с)...")
+        if self._loop is not None:
+            self._deadline = self._loop.time() + self.timeout
+        if self._event is not None:
+            self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+
+    def remaining(self) -> float:
+        """Сколько секунд осталось до срока (полный срок, если остановку никто не запрашивал)"""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - asyncio.get_running_loop().time())
+
+
+async def drain_application(application, timeout: float) -> bool:
+    """Останавливает Application, дав ему доработать очередь обновлений, задачи и исходящие отправки.
+
+    Прием обновлений к этому моменту уже должен быть остановлен. Если срок
+    истек, необработанные обновления из очереди отбрасываются (Application.stop
+    завершится после текущего обновления) и возвращается False: тогда
+    application.shutdown() вызывать нельзя, процесс просто завершается.
+    """
+    # shield: при истечении срока Application.stop продолжает работу, но мы его больше не ждем
+    stopping = asyncio.ensure_future(application.stop())
+    try:
+        await asyncio.wait_for(asyncio.shield(stopping), timeout)
+        return True
+    except asyncio.TimeoutError:
+        pass
+
+    # В очереди кроме обновлений лежит сигнал остановки, он возвращается обратно
+    dropped, keep = 0, []
+    while not application.update_queue.empty():
+        item = application.update_queue.get_nowait()
+        if isinstance(item, Update):
+            dropped += 1
+            application.update_queue.task_done()
+        else:
+            keep.append(item)
+    for item in keep:
+        application.update_queue.put_nowait(item)
+        application.update_queue.task_done()
+
+    rate_limiter = application.bot.rate_limiter
+    waiting = sum(rate_limiter.waiting().values()) if hasattr(rate_limiter, 'waiting') else 0
+    print(f"⚠️ Не уложились в срок остановки: отброшено обновлений {dropped}, "
+          f"исходящих запросов ждут отправки {waiting}")
+    return False
+
+
+def terminate_process(process: Optional[subprocess.Popen], timeout: float = 5.0):
+    """Завершает дочерний процесс: сначала SIGTERM, затем SIGKILL"""
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    print(f"✅ Дочерний процесс {process.pid} завершен")
@@ -0,0 +1,84 @@
+from typing import Dict, List, Set
+
+# Короткие слова исправляем не больше чем на одну букву, иначе подсказки превращаются в шум
+SHORT_WORD_LENGTH = 5
+MAX_DISTANCE = 2
+MIN_WORD_LENGTH = 3
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """Все варианты слова с удаленными не более чем distance буквами"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        result |= frontier
+    return result
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв); limit + 1, если больше limit"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+
+    previous_previous = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = 0 if first[i - 1] == second[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    """Словарь слов каталога для подсказок "возможно, вы имели в виду".
+
+    Для каждого слова заранее строятся варианты с удаленными буквами
+    (как в SymSpell), поэтому поиск ближайших слов не перебирает весь
+    словарь: достаточно сгенерировать удаления для слова запроса и
+    проверить точным расстоянием только найденных кандидатов.
+    """
+
+    def __init__(self, frequencies: Dict[str, int]):
+        self.frequencies = {word: count for word, count in frequencies.items() if len(word) >= MIN_WORD_LENGTH}
+        self._deletes: Dict[str, List[str]] = {}
+        for word in self.frequencies:
+            for variant in _deletes(word, self._max_distance(word)):
+                self._deletes.setdefault(variant, []).append(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.frequencies
+
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+    @staticmethod
+    def _max_distance(word: str) -> int:
+        return 1 if len(word) <= SHORT_WORD_LENGTH else MAX_DISTANCE
+
+    def candidates(self, word: str, limit: int = 3) -> List[str]:
+        """Ближайшие слова словаря: сначала по расстоянию, затем по частоте в каталоге"""
+        if len(word) < MIN_WORD_LENGTH or word.isdigit():
+            return []
+
+        max_distance = self._max_distance(word)
+        seen = set()
+        scored = []
+        for variant in _deletes(word, max_distance):
+            for candidate in self._deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    scored.append((distance, -self.frequencies[candidate], candidate))
+
+        scored.sort()
+        return [candidate for _, _, candidate in scored[:limit]]
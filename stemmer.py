@@ -0,0 +1,264 @@
+import os
+import sys
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Tuple
+
+try:
+    import snowballstemmer
+except ImportError:  # Библиотека необязательна: без нее работает эвристический стеммер
+    snowballstemmer = None
+
+# Какой стеммер использовать: snowball (по умолчанию) или heuristic
+STEMMER_BACKEND = os.getenv('STEMMER_BACKEND', 'snowball')
+
+# Размер кэша основ на каждое слово
+STEM_CACHE_SIZE = int(os.getenv('STEM_CACHE_SIZE', 10000))
+
+# Улучшенная обработка множественного числа
+PLURAL_ENDINGS = [
+    # Множественное число существительных
+    ('ов', ''), ('ев', ''), ('ей', ''), ('ий', 'ий'), ('ые', 'ый'), ('ие', 'ий'),
+    ('ам', ''), ('ям', ''), ('ами', ''), ('ями', ''), ('ах', ''), ('ях', ''),
+    # Родительный падеж и другие окончания
+    ('ом', ''), ('ем', ''), ('ой', ''), ('ей', ''), ('у', ''), ('ю', ''),
+    ('а', ''), ('я', ''), ('о', ''), ('е', ''), ('ь', ''), ('ы', ''), ('и', '')
+]
+
+# Специальные преобразования множественного числа
+PLURAL_TRANSFORMS = {
+    'засылы': 'засыл',
+    'засылов': 'засыл',
+    'излишки': 'излиш',
+    'излишков': 'излиш',
+    'дубли': 'дубл',
+    'дублей': 'дубл',
+    'повреждения': 'поврежд',
+    'расхождения': 'расхожд',
+    'недовозы': 'недовоз',
+    'отправки': 'отправк',
+    'перевозки': 'перевоз',
+    'товары': 'товар',
+    'товаров': 'товар',
+    'упаковки': 'упаковк',
+    'наклейки': 'наклейк',
+    'накладные': 'накладн',
+    'возвраты': 'возврат',
+    'селлера': 'селлер',
+    'селлеры': 'селлер',
+    'коробки': 'коробк',
+    'ящики': 'ящик',
+    'ячейки': 'ячейк',
+    'процессы': 'процесс',
+    'процессов': 'процесс',
+    'заказы': 'заказ',
+    'заказов': 'заказ',
+    'клиенты': 'клиент',
+    'клиентов': 'клиент',
+    'водители': 'водитель',
+    'водителей': 'водитель',
+    'перевозки': 'перевозк',
+    'перевозок': 'перевозк',
+    'отправления': 'отправлен',
+    'отправлений': 'отправлен'
+}
+
+# Специальные случаи основ (синонимы и сокращения вынесены в data/synonyms.json)
+SPECIAL_CASES = {
+    'излишки': ['излиш', 'излишек', 'излишк'],
+    'излишек': ['излиш', 'излишек', 'излишк'],
+    'расхождение': ['расхожд', 'расхожден'],
+    'расхождения': ['расхожд', 'расхожден'],
+    'повреждение': ['поврежден', 'поврежд'],
+    'повреждения': ['поврежден', 'поврежд'],
+    'зафиксировать': ['зафиксир', 'фиксир'],
+    'значительный': ['значительн', 'значим'],
+    'значительные': ['значительн', 'значим'],
+    'недовоз': ['недовоз', 'недов'],
+    'недовоза': ['недовоз', 'недов'],
+    'недовозы': ['недовоз', 'недов'],
+    'прием': ['прием', 'приём', 'принима'],
+    'приём': ['прием', 'приём', 'принима'],
+    'пустой': ['пуст', 'пусто'],
+    'пустая': ['пуст', 'пусто'],
+    'пустые': ['пуст', 'пусто'],
+    'упаковка': ['упаковк', 'упаков'],
+    'упаковки': ['упаковк', 'упаков'],
+    'упаковку': ['упаковк', 'упаков'],
+    'селлер': ['селлер', 'селер'],
+    'селлера': ['селлер', 'селер'],
+    'селлеры': ['селлер', 'селер'],
+    'перевозка': ['перевоз', 'перевозк'],
+    'перевозки': ['перевоз', 'перевозк'],
+    'размещение': ['размещен', 'размещ'],
+    'проверка': ['провер', 'проверк'],
+    'целостности': ['целост', 'целостн'],
+    'товара': ['товар'],
+    'товары': ['товар'],
+    'товаров': ['товар'],
+    'засыл': ['засыл'],
+    'засыла': ['засыл'],
+    'засылы': ['засыл'],
+    'дубль': ['дубл'],
+    'дубли': ['дубл'],
+    'оформление': ['оформлен', 'оформ'],
+    'оформить': ['оформ', 'оформлен'],
+    'приёмка': ['приемк', 'приёмк'],
+    'выдача': ['выдач', 'выда'],
+    'выдать': ['выдач', 'выда'],
+    'выдают': ['выдач', 'выда'],
+    'выдаче': ['выдач', 'выда'],
+    'выдач': ['выдач', 'выда'],
+    'экземпляр': ['экземпляр'],
+    'экземпляров': ['экземпляр'],
+    'экземпляры': ['экземпляр'],
+    'экземпляра': ['экземпляр'],
+    'возврат': ['возврат'],
+    'возвраты': ['возврат'],
+    'отправка': ['отправк'],
+    'отправки': ['отправк'],
+    'транспорт': ['транспорт'],
+    'накладная': ['накладн'],
+    'накладные': ['накладн'],
+}
+
+PLURAL_TRANSFORM_VALUES = frozenset(PLURAL_TRANSFORMS.values())
+
+
+class Stemmer(ABC):
+    """Базовый интерфейс стеммера: слово -> кортеж основ для поиска.
+
+    Результат кэшируется по слову, поэтому повторные запросы не пересчитывают
+    основы. Слово передается уже нормализованным (нижний регистр, ё -> е).
+    """
+
+    name = 'base'
+
+    def __init__(self, cache_size: int = STEM_CACHE_SIZE):
+        self._preloaded: Dict[str, Tuple[str, ...]] = {}
+        self.stems = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, word: str) -> Tuple[str, ...]:
+        stems = self._preloaded.get(word)
+        return stems if stems is not None else self._stems(word)
+
+    @abstractmethod
+    def _stems(self, word: str) -> Tuple[str, ...]:
+        """Основы слова без кэша; реализуется в каждом стеммере"""
+
+    def preload(self, table: Dict[str, Tuple[str, ...]]):
+        """Подключает заранее посчитанные основы слов (из артефакта каталога).
+
+        Слова и основы интернируются: ключи совпадают по объекту со словами записей каталога.
+        """
+        self._preloaded = {sys.intern(word): tuple(sys.intern(stem) for stem in stems) for word, stems in table.items()}
+
+    def cache_info(self):
+        """Статистика кэша основ (попадания, промахи, размер)"""
+        return self.stems.cache_info()
+
+
+class HeuristicStemmer(Stemmer):
+    """Исходный эвристический стеммер: отбрасывание окончаний и ручные таблицы.
+
+    Дает много вариантов основ, в том числе слишком коротких, поэтому
+    используется как запасной режим, если Snowball недоступен.
+    """
+
+    name = 'heuristic'
+
+    def _stems(self, word: str) -> Tuple[str, ...]:
+        if len(word) < 2:
+            return (word,)
+        
+        stems = [word]
+        
+        # Базовые формы слова (убираем распространенные окончания)
+        base_forms = []
+        
+        # Проверяем специальные преобразования
+        if word in PLURAL_TRANSFORMS:
+            stems.append(PLURAL_TRANSFORMS[word])
+        
+        # Применяем правила окончаний
+        for ending, replacement in PLURAL_ENDINGS:
+            if word.endswith(ending) and len(word) > len(ending) + 1:
+                base = word[:-len(ending)] + replacement
+                if len(base) >= 2:  # Проверяем, что основа не слишком короткая
+                    base_forms.append(base)
+        
+        # Для существительных мужского рода с окончанием на согласную
+        if len(word) > 2 and word[-1] not in 'аеёиоуыэюя':
+            # Добавляем возможные формы с разными окончаниями
+            possible_endings = ['а', 'у', 'ом', 'е', 'ы', 'ов', 'ам', 'ами', 'ах']
+            for ending in possible_endings:
+                if word + ending in PLURAL_TRANSFORM_VALUES:
+                    stems.append(word + ending)
+        
+        # Для существительных женского рода с окончанием на а/я
+        if word.endswith(('а', 'я')) and len(word) > 2:
+            base = word[:-1]
+            stems.extend([base + 'а', base + 'у', base + 'ой', base + 'е', base + 'ы', base + '', base + 'ам', base + 'ами', base + 'ах'])
+        
+        # Добавляем специальные случаи
+        if word in SPECIAL_CASES:
+            stems.extend(SPECIAL_CASES[word])
+        
+        # Добавляем базовые формы
+        stems.extend(base_forms)
+        
+        # Убираем дубликаты и слишком короткие стеммы
+        return tuple(sorted(set(stem for stem in stems if len(stem) >= 2)))
+
+
+class SnowballStemmer(Stemmer):
+    """Стеммер на основе русского алгоритма Snowball.
+
+    Возвращает само слово, его основу по Snowball и ручные специальные случаи
+    из SPECIAL_CASES. Основы короче MIN_STEM_LENGTH отбрасываются, так как
+    при поиске по подстроке они совпадают почти со всеми процессами.
+    """
+
+    name = 'snowball'
+    MIN_STEM_LENGTH = 3
+
+    def __init__(self, cache_size: int = STEM_CACHE_SIZE):
+        if snowballstemmer is None:
+            raise RuntimeError("Библиотека snowballstemmer не установлена")
+        self._snowball = snowballstemmer.stemmer('russian')
+        super().__init__(cache_size)
+
+    def _stems(self, word: str) -> Tuple[str, ...]:
+        if len(word) < 2:
+            return (word,)
+        
+        stems = {word}
+        
+        stem = self._snowball.stemWord(word)
+        if len(stem) >= self.MIN_STEM_LENGTH:
+            stems.add(stem)
+        
+        if word in SPECIAL_CASES:
+            stems.update(SPECIAL_CASES[word])
+        
+        return tuple(sorted(stems))
+
+
+STEMMERS = {
+    HeuristicStemmer.name: HeuristicStemmer,
+    SnowballStemmer.name: SnowballStemmer,
+}
+
+
+def create_stemmer(backend: str = STEMMER_BACKEND) -> Stemmer:
+    """Создает стеммер по имени; при недоступности Snowball откатывается на эвристику"""
+    stemmer_class = STEMMERS.get(backend)
+    if stemmer_class is None:
+        print(f"⚠️ Неизвестный стеммер '{backend}', используется эвристический")
+        stemmer_class = HeuristicStemmer
+    
+    try:
+        return stemmer_class()
+    except RuntimeError as e:
+        print(f"⚠️ {e}. Используется эвристический стеммер")
+        return HeuristicStemmer()
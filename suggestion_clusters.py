@@ -0,0 +1,96 @@
+import zlib
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from text_normalizer import tokenize
+from stemmer import Stemmer
+
+# Служебные слова и типовые обороты просьб, которые не отличают одно пожелание от другого
+STOPWORDS = frozenset([
+    'и', 'в', 'во', 'на', 'по', 'с', 'со', 'к', 'ко', 'о', 'об', 'от', 'до', 'для', 'из', 'за', 'у', 'при',
+    'а', 'но', 'или', 'что', 'чтобы', 'как', 'это', 'этот', 'эта', 'эти', 'так', 'же', 'ли', 'бы', 'не', 'ни',
+    'нет', 'есть', 'мне', 'нам', 'вы', 'мы', 'я', 'он', 'она', 'они', 'его', 'ее', 'их', 'все', 'всех',
+    'очень', 'еще', 'уже', 'тоже', 'также', 'там', 'тут', 'здесь', 'где', 'когда',
+    'пожалуйста', 'прошу', 'просим', 'хочу', 'хотим', 'хотелось', 'нужно', 'надо', 'нужен', 'нужна',
+    'добавьте', 'добавить', 'добавили', 'сделайте', 'сделать', 'можно',
+])
+
+# Параметры MinHash/LSH: 16 полос по 2 строки дают высокую полноту для сходства от 0.5
+NUM_PERMUTATIONS = 32
+BAND_ROWS = 2
+SIMILARITY_THRESHOLD = 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (zlib.crc32(f"a{i}".encode()) | 1, zlib.crc32(f"b{i}".encode()))
+    for i in range(NUM_PERMUTATIONS)
+]
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    """Коэффициент Жаккара двух множеств признаков"""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class SuggestionClusterIndex:
+    """Индекс похожих пожеланий на MinHash с LSH-корзинами.
+
+    Признаки пожелания - основы значимых слов ("добавьте процесс возврата" и
+    "нет процесса по возвратам" дают одинаковые основы процесс/возврат).
+    Кандидаты на кластер берутся из LSH-корзин, а окончательно сходство с
+    представителем кластера проверяется точным коэффициентом Жаккара.
+    """
+
+    def __init__(self, stemmer: Stemmer, threshold: float = SIMILARITY_THRESHOLD):
+        self.stemmer = stemmer
+        self.threshold = threshold
+        self._features: Dict[int, FrozenSet[str]] = {}
+        self._buckets: Dict[Tuple, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def features(self, text: str) -> FrozenSet[str]:
+        """Множество признаков пожелания: самые короткие основы значимых слов"""
+        result = set()
+        for word in tokenize(text):
+            if word in STOPWORDS or len(word) < 2:
+                continue
+            stems = [stem for stem in self.stemmer.stems(word) if len(stem) >= 3]
+            result.add(min(stems, key=len) if stems else word)
+        return frozenset(result)
+
+    def _signature(self, features: FrozenSet[str]) -> List[int]:
+        hashes = [zlib.crc32(feature.encode()) for feature in features]
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in _PERMUTATIONS
+        ]
+
+    def _band_keys(self, features: FrozenSet[str]) -> List[Tuple]:
+        if not features:
+            return [('empty',)]
+        signature = self._signature(features)
+        return [
+            (band,) + tuple(signature[band * BAND_ROWS:(band + 1) * BAND_ROWS])
+            for band in range(NUM_PERMUTATIONS // BAND_ROWS)
+        ]
+
+    def find(self, features: FrozenSet[str]) -> Optional[int]:
+        """Возвращает id самого похожего кластера или None, если похожих нет"""
+        candidates = set()
+        for key in self._band_keys(features):
+            candidates.update(self._buckets.get(key, ()))
+
+        best_id, best_score = None, self.threshold
+        for cluster_id in candidates:
+            score = jaccard(features, self._features[cluster_id])
+            if score >= best_score:
+                best_id, best_score = cluster_id, score
+        return best_id
+
+    def add(self, cluster_id: int, features: FrozenSet[str]):
+        """Регистрирует кластер с признаками его представителя"""
+        self._features[cluster_id] = features
+        for key in self._band_keys(features):
+            self._buckets.setdefault(key, set()).add(cluster_id)
@@ -0,0 +1,176 @@
+"""Перезапуск цикла бота после сбоев.
+
+Долгоживущие части процесса (база, сервер метрик, health server, keep-alive)
+запускаются один раз, а супервизор перезапускает только упавшую часть -
+цикл бота. Пауза перед перезапуском растет экспоненциально со случайной
+добавкой, чтобы не долбить Telegram при его сбое, и сбрасывается, если
+цикл проработал дольше healthy_after секунд. Если сбоев в скользящем окне
+больше бюджета, процесс считается зацикленным на падениях: /health начинает
+отвечать 503, а попытки продолжаются с максимальной паузой.
+"""
+import random
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+from metrics import registry
+
+STATE_STARTING = 'starting'
+STATE_RUNNING = 'running'
+STATE_BACKOFF = 'backoff'
+STATE_CRASH_LOOP = 'crash_loop'
+STATE_STOPPED = 'stopped'
+STATES = (STATE_STARTING, STATE_RUNNING, STATE_BACKOFF, STATE_CRASH_LOOP, STATE_STOPPED)
+
+restarts_total = registry.counter('bot_restarts_total', 'Перезапуски цикла бота по причинам', ['reason'])
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random = random) -> float:
+    """Пауза перед попыткой attempt (с 1): половина экспоненты гарантирована, вторая половина случайна"""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class CrashBudget:
+    """Скользящее окно сбоев: не больше max_crashes за window секунд"""
+
+    def __init__(self, max_crashes: int, window: float):
+        self.max_crashes = max_crashes
+        self.window = window
+        self._crashes: deque = deque()
+
+    def _expire(self, now: float):
+        while self._crashes and now - self._crashes[0] > self.window:
+            self._crashes.popleft()
+
+    def record(self, now: float) -> bool:
+        """Учитывает сбой; False, если бюджет окна исчерпан"""
+        self._crashes.append(now)
+        return not self.exhausted(now)
+
+    def exhausted(self, now: float) -> bool:
+        self._expire(now)
+        return len(self._crashes) > self.max_crashes
+
+    def count(self, now: float) -> int:
+        self._expire(now)
+        return len(self._crashes)
+
+
+class Supervisor:
+    """Запускает run_once, пока should_stop() не вернет True, перезапуская его после сбоев.
+
+    run_once - блокирующий вызов одного запуска (например, asyncio.run(...)).
+    Исключения из fatal не лечатся перезапуском (например, неверный токен) и
+    пробрасываются дальше.
+    """
+
+    def __init__(self, name: str, run_once: Callable[[], Any], should_stop: Callable[[], bool],
+                 base_delay: float = 1.0, max_delay: float = 60.0, max_crashes: int = 5, window: float = 600.0,
+                 healthy_after: float = 60.0, fatal: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.run_once = run_once
+        self.should_stop = should_stop
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.healthy_after = healthy_after
+        self.fatal = fatal
+        self.budget = CrashBudget(max_crashes, window)
+
+        self.state = STATE_STARTING
+        self.restarts = 0
+        self.last_reason: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_crash_at: Optional[float] = None
+        self.next_attempt_at: Optional[float] = None
+        self._attempt = 0
+        self._started_at: Optional[float] = None
+
+        registry.gauge_callback(
+            'bot_supervisor_state', 'Состояние супервизора цикла бота (1 - текущее)',
+            lambda: {(state,): int(state == self.state) for state in STATES}, ['state'])
+        registry.gauge_callback(
+            'bot_supervisor_crashes_in_window', 'Сбои цикла бота в окне бюджета',
+            lambda: {(): self.budget.count(time.monotonic())})
+
+    @property
+    def healthy(self) -> bool:
+        # Между сбоями цикл успевает ненадолго подняться, поэтому смотрим на окно, а не на состояние
+        return not self.budget.exhausted(time.monotonic())
+
+    def status(self) -> Dict[str, Any]:
+        """Состояние для health server"""
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'state': self.state,
+            'healthy': self.healthy,
+            'restarts': self.restarts,
+            'crashes_in_window': self.budget.count(now),
+            'crash_budget': self.budget.max_crashes,
+            'crash_window_seconds': self.budget.window,
+            'last_reason': self.last_reason,
+            'last_error': self.last_error,
+            'seconds_since_last_crash': round(now - self.last_crash_at, 1) if self.last_crash_at else None,
+            'next_attempt_in_seconds': round(max(0.0, self.next_attempt_at - now), 1) if self.next_attempt_at else None,
+            'uptime_seconds': round(now - self._started_at, 1) if self._started_at and self.state == STATE_RUNNING else None,
+        }
+
+    def run(self):
+        """Крутит run_once до запроса остановки"""
+        while True:
+            self.state = STATE_RUNNING
+            self.next_attempt_at = None
+            self._started_at = time.monotonic()
+            try:
+                self.run_once()
+                if self.should_stop():
+                    break
+                reason, error = 'exited', 'Цикл завершился без запроса остановки'
+            except KeyboardInterrupt:
+                break
+            except self.fatal as e:
+                self.state = STATE_STOPPED
+                print(f"🚨 {self.name}: неустранимая ошибка {type(e).__name__}: {e}")
+                raise
+            except Exception as e:
+                if self.should_stop():
+                    break
+                reason, error = type(e).__name__, str(e)
+                traceback.print_exc()
+
+            if not self._backoff(reason, error):
+                break
+
+        self.state = STATE_STOPPED
+        self.next_attempt_at = None
+
+    def _backoff(self, reason: str, error: str) -> bool:
+        """Учитывает сбой и ждет перед перезапуском; False, если за время ожидания пришел запрос остановки"""
+        now = time.monotonic()
+        # Долго проработавший запуск - не часть серии сбоев, пауза начинается заново
+        if now - self._started_at >= self.healthy_after:
+            self._attempt = 0
+        self._attempt += 1
+        self.restarts += 1
+        self.last_reason, self.last_error, self.last_crash_at = reason, error, now
+        restarts_total.inc(reason)
+
+        was_healthy = self.healthy
+        if self.budget.record(now):
+            self.state = STATE_BACKOFF
+            delay = backoff_delay(self._attempt, self.base_delay, self.max_delay)
+        else:
+            self.state = STATE_CRASH_LOOP
+            delay = self.max_delay
+            if was_healthy:
+                print(f"🚨 {self.name}: {self.budget.count(now)} сбоев за {self.budget.window:.0f} с - "
+                      f"больше бюджета {self.budget.max_crashes}, /health сообщает о проблеме")
+
+        self.next_attempt_at = now + delay
+        print(f"🔴 {self.name} упал ({reason}: {error}). Перезапуск #{self.restarts} через {delay:.1f} с")
+        try:
+            time.sleep(delay)
+        except KeyboardInterrupt:
+            return False
+        return not self.should_stop()
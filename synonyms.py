@@ -0,0 +1,91 @@
+import json
+import os
+from typing import Dict, List, Tuple
+from text_normalizer import tokenize
+
+
+class SynonymDictionary:
+    """Словарь синонимов и сокращений (КТЯ, ШК, ТТН, ПВЗ и т.д.)
+
+    Каждая группа сводится к одному каноническому термину. При построении
+    индекса канонический термин дописывается к тексту процесса, в котором
+    встретился любой вариант группы, а в запросе вариант заменяется на
+    канонический термин. Поэтому число стемм запроса не растет вместе со
+    словарем.
+    """
+
+    def __init__(self, groups: List[Dict] = None):
+        # Вариант (кортеж токенов) -> канонический термин
+        self._variants: Dict[Tuple[str, ...], str] = {}
+        self._max_length = 0
+
+        for group in groups or []:
+            canonical = ' '.join(tokenize(group.get('canonical', '')))
+            if not canonical:
+                continue
+            for variant in [group['canonical']] + group.get('variants', []):
+                variant_tokens = tuple(tokenize(variant))
+                if variant_tokens:
+                    self._variants[variant_tokens] = canonical
+                    self._max_length = max(self._max_length, len(variant_tokens))
+
+    @classmethod
+    def load(cls, path: str) -> 'SynonymDictionary':
+        """Загружает словарь из JSON-файла; если файла нет, возвращает пустой словарь"""
+        if not os.path.exists(path):
+            print(f"⚠️ Файл синонимов {path} не найден, поиск работает без синонимов")
+            return cls()
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except Exception as e:
+            print(f"❌ Ошибка при загрузке синонимов: {e}")
+            return cls()
+
+    def __len__(self) -> int:
+        return len(self._variants)
+
+    def _scan(self, tokens: List[str]):
+        """Находит варианты в списке токенов (самое длинное совпадение с каждой позиции)"""
+        i = 0
+        while i < len(tokens):
+            for length in range(min(self._max_length, len(tokens) - i), 0, -1):
+                canonical = self._variants.get(tuple(tokens[i:i + length]))
+                if canonical is not None:
+                    yield i, length, canonical
+                    i += length
+                    break
+            else:
+                i += 1
+
+    def rewrite_query(self, tokens: List[str]) -> List[str]:
+        """Заменяет варианты в токенах запроса на канонические термины"""
+        if not self._variants:
+            return tokens
+
+        result = []
+        position = 0
+        for start, length, canonical in self._scan(tokens):
+            result.extend(tokens[position:start])
+            if canonical not in result:
+                result.append(canonical)
+            position = start + length
+        result.extend(tokens[position:])
+        return result
+
+    def expand_document(self, text: str) -> str:
+        """Дописывает к нормализованному тексту канонические термины найденных групп"""
+        if not self._variants or not text:
+            return text
+
+        tokens = text.split()
+        present = set(tokens)
+        additions = []
+        for _, _, canonical in self._scan(tokens):
+            if canonical not in present and canonical not in additions:
+                additions.append(canonical)
+
+        if not additions:
+            return text
+        return f"{text} {' '.join(additions)}"
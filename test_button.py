@@ -7,11 +7,10 @@ for process_id in test_ids:
     process_data = db.get_process_by_id(process_id)
     if process_data:
         print(f"Процесс {process_id}:")
-        print(f"  Длина данных: {len(process_data)}")
         print(f"  Данные: {process_data}")
-        print(f"  process_id: {process_data[1]}")
-        print(f"  process_name: {process_data[2]}")
-        print(f"  description: {process_data[3][:50]}..." if len(process_data) > 3 else "Нет описания")
+        print(f"  process_id: {process_data.process_id}")
+        print(f"  process_name: {process_data.process_name}")
+        print(f"  description: {process_data.description[:50]}..." if process_data.description else "Нет описания")
         print()
     else:
         print(f"❌ Процесс {process_id} не найден")
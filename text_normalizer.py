@@ -0,0 +1,109 @@
+import re
+from typing import List, Optional
+
+# Все таблицы и регулярные выражения компилируются один раз при импорте модуля
+
+# Приведение к нижнему регистру делает str.lower(), здесь только ё -> е
+_YO_TABLE = str.maketrans({'ё': 'е', 'Ё': 'е'})
+
+# Латинские буквы, которые в нижнем регистре выглядят как кириллические
+_LATIN_LOOKALIKES = 'aceopxykmtbh'
+_CYRILLIC_LOOKALIKES = 'асеорхукмтвн'
+_LATIN_TO_CYRILLIC = str.maketrans(_LATIN_LOOKALIKES, _CYRILLIC_LOOKALIKES)
+_CYRILLIC_TO_LATIN = str.maketrans(_CYRILLIC_LOOKALIKES, _LATIN_LOOKALIKES)
+
+_CYRILLIC_RE = re.compile(r'[а-я]')
+_LATIN_RE = re.compile(r'[a-z]')
+
+# Слово, число или составной токен через дефис/точку: "штрих-код", "10-15", "b1.5"
+_TOKEN_RE = re.compile(r'[0-9a-zа-яё]+(?:[-.][0-9a-zа-яё]+)*', re.IGNORECASE)
+_PART_SPLIT_RE = re.compile(r'[-.]')
+
+# Числа через точку или дефис оставляем одним токеном: "1.5", "10-15"
+_NUMBER_RE = re.compile(r'^\d+(?:[-.]\d+)*$')
+
+# Код процесса после нормализации: b1, b1.5, b1.5.2
+_PROCESS_ID_RE = re.compile(r'^b\d+(?:\.\d+)*$')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def _fix_lookalikes(token: str) -> str:
+    """Приводит смешанный токен к одной письменности (пpием с латинской p -> прием)"""
+    has_cyrillic = _CYRILLIC_RE.search(token)
+    has_latin = _LATIN_RE.search(token)
+
+    if has_cyrillic and has_latin:
+        # Код процесса, набранный кириллицей (В1.5) или вперемешку
+        as_latin = token.translate(_CYRILLIC_TO_LATIN)
+        if _PROCESS_ID_RE.match(as_latin):
+            return as_latin
+
+        # Иначе приводим к письменности, которой в токене больше
+        cyrillic_count = len(_CYRILLIC_RE.findall(token))
+        latin_count = len(_LATIN_RE.findall(token))
+        if cyrillic_count >= latin_count:
+            return token.translate(_LATIN_TO_CYRILLIC)
+        return as_latin
+
+    if has_cyrillic and token[0] == 'в' and token[1:2].isdigit():
+        # Код процесса целиком набран кириллицей: в1.5
+        as_latin = token.translate(_CYRILLIC_TO_LATIN)
+        if _PROCESS_ID_RE.match(as_latin):
+            return as_latin
+
+    return token
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует текст: нижний регистр, ё -> е, без пунктуации, токены через пробел"""
+    return ' '.join(tokenize(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на нормализованные токены.
+
+    Пунктуация отбрасывается, похожие латинские и кириллические буквы
+    приводятся к одной письменности, коды процессов и числа через точку или
+    дефис остаются одним токеном. Составные слова через дефис ("штрих-код")
+    дают части и слитную форму, а дефис перед заглавной буквой
+    ("доставок-Подготовить") считается разделителем шагов процесса.
+    """
+    if not text:
+        return []
+
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        raw = match.group(0)
+        token = _fix_lookalikes(raw.lower().translate(_YO_TABLE))
+
+        if _NUMBER_RE.match(token) or _PROCESS_ID_RE.match(token):
+            tokens.append(token)
+            continue
+
+        parts = [part for part in _PART_SPLIT_RE.split(token) if part]
+        if len(parts) == 1:
+            tokens.append(token)
+            continue
+
+        tokens.extend(parts)
+
+        # Слитную форму добавляем только для настоящих составных слов через дефис
+        separators = _PART_SPLIT_RE.findall(raw)
+        is_compound = all(sep == '-' for sep in separators)
+        if is_compound:
+            positions = [m.end() for m in _PART_SPLIT_RE.finditer(raw)]
+            if not any(raw[pos:pos + 1].isupper() for pos in positions):
+                tokens.append(''.join(parts))
+
+    return tokens
+
+
+def normalize_process_id(text: str) -> Optional[str]:
+    """Возвращает код процесса в каноническом виде (B1.5) или None, если это не код"""
+    if not text:
+        return None
+
+    candidate = _SPACES_RE.sub('', text).strip('.,;:!?').lower().translate(_CYRILLIC_TO_LATIN)
+    if _PROCESS_ID_RE.match(candidate):
+        return candidate.upper()
+    return None
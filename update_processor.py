@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+    Ответы ждут лимитов Telegram прямо в await обработчика (корзина чата,
+    пауза после 429), поэтому при последовательной обработке один
+    притормозивший чат задерживал ответы всем остальным. Обновления разных
+    чатов обрабатываются параллельно, а обновления одного чата - строго по
+    очереди: например, текст пожелания не обгонит команду /suggestion.
+    """
+
+    __slots__ = ('_chat_locks',)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[int, List] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        # Замок чата и число обновлений, которые его держат или ждут
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            # Замок свободного чата больше не нужен, словарь не растет с числом пользователей
+            if not entry[1]:
+                self._chat_locks.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
@@ -0,0 +1,258 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+from database import db, Database
+
+# Элемент очереди, который будит фоновый поток при остановке (в базу не пишется)
+_WAKE = object()
+
+
+class BatchWriter:
+    """Фоновая запись пачками (write-behind).
+
+    Обработчики кладут элементы в очередь и сразу возвращаются, а фоновый
+    поток раз в flush_interval секунд (или при накоплении max_batch элементов)
+    передает накопленную пачку в flush_batch. Если flush_batch вернул False,
+    пачка остается в памяти и повторяется на следующем цикле.
+    """
+
+    def __init__(self, name: str, flush_batch: Callable[[List], bool], flush_interval: float = 2.0, max_batch: int = 100):
+        self.name = name
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: List = []
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Запускает фоновый поток записи (повторный вызов ничего не делает)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._before_start()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+            print(f"✅ Фоновая запись '{self.name}' запущена")
+
+    def _before_start(self):
+        """Вызывается перед первым запуском фонового потока"""
+        pass
+
+    def enqueue(self, item):
+        """Ставит элемент в очередь на запись, не дожидаясь записи"""
+        self._ensure_started()
+        self._queue.put(item)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+
+    def qsize(self) -> int:
+        """Количество элементов, ожидающих записи"""
+        return self._queue.qsize() + len(self._pending)
+
+    def _drain(self, limit: Optional[int] = None):
+        """Забирает из очереди все, что успело накопиться, не больше max_batch"""
+        limit = limit or self.max_batch
+        while len(self._pending) < limit:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _WAKE:
+                self._pending.append(item)
+
+    def flush(self) -> bool:
+        """Синхронно записывает все накопленные элементы"""
+        with self._flush_lock:
+            ok = True
+            while ok:
+                self._drain()
+                if not self._pending:
+                    break
+                ok = self._write_pending()
+            return ok
+
+    def _write_pending(self) -> bool:
+        try:
+            ok = self.flush_batch(self._pending)
+        except Exception as e:
+            print(f"❌ Ошибка фоновой записи '{self.name}': {e}")
+            ok = False
+        if ok:
+            self._pending = []
+        return ok
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                # Ждем первый элемент, затем даем пачке накопиться до конца интервала
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is _WAKE:
+                item = None
+            
+            with self._flush_lock:
+                if item is not None:
+                    self._pending.append(item)
+                if self._pending and len(self._pending) < self.max_batch:
+                    self._stop_event.wait(self.flush_interval)
+                self._drain()
+                if self._pending:
+                    self._write_pending()
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """Останавливает фоновый поток и записывает все, что осталось в очереди"""
+        self._stop_event.set()
+        # Поток может ждать первый элемент до flush_interval секунд
+        self._queue.put(_WAKE)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        ok = self.flush()
+        if self._pending:
+            print(f"⚠️ '{self.name}': не записано {len(self._pending)} элементов")
+        return ok
+
+
+class SuggestionWriter(BatchWriter):
+    """Отложенная запись пожеланий с журналом на диске.
+
+    Перед постановкой в очередь пожелание дописывается в небольшой журнал
+    (append-only JSONL). Перед записью пачки журнал ротируется, а после
+    успешного коммита удаляется. При запуске оставшиеся журналы
+    воспроизводятся, а повторы отсекаются по entry_id.
+
+    Гарантия: когда add() вернул управление (и пользователь получил
+    ответ), пожелание уже сброшено на диск через fsync и переживает не
+    только падение процесса, но и сбой или перезагрузку машины. Для этого
+    сбрасываются и файлы журнала, и каталог после создания, переименования
+    и слияния журналов; при слиянии исходный журнал удаляется только после
+    fsync файла .flushing.
+    """
+
+    def __init__(self, database: Database, journal_path: str = 'data/suggestions.journal', flush_interval: float = 2.0):
+        super().__init__('suggestions', self._save_batch, flush_interval)
+        self.database = database
+        self.journal_path = journal_path
+        self._flushing_path = journal_path + '.flushing'
+        self._journal_lock = threading.Lock()
+        self._journal_file = None
+
+    def _open_journal(self):
+        if self._journal_file is None:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            created = not os.path.exists(self.journal_path)
+            self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+            if created:
+                # Новый файл переживет сбой машины, только если сохранена и запись о нем в каталоге
+                self._fsync_dir()
+        return self._journal_file
+
+    def _fsync_dir(self):
+        """Сбрасывает на диск каталог журнала (создание, переименование и удаление файлов)"""
+        fd = os.open(os.path.dirname(os.path.abspath(self.journal_path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _before_start(self):
+        # Перед первым запуском записываем журналы, оставшиеся после сбоя
+        if self._thread is None:
+            self.replay_journal()
+
+    def replay_journal(self):
+        """Сохраняет в базу пожелания из журналов, не записанные до остановки процесса"""
+        with self._journal_lock:
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+            
+            for path in (self._flushing_path, self.journal_path):
+                if not os.path.exists(path):
+                    continue
+                
+                entries = []
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(tuple(json.loads(line)))
+                        except ValueError:
+                            # Последняя строка могла оборваться при падении
+                            continue
+                
+                if entries and not self.database.save_suggestions_batch(entries):
+                    print(f"❌ Не удалось воспроизвести журнал {path}")
+                    continue
+                
+                os.remove(path)
+                if entries:
+                    print(f"✅ Из журнала {path} восстановлено пожеланий: {len(entries)}")
+
+    def add(self, user_id: int, user_name: str, username: Optional[str], suggestion_text: str):
+        """Принимает пожелание: дописывает его в журнал и ставит в очередь на запись"""
+        entry = (
+            uuid.uuid4().hex,
+            user_id,
+            user_name,
+            username,
+            suggestion_text,
+            datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        )
+        
+        self._ensure_started()
+        with self._journal_lock:
+            journal = self._open_journal()
+            journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            journal.flush()
+            # add() блокируется на fsync, поэтому обработчики вызывают его через asyncio.to_thread
+            os.fsync(journal.fileno())
+            self._queue.put(entry)
+
+    def _save_batch(self, entries: List) -> bool:
+        # Ротируем журнал: новые пожелания пишутся в свежий файл, пока пачка сохраняется в базу
+        with self._journal_lock:
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+                if os.path.exists(self._flushing_path):
+                    # Предыдущая пачка не записалась: дописываем текущий журнал к ней
+                    with open(self.journal_path, 'r', encoding='utf-8') as src, open(self._flushing_path, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    # Журнал удаляется только после того, как его записи надежно лежат в .flushing
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self._flushing_path)
+                self._fsync_dir()
+            
+            # Все записанные в журнал элементы уже в очереди, забираем их в эту же пачку целиком
+            self._drain(limit=len(self._pending) + self._queue.qsize())
+            entries = self._pending
+        
+        if not self.database.save_suggestions_batch(entries):
+            return False
+        
+        if os.path.exists(self._flushing_path):
+            os.remove(self._flushing_path)
+        return True
+
+
+# Глобальный экземпляр отложенной записи пожеланий
+suggestion_writer = SuggestionWriter(db)
+
+# Записываем хвост очереди и при обычном завершении интерпретатора
+atexit.register(suggestion_writer.stop)